@@ -0,0 +1,269 @@
+# coding: utf-8
+"""
+Benchmarks do sigepy, executados sem acesso à rede contra um servidor SOAP local.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --quick --compare results.json
+
+O resultado é um JSON com os tempos por operação (mínimo, mediana, média e desvio, em segundos). Com
+``--compare`` os tempos são comparados com um resultado anterior e o comando termina com erro se algum
+benchmark ficou mais lento que ``--threshold``.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from suds.transport import NoCache  # noqa
+
+from sigep import labels, mock_server, plp, rastro, schema, templates  # noqa
+from sigep.correios_client import CorreiosSROClient  # noqa
+from sigep.sigep_client import Sigep  # noqa
+
+PLP_SIZES = (1, 10, 100, 1000, 10000)
+EVENT_SIZES = (1, 10, 100, 500)
+QUICK_PLP_SIZES = (1, 100)
+QUICK_EVENT_SIZES = (1, 100)
+
+SENDER_INFO = {
+    'name': 'Sigepy', 'street': 'Av Presidente Vargas', 'number': '1265', 'complement': 'Cj 401',
+    'neighborhood': 'Centro', 'zipcode': '14020273', 'city': u'Ribeirão Preto', 'state': 'SP', 'phone': '',
+    'fax': '', 'email': 'dev@stored.com.br',
+}
+
+CREDENTIALS = {
+    'contract': '0042', 'cnpj': '00000000000000', 'user': 'sigepy', 'password': 'sigepy@pass',
+    'origin_zipcode': '14020273', 'card': '0001', 'admin_code': '0001', 'regional_code': 60,
+    'sender_info': SENDER_INFO,
+}
+
+DESTINY = {'local': 'CTCE MACEIO', 'codigo': '57060971', 'cidade': 'MACEIO', 'bairro': 'TABULEIRO', 'uf': 'AL'}
+
+
+def make_objects(amount):
+    return [{
+        'tracking_code': labels.add_verification_digit('PC%08d BR' % number),
+        'service_code': '04162',
+        'weight': '300',
+        'receiver_name': u'João da Silva',
+        'receiver_home_phone': '1122223333',
+        'receiver_mobile_phone': '',
+        'receiver_email': 'joao@stored.com',
+        'receiver_address': 'Rua Galileu Galilei',
+        'receiver_complement': '',
+        'receiver_number': '1067',
+        'receiver_neighborhood': u'Jardim Irajá',
+        'receiver_city': 'Passos',
+        'receiver_state': 'MG',
+        'receiver_zip_code': '37902000',
+        'nfe_number': '332323',
+        'is_insurance': True,
+        'total': '300',
+        'dimension_height': '15',
+        'dimension_width': '15',
+        'dimension_length': '20',
+        'dimension_diameter': '5',
+    } for number in range(1, amount + 1)]
+
+
+def measure(function, repeat, min_time=0.2):
+    """
+    Executa ``function`` em ``repeat`` rodadas, cada uma com chamadas suficientes para durar ``min_time``.
+    As execuções usadas para calibrar a quantidade de chamadas servem de aquecimento e não entram nos tempos
+
+    :return: dicionário com os tempos por chamada, em segundos
+    """
+    number = 1
+    while True:
+        start = time.time()
+        for _ in range(number):
+            function()
+        elapsed = time.time() - start
+        if elapsed >= min_time or number >= 1000:
+            break
+        number *= 10
+
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.time()
+            for _ in range(number):
+                function()
+            timings.append((time.time() - start) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    timings.sort()
+    mean = sum(timings) / len(timings)
+    return {
+        'number': number,
+        'repeat': len(timings),
+        'min': timings[0],
+        'median': timings[len(timings) // 2],
+        'mean': mean,
+        'stdev': (sum((value - mean) ** 2 for value in timings) / len(timings)) ** 0.5,
+    }
+
+
+class Suite(object):
+    def __init__(self, server, quick=False, repeat=5):
+        self.server = server
+        self.plp_sizes = QUICK_PLP_SIZES if quick else PLP_SIZES
+        self.event_sizes = QUICK_EVENT_SIZES if quick else EVENT_SIZES
+        self.repeat = repeat
+
+    def sigep(self, **kwargs):
+        return Sigep(url=self.server.sigep_wsdl_url, **dict(CREDENTIALS, **kwargs))
+
+    def sro(self, **kwargs):
+        return CorreiosSROClient('sigepy', 'sigepy@pass', url=self.server.rastro_wsdl_url, **kwargs)
+
+    def rastro_response(self, tracking_code, events):
+        """
+        Cadastra ``events`` eventos para o objeto no servidor simulado
+
+        :return: resposta do buscaEventos em bytes
+        """
+        correios = self.server.correios
+        correios.events.pop(tracking_code, None)
+        for _ in range(events):
+            correios.add_event(tracking_code, destiny=DESTINY)
+        returns = correios.op_buscaEventos({'objetos': [tracking_code], 'resultado': ['T']})
+        return mock_server.build_response(rastro.NAMESPACE, 'buscaEventos', returns)
+
+    def benchmarks(self):
+        header = {
+            'card': '0001', 'contract': '0042', 'regional_code': 60, 'admin_code': '0001',
+            'sender_info': SENDER_INFO,
+        }
+        template_client = self.sigep(template=os.path.join(templates.BASE_DIR, templates.PLP_TEMPLATE))
+        client = self.sigep()
+
+        for size in self.plp_sizes:
+            objects = make_objects(size)
+            xml, _ = plp.build_plp(object_list=objects, **header)
+            yield 'plp.render', {'objects': size}, lambda: plp.build_plp(object_list=objects, **header)
+            yield 'plp.render_minify_jinja', {'objects': size}, lambda: template_client._render_plp(objects)
+            yield 'plp.validate', {'objects': size}, lambda: schema.validate(xml)
+            if size <= 1000:
+                yield 'sigep.create_plp', {'objects': size}, lambda: client.create_plp('1', objects)
+
+        sro = self.sro()
+        fast_sro = self.sro(fast_parse=True)
+        for events in self.event_sizes:
+            body = self.rastro_response('PC000000016BR', events)
+            yield 'rastro.parse_response', {'events': events}, lambda: rastro.parse_response(body)
+            yield 'rastro.iter_response', {'events': events}, lambda: list(rastro.iter_response(body))
+            yield 'sro.find_by_tracking_code', {'events': events}, lambda: sro.find_by_tracking_code('PC000000016BR')
+            yield 'sro.find_by_tracking_code_fast', {'events': events}, \
+                lambda: fast_sro.find_by_tracking_code('PC000000016BR')
+
+        codes = ['PC%08d BR' % number for number in range(10000)]
+        yield 'labels.add_verification_digits', {'labels': len(codes)}, \
+            lambda: labels.add_verification_digits(codes)
+        yield 'labels.expand_range', {'labels': 10000}, \
+            lambda: list(labels.expand_range('PC00000000 BR', 'PC00009999 BR'))
+
+        yield 'client.sigep_snapshot', {}, lambda: Sigep(wsdl_snapshot=True, **CREDENTIALS)
+        yield 'client.sigep_http', {}, lambda: self.sigep(wsdl_cache=NoCache())
+        yield 'client.sro_snapshot', {}, lambda: CorreiosSROClient('sigepy', 'sigepy@pass', wsdl_snapshot=True)
+        yield 'client.sro_http', {}, lambda: self.sro(wsdl_cache=NoCache())
+
+    def run(self, selected=None):
+        results = []
+        for name, params, function in self.benchmarks():
+            if selected and not any(name.startswith(prefix) for prefix in selected):
+                continue
+            result = measure(function, self.repeat)
+            result.update(name=name, params=params)
+            results.append(result)
+            sys.stderr.write('%-40s %-18s %12.6fs\n' % (name, json.dumps(params, sort_keys=True), result['median']))
+        return results
+
+
+def version():
+    with open(os.path.join(ROOT, 'setup.py')) as fp:
+        match = re.search(r'^VERSION = \(([\d, ]+)\)', fp.read(), re.M)
+    return '.'.join(part.strip() for part in match.group(1).split(',')) if match else None
+
+
+def result_key(result):
+    return '%s %s' % (result['name'], json.dumps(result['params'], sort_keys=True))
+
+
+def compare(baseline, results, threshold):
+    """
+    :return: lista de (benchmark, mediana anterior, mediana atual, razão) dos benchmarks mais lentos que
+        ``threshold`` vezes o anterior
+    """
+    previous = dict((result_key(result), result) for result in baseline['results'])
+    regressions = []
+    for result in results:
+        old = previous.get(result_key(result))
+        if old is None:
+            continue
+        ratio = result['median'] / old['median'] if old['median'] else 0
+        sys.stderr.write('%-60s %8.2fx\n' % (result_key(result), ratio))
+        if ratio > threshold:
+            regressions.append((result_key(result), old['median'], result['median'], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='arquivo JSON com o resultado, por padrão a saída padrão')
+    parser.add_argument('--quick', action='store_true', help='executa apenas os tamanhos menores')
+    parser.add_argument('--repeat', type=int, default=5, help='quantidade de rodadas por benchmark')
+    parser.add_argument('--compare', help='resultado anterior para comparação')
+    parser.add_argument('--threshold', type=float, default=1.2, help='razão máxima aceita na comparação')
+    parser.add_argument('benchmarks', nargs='*', help='prefixos dos benchmarks a executar, ex: plp rastro')
+    args = parser.parse_args(argv)
+
+    import suds
+    from lxml import etree
+
+    # sem validação das etiquetas, para que a mesma PLP possa ser fechada repetidamente
+    with mock_server.MockServer(mock_server.MockCorreios(strict=False)) as server:
+        results = Suite(server, quick=args.quick, repeat=args.repeat).run(args.benchmarks)
+
+    data = {
+        'meta': {
+            'sigepy': version(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'lxml': etree.__version__,
+            'suds': suds.__version__,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'results': results,
+    }
+
+    output = json.dumps(data, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(output)
+    else:
+        sys.stdout.write(output + '\n')
+
+    if args.compare:
+        with open(args.compare) as fp:
+            regressions = compare(json.load(fp), results, args.threshold)
+        for key, old, new, ratio in regressions:
+            sys.stderr.write('regression: %s %.6fs -> %.6fs (%.2fx)\n' % (key, old, new, ratio))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
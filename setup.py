@@ -1,6 +1,9 @@
 # coding: utf-8
 import os
+import sys
+
 from setuptools import setup
+from setuptools.command.build_py import build_py
 
 
 def read_file(fname):
@@ -11,6 +14,18 @@ __version__ = VERSION
 __versionstr__ = '.'.join(map(str, VERSION))
 
 
+class BuildPy(build_py):
+    """
+    O sigep.aio usa async/await e geradores assíncronos e só é instalado no Python >= 3.6, nas versões
+    anteriores a compilação falharia
+    """
+
+    def build_module(self, module, module_file, package):
+        if sys.version_info < (3, 6) and package in ('sigep', ['sigep']) and module == 'aio':
+            return None
+        return build_py.build_module(self, module, module_file, package)
+
+
 setup(
     name="sigepy",
     version=__versionstr__,
@@ -21,6 +36,7 @@ setup(
     keywords="correios sigep",
     url="https://github.com/stored/sigepy",
     packages=['sigep', ],
+    package_data={'sigep': ['xml/*.xml', 'xml/*.xsd', 'xml/wsdl/*.wsdl', 'data/*.csv']},
     long_description=read_file('README.md'),
     classifiers=[
         "License :: OSI Approved :: Apache Software License",
@@ -28,13 +44,10 @@ setup(
         "Operating System :: OS Independent",
         "Programming Language :: Python",
         "Programming Language :: Python :: 2.7",
-        "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.2",
-        "Programming Language :: Python :: 3.3",
-        "Programming Language :: Python :: 3.4",
         "Programming Language :: Python :: Implementation :: CPython",
         "Programming Language :: Python :: Implementation :: PyPy",
     ],
     install_requires=[
         r for r in read_file('requirements.txt').split('\n') if r],
+    cmdclass={'build_py': BuildPy},
 )
\ No newline at end of file
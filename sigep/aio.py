@@ -0,0 +1,170 @@
+# coding: utf-8
+import asyncio
+import collections
+import ssl
+import urllib.parse
+
+from sigep import rastro
+
+CONCURRENCY = 10
+TIMEOUT = 30
+
+
+async def _read_body(reader, headers):
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip(), 16)
+            if size == 0:
+                await reader.readline()
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+    if 'content-length' in headers:
+        return await reader.readexactly(int(headers['content-length']))
+    return await reader.read()
+
+
+async def _read_status(reader):
+    line = await reader.readline()
+    parts = line.split(None, 2)
+    if not line:
+        raise rastro.RastroError('connection closed before the HTTP status line')
+    if len(parts) < 2 or not parts[0].startswith(b'HTTP/') or not parts[1].isdigit():
+        raise rastro.RastroError('invalid HTTP status line %r' % line)
+    return int(parts[1])
+
+
+async def post(url, body, headers=None, ssl_context=None):
+    """
+    Envia um POST HTTP/1.1 sem bloquear o loop
+
+    :return: tupla (status, corpo da resposta em bytes)
+    :raises: rastro.RastroError, se a conexão é fechada sem resposta ou a linha de status é inválida
+    """
+    parsed = urllib.parse.urlsplit(url)
+    secure = parsed.scheme == 'https'
+    port = parsed.port or (443 if secure else 80)
+    target = parsed.path or '/'
+    if parsed.query:
+        target = '%s?%s' % (target, parsed.query)
+    if secure and ssl_context is None:
+        ssl_context = ssl.create_default_context()
+
+    request_headers = collections.OrderedDict([
+        ('Host', parsed.netloc),
+        ('Content-Type', 'text/xml; charset=utf-8'),
+        ('SOAPAction', '""'),
+        ('Content-Length', str(len(body))),
+        ('Connection', 'close'),
+    ])
+    request_headers.update(headers or {})
+
+    reader, writer = await asyncio.open_connection(parsed.hostname, port, ssl=ssl_context if secure else None)
+    try:
+        lines = ['POST %s HTTP/1.1' % target] + ['%s: %s' % item for item in request_headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+        status = await _read_status(reader)
+        response_headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        return status, await _read_body(reader, response_headers)
+    finally:
+        writer.close()
+
+
+class AsyncCorreiosSROClient(object):
+    """
+    Cliente asyncio do serviço Rastro, com o mesmo formato de resultado do ``CorreiosSROClient``.
+
+    Cada chamada ao buscaEventos respeita o limite de ``concurrency`` chamadas simultâneas e o prazo de
+    ``timeout`` segundos, ao fim do qual levanta ``asyncio.TimeoutError``.
+    """
+    MAX_OBJECTS = rastro.MAX_OBJECTS
+
+    def __init__(self, affiliation_id, password, url=rastro.URL, concurrency=CONCURRENCY, timeout=TIMEOUT,
+                 ssl_context=None):
+        """
+        :param affiliation_id: Usuário do SRO
+        :param password: Senha do SRO
+        :param url: Endereço do serviço Rastro
+        :param concurrency: Quantidade máxima de chamadas simultâneas
+        :param timeout: Prazo em segundos de cada chamada
+        :param ssl_context: Contexto SSL para endereços https
+        """
+        self.affiliation_id = affiliation_id
+        self.password = password
+        self.url = url
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+        self.concurrency = concurrency
+        self._semaphore = None
+        self._loop = None
+
+    def _get_semaphore(self):
+        """
+        O semáforo é criado no loop em execução, na primeira chamada feita nele: o cliente pode ser criado fora
+        do loop e usado em loops diferentes, um de cada vez
+        """
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    async def _search(self, objects, search_type='L', last_result=False):
+        body = rastro.build_request(
+            self.affiliation_id, self.password, objects, search_type=search_type, last_result=last_result,
+        )
+        async with self._get_semaphore():
+            status, data = await asyncio.wait_for(post(self.url, body, ssl_context=self.ssl_context), self.timeout)
+        return rastro.parse_response(data, status)
+
+    async def find_by_tracking_code(self, tracking_code, last_result=False):
+        objects = await self._search(tracking_code, last_result=last_result)
+        return objects[0]
+
+    async def _search_chunk(self, chunk, last_result):
+        ordered = sorted(chunk)
+        if rastro.is_range(ordered):
+            chunk = ordered
+            objects = await self._search(ordered[0] + ordered[-1], search_type='F', last_result=last_result)
+        else:
+            objects = await self._search(''.join(chunk), last_result=last_result)
+
+        results = []
+        for index, result in enumerate(objects):
+            if not result['tracking_code'] and index < len(chunk):
+                result['tracking_code'] = chunk[index]
+            results.append((result['tracking_code'], result))
+        return results
+
+    async def iter_many(self, tracking_codes, last_result=False):
+        """
+        Consulta vários objetos, com até ``MAX_OBJECTS`` códigos por chamada e as chamadas em paralelo
+
+        :return: gerador assíncrono de tuplas (código, resultado), na ordem em que as chamadas terminam
+        """
+        tracking_codes = list(collections.OrderedDict.fromkeys(code.strip().upper() for code in tracking_codes))
+        tasks = [
+            self._search_chunk(tracking_codes[start:start + self.MAX_OBJECTS], last_result)
+            for start in range(0, len(tracking_codes), self.MAX_OBJECTS)
+        ]
+        for task in asyncio.as_completed(tasks):
+            for item in await task:
+                yield item
+
+    async def find_many(self, tracking_codes, last_result=False):
+        """
+        :return: dicionário {código: resultado no formato de ``find_by_tracking_code``}
+        """
+        results = {}
+        async for tracking_code, result in self.iter_many(tracking_codes, last_result=last_result):
+            results[tracking_code] = result
+        return results
@@ -0,0 +1,183 @@
+# coding: utf-8
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class LRUCache(object):
+    """
+    Cache em memória com limite de itens (LRU) e validade por item, seguro para uso entre threads
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires_at = self._data.pop(key)
+            except KeyError:
+                return default
+            if expires_at is not None and expires_at <= time.time():
+                return default
+            self._data[key] = (value, expires_at)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        :param ttl: Validade em segundos, None para não expirar
+        """
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires_at)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TTLCache(object):
+    """
+    Base dos caches de consultas aos serviços: resultados em memória (``LRUCache``), opcionalmente
+    compartilhados por um ``backend`` (ex: ``SQLiteCache``), com validade definida por :meth:`get_ttl`.
+
+    Os contadores ``hits`` e ``misses`` são atualizados sob lock, já que as consultas podem vir de várias
+    threads.
+    """
+    TTL = None
+    ERROR_TTL = None
+
+    def __init__(self, maxsize=10000, backend=None, ttl=TTL, error_ttl=ERROR_TTL):
+        """
+        :param maxsize: Quantidade máxima de resultados em memória
+        :param backend: Cache compartilhado opcional, ex: SQLiteCache
+        :param ttl: Validade em segundos dos resultados
+        :param error_ttl: Validade em segundos dos resultados com erro
+        """
+        self.memory = LRUCache(maxsize)
+        self.backend = backend
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get_ttl(self, value):
+        """
+        :return: validade em segundos de ``value``, None para não expirar
+        """
+        raise NotImplementedError
+
+    def dump(self, value):
+        """
+        Converte o resultado no valor gravado no ``backend``
+        """
+        return value
+
+    def load(self, value):
+        """
+        Converte o valor lido do ``backend`` no resultado
+        """
+        return value
+
+    def _get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                value = self.load(value)
+                self.memory.set(key, value, self.get_ttl(value))
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def _set(self, key, value):
+        ttl = self.get_ttl(value)
+        self.memory.set(key, value, ttl)
+        if self.backend is not None:
+            self.backend.set(key, self.dump(value), ttl)
+
+    def _delete(self, key):
+        self.memory.delete(key)
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+
+class SQLiteCache(object):
+    """
+    Cache em um arquivo SQLite, que pode ser compartilhado entre processos. Os valores são gravados em JSON.
+    """
+
+    def __init__(self, path, table='cache', timeout=30):
+        self.path = path
+        self.table = table
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)'.format(table)
+            )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def get(self, key, default=None):
+        row = self._connection().execute(
+            'SELECT value, expires_at FROM {} WHERE key = ?'.format(self.table), (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._connection() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO {} (key, value, expires_at) VALUES (?, ?, ?)'.format(self.table),
+                (key, json.dumps(value), expires_at),
+            )
+
+    def delete(self, key):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM {} WHERE key = ?'.format(self.table), (key,))
+
+    def clear(self):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM {}'.format(self.table))
+
+    def purge(self):
+        """
+        Remove os itens expirados
+        """
+        with self._connection() as connection:
+            connection.execute('DELETE FROM {} WHERE expires_at <= ?'.format(self.table), (time.time(),))
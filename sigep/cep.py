@@ -0,0 +1,197 @@
+# coding: utf-8
+"""
+Índice das faixas de CEP por UF, e opcionalmente por cidade, para conferir o CEP e a UF dos destinatários
+antes do envio da PLP.
+
+A tabela distribuída com o pacote (``data/cep_ranges.csv``) contém as faixas por UF. Outras tabelas no mesmo
+formato (``uf,start,end,city``), inclusive com faixas de cidades, podem ser carregadas com
+:meth:`CEPIndex.load`.
+"""
+import array
+import bisect
+import csv
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CEP_RANGES = 'data/cep_ranges.csv'
+
+
+# maior quantidade de prefixos na tabela direta de um _RangeIndex
+MAX_PREFIXES = 100000
+
+
+def _digits(zip_code):
+    """
+    :return: CEP com apenas os 8 dígitos, ou None se não é um CEP válido
+    """
+    if '-' in zip_code:
+        zip_code = zip_code.replace('-', '')
+    zip_code = zip_code.strip()
+    if len(zip_code) != 8 or not zip_code.isdigit():
+        return None
+    return zip_code
+
+
+class _RangeIndex(object):
+    """
+    Faixas sem sobreposição ordenadas pelo início, com os limites em arrays de inteiros e busca binária.
+
+    Quando todas as faixas começam e terminam em um prefixo inteiro (ex: as faixas por UF, que usam os três
+    primeiros dígitos), a busca é feita em uma tabela direta pelo prefixo, sem converter o CEP em inteiro.
+    """
+
+    def __init__(self, ranges):
+        ranges = sorted(ranges)
+        self.starts = array.array('i', [start for start, _, _ in ranges])
+        self.ends = array.array('i', [end for _, end, _ in ranges])
+        self.values = [value for _, _, value in ranges]
+        for index in range(1, len(ranges)):
+            if self.starts[index] <= self.ends[index - 1]:
+                raise ValueError('overlapping CEP ranges: %s and %s' % (ranges[index - 1], ranges[index]))
+        self.prefix_length, self.prefixes = self._build_prefixes(ranges)
+
+    def _build_prefixes(self, ranges):
+        for length in range(1, 9):
+            size = 10 ** (8 - length)
+            if all(start % size == 0 and (end + 1) % size == 0 for start, end, _ in ranges):
+                count = sum((end + 1 - start) // size for start, end, _ in ranges)
+                if count > MAX_PREFIXES:
+                    break
+                prefixes = {}
+                for start, end, value in ranges:
+                    for prefix in range(start // size, (end + 1) // size):
+                        prefixes['%0*d' % (length, prefix)] = value
+                return length, prefixes
+        return None, None
+
+    def __len__(self):
+        return len(self.values)
+
+    def find(self, digits):
+        """
+        :param digits: CEP com 8 dígitos
+        """
+        if self.prefixes is not None:
+            return self.prefixes.get(digits[:self.prefix_length])
+        number = int(digits)
+        index = bisect.bisect_right(self.starts, number) - 1
+        if index >= 0 and number <= self.ends[index]:
+            return self.values[index]
+        return None
+
+
+class CEPIndex(object):
+    """
+    Índice em memória das faixas de CEP, com busca binária::
+
+        index = CEPIndex.load()
+        index.lookup('01310-100')  # ('SP', None)
+        index.validate(object_list)
+
+    O índice também pode ser usado como ``zip_code_key`` do :class:`sigep.sigep_client.AvailabilityCache` e do
+    :class:`sigep.quote.QuoteEngine`, agrupando os CEPs pela faixa da cidade ou, sem ela, da UF.
+    """
+
+    def __init__(self, ranges):
+        """
+        :param ranges: iterável de tuplas (UF, início, fim, cidade ou None), com o início e o fim inteiros
+        """
+        ufs, cities = [], []
+        for uf, start, end, city in ranges:
+            if city:
+                cities.append((start, end, (uf, city)))
+            else:
+                ufs.append((start, end, uf))
+        self.ufs = _RangeIndex(ufs)
+        self.cities = _RangeIndex(cities)
+
+    @classmethod
+    def load(cls, path=CEP_RANGES):
+        """
+        :param path: CSV com as colunas ``uf``, ``start``, ``end`` e ``city``, absoluto ou relativo ao pacote
+        """
+        if not os.path.isabs(path):
+            path = os.path.join(BASE_DIR, path)
+        with open(path, 'rb') as fp:
+            return cls(
+                (row['uf'], int(row['start']), int(row['end']), row.get('city', '').decode('utf-8') or None)
+                for row in csv.DictReader(fp)
+            )
+
+    def lookup(self, zip_code):
+        """
+        :return: tupla (UF, cidade ou None), ou None se o CEP é inválido ou não pertence a nenhuma faixa
+        """
+        digits = _digits(zip_code)
+        if digits is None:
+            return None
+        city = self.cities.find(digits)
+        if city is not None:
+            return city
+        uf = self.ufs.find(digits)
+        return (uf, None) if uf is not None else None
+
+    def uf(self, zip_code):
+        digits = _digits(zip_code)
+        return self.ufs.find(digits) if digits is not None else None
+
+    def __call__(self, zip_code):
+        """
+        Chave de agrupamento do CEP nos caches de disponibilidade e de preços, ex: ``SP`` ou ``SP:Campinas``.
+        CEPs fora das faixas conhecidas não são agrupados.
+        """
+        found = self.lookup(zip_code)
+        if found is None:
+            return zip_code
+        uf, city = found
+        return u'%s:%s' % (uf, city) if city else uf
+
+    def validate(self, object_list, zip_code_field='receiver_zip_code', state_field='receiver_state'):
+        """
+        Confere o CEP e a UF dos destinatários
+
+        :param object_list: iterável com os dicionários dos objetos, como os de ``Sigep.create_plp``
+        :return: lista de relatórios dos objetos inconsistentes, no formato de
+            :meth:`sigep.validator.ObjectValidator.validate_many`
+        """
+        find = self.ufs.find
+        reports = []
+        for index, item in enumerate(object_list):
+            zip_code = item.get(zip_code_field) or ''
+            digits = _digits(zip_code)
+            if digits is None:
+                error = u'invalid CEP %r' % zip_code
+            else:
+                uf = find(digits)
+                state = (item.get(state_field) or '').strip().upper()
+                if uf is None:
+                    error = u'CEP %s is not in any known range' % zip_code
+                elif uf != state:
+                    error = u'CEP %s belongs to %s, not %s' % (zip_code, uf, state)
+                else:
+                    continue
+            reports.append({
+                'index': index, 'tracking_code': item.get('tracking_code'), 'errors': {zip_code_field: error},
+            })
+        return reports
+
+
+_index = None
+
+
+def get_index():
+    """
+    :return: CEPIndex da tabela distribuída com o pacote, carregado uma única vez por processo
+    """
+    global _index
+    if _index is None:
+        _index = CEPIndex.load()
+    return _index
+
+
+def lookup(zip_code):
+    return get_index().lookup(zip_code)
+
+
+def validate(object_list, zip_code_field='receiver_zip_code', state_field='receiver_state'):
+    return get_index().validate(object_list, zip_code_field, state_field)
@@ -1,5 +1,11 @@
 # coding: utf-8
+import collections
+
 from suds.client import Client
+from suds.transport import Request, TransportError
+
+from sigep import metrics, rastro, records, wsdl
+from sigep.cache import TTLCache
 
 
 class CorreiosSROClient(object):
@@ -18,28 +24,112 @@ class CorreiosSROClient(object):
         101 - Os eventos serão retornados no idioma portugues
         102 - Os eventos serão retornados no idioma ingles
     """
+    MAX_OBJECTS = rastro.MAX_OBJECTS
+    RASTRO_URL = 'https://webservice.correios.com.br/service/rastro/Rastro.wsdl'
 
-    def __init__(self, affiliation_id, password, url='https://webservice.correios.com.br/service/rastro/Rastro.wsdl'):
-        self.client = Client(url)
+    def __init__(self, affiliation_id, password, url=RASTRO_URL,
+                 wsdl_snapshot=False, wsdl_cache=None, transport=None, fast_parse=False, as_records=False,
+                 instrumentation=None, resilience=None, client=None):
+        """
+        :param affiliation_id: Usuário do SRO
+        :param password: Senha do SRO
+        :param url: URL do WSDL do Rastro
+        :param wsdl_snapshot: Usa o WSDL distribuído com o pacote em vez de baixá-lo dos correios
+        :param wsdl_cache: Cache dos documentos WSDL/XSD, veja :func:`sigep.wsdl.file_cache`
+        :param transport: Transporte do suds, ex: :class:`sigep.transport.PooledTransport`
+        :param fast_parse: Lê a resposta do buscaEventos diretamente com o lxml, sem passar pelos objetos do
+            suds, veja :func:`sigep.rastro.iter_response`. Erros do serviço levantam ``RastroError`` em vez de
+            ``WebFault``
+        :param as_records: Retorna :class:`sigep.records.TrackedObject` em vez de dicionários, com menor uso de
+            memória. Os registros também podem ser lidos como dicionários e convertidos com ``to_dict()``
+        :param instrumentation: :class:`sigep.metrics.Instrumentation` com os ganchos chamados em cada operação
+        :param resilience: :class:`sigep.resilience.Policy` com prazo, novas tentativas e circuit breaker das
+            consultas
+        :param client: Cliente suds já criado com :meth:`build_client`, compartilhado entre instâncias. Nesse
+            caso ``url``, ``wsdl_snapshot``, ``wsdl_cache`` e ``transport`` são ignorados
+        """
+        self.client = client or self.build_client(url, wsdl_snapshot, wsdl_cache, transport, instrumentation)
         self.affiliation_id = affiliation_id
         self.password = password
+        self.fast_parse = fast_parse
+        self.as_records = as_records
+        self.instrumentation = instrumentation or metrics.Instrumentation()
+        self.resilience = resilience
 
-    def find_by_tracking_code(self, tracking_code, last_result=False):
-        if last_result:
-            result_type = 'U'
-        else:
-            result_type = 'T'
-
-        response = self.client.service.buscaEventos(
-            usuario=self.affiliation_id,
-            senha=self.password,
-            tipo='L',
-            lingua=101,
-            resultado=result_type,
-            objetos=tracking_code
-        )
-        objeto = response.objeto[0]
+    @classmethod
+    def build_client(cls, url, wsdl_snapshot=False, wsdl_cache=None, transport=None, instrumentation=None):
+        """
+        Cria o cliente suds do Rastro, que não guarda o usuário e a senha e pode ser compartilhado entre instâncias
+        """
+        options = {}
+        if wsdl_cache is not None:
+            options['cache'] = wsdl_cache
+        if instrumentation is not None:
+            transport = metrics.instrument_transport(transport, instrumentation)
+        if transport is not None:
+            options['transport'] = transport
+        return Client(wsdl.snapshot_url(wsdl.RASTRO_WSDL) if wsdl_snapshot else url, **options)
+
+    @property
+    def location(self):
+        return getattr(self.client.options, 'location', None) or self.client.wsdl.service.ports[0].location
+
+    def _call(self, function):
+        if self.resilience is None:
+            return function()
+        return self.resilience.call(self.location, 'buscaEventos', function)
+
+    def _search(self, objects, search_type='L', last_result=False):
+        def search():
+            with self.instrumentation.call('buscaEventos') as call:
+                with call.phase('parse'):
+                    return wsdl.thread_client(self.client).service.buscaEventos(
+                        usuario=self.affiliation_id,
+                        senha=self.password,
+                        tipo=search_type,
+                        lingua=101,
+                        resultado='U' if last_result else 'T',
+                        objetos=objects
+                    )
+        return getattr(self._call(search), 'objeto', [])
+
+    def _send_raw(self, request):
+        try:
+            return self.client.options.transport.send(request)
+        except TransportError as e:
+            # erros sem corpo (fp None) são levantados como recebidos
+            data = e.fp.read() if e.fp is not None else ''
+            if data:
+                rastro.parse_response(data, e.httpcode)
+            raise
+
+    def _search_raw(self, objects, search_type='L', last_result=False):
+        with self.instrumentation.call('buscaEventos') as call:
+            with call.phase('parse'):
+                request = Request(self.location, rastro.build_request(
+                    self.affiliation_id, self.password, objects, search_type=search_type, last_result=last_result,
+                ))
+                request.headers = {'Content-Type': 'text/xml; charset=utf-8', 'SOAPAction': '""'}
+                reply = self._call(self.instrumentation.bind(lambda: self._send_raw(request)))
+                objects = rastro.iter_response(reply.message)
+
+            # a leitura é incremental, a fase parse soma apenas o tempo de leitura de cada objeto
+            while True:
+                with call.phase('parse'):
+                    obj = next(objects, None)
+                if obj is None:
+                    break
+                yield obj
 
+    def _iter_objects(self, objects, search_type='L', last_result=False):
+        if self.fast_parse:
+            return self._search_raw(objects, search_type=search_type, last_result=last_result)
+        return (self._get_object(objeto) for objeto in self._search(objects, search_type, last_result))
+
+    def _result(self, result):
+        return records.TrackedObject.from_dict(result) if self.as_records else result
+
+    def _get_object(self, objeto):
         if hasattr(objeto, 'erro'):
             return {
                 'status': False,
@@ -57,6 +147,46 @@ class CorreiosSROClient(object):
             'current_status': self._get_current_status(objeto),
         }
 
+    def find_by_tracking_code(self, tracking_code, last_result=False):
+        return self._result(list(self._iter_objects(tracking_code, last_result=last_result))[0])
+
+    def iter_many(self, tracking_codes, last_result=False):
+        """
+        Consulta vários objetos, enviando até ``MAX_OBJECTS`` códigos por chamada ao buscaEventos. Os
+        resultados são retornados à medida que cada chamada termina.
+
+        :param tracking_codes: iterável com os códigos de rastreio
+        :param last_result: Retorna apenas o último evento de cada objeto
+        :return: gerador de tuplas (código, resultado no formato de ``find_by_tracking_code``)
+        """
+        tracking_codes = list(collections.OrderedDict.fromkeys(code.strip().upper() for code in tracking_codes))
+        for start in range(0, len(tracking_codes), self.MAX_OBJECTS):
+            chunk = tracking_codes[start:start + self.MAX_OBJECTS]
+            ordered = sorted(chunk)
+            if rastro.is_range(ordered):
+                chunk = ordered
+                objects = self._iter_objects(ordered[0] + ordered[-1], search_type='F', last_result=last_result)
+            else:
+                objects = self._iter_objects(''.join(chunk), last_result=last_result)
+
+            for index, result in enumerate(objects):
+                tracking_code = result['tracking_code']
+                if not tracking_code and index < len(chunk):
+                    # objetos com erro podem vir sem o número, na mesma ordem da consulta
+                    tracking_code = result['tracking_code'] = unicode(chunk[index])
+                yield tracking_code, self._result(result)
+
+    def find_many(self, tracking_codes, last_result=False):
+        """
+        Consulta vários objetos com o mínimo de chamadas ao serviço
+
+        :param tracking_codes: iterável com os códigos de rastreio
+        :param last_result: Retorna apenas o último evento de cada objeto
+        :return: dicionário {código: resultado no formato de ``find_by_tracking_code``}. Códigos não
+            retornados pelo serviço não aparecem no resultado
+        """
+        return dict(self.iter_many(tracking_codes, last_result=last_result))
+
     def _get_destiny(self, event):
         if hasattr(event, 'destino'):
             destiny = event.destino[0]
@@ -93,3 +223,85 @@ class CorreiosSROClient(object):
                 'destiny': self._get_destiny(event),
             })
         return event_list
+
+
+class TrackingCache(TTLCache):
+    """
+    Cache dos resultados do ``CorreiosSROClient``, com validade definida pelo último evento do objeto.
+
+    Objetos em situação final (entregues ou devolvidos) não mudam mais e ficam em cache por ``final_ttl``,
+    por padrão sem expirar. Objetos em trânsito ficam por ``ttl`` e consultas com erro por ``error_ttl``.
+    Opcionalmente um :class:`sigep.cache.SQLiteCache` compartilha os resultados entre processos.
+    """
+    TTL = 30 * 60
+    ERROR_TTL = 5 * 60
+    FINAL_TTL = None
+
+    # (tipo, status) dos eventos de entrega e devolução ao remetente
+    FINAL_EVENTS = frozenset(
+        (event_type, status) for event_type in ('BDE', 'BDI', 'BDR') for status in ('01', '23')
+    )
+
+    def __init__(self, client, maxsize=10000, backend=None, ttl=TTL, error_ttl=ERROR_TTL, final_ttl=FINAL_TTL):
+        """
+        :param client: CorreiosSROClient usado nas consultas
+        :param maxsize: Quantidade máxima de resultados em memória
+        :param backend: Cache compartilhado opcional, ex: SQLiteCache
+        :param ttl: Validade em segundos dos objetos em trânsito
+        :param error_ttl: Validade em segundos das consultas com erro
+        :param final_ttl: Validade em segundos dos objetos entregues ou devolvidos, None para não expirar
+        """
+        super(TrackingCache, self).__init__(maxsize, backend, ttl, error_ttl)
+        self.client = client
+        self.final_ttl = final_ttl
+
+    def _key(self, tracking_code, last_result):
+        return '%s:%s' % (tracking_code.strip().upper(), 'U' if last_result else 'T')
+
+    def get_ttl(self, result):
+        if not result['status']:
+            return self.error_ttl
+        if result['event_list']:
+            event = result['event_list'][0]
+            if (event['type'], event['status']) in self.FINAL_EVENTS:
+                return self.final_ttl
+        return self.ttl
+
+    def dump(self, result):
+        return result.to_dict() if isinstance(result, records.Record) else result
+
+    def load(self, result):
+        if getattr(self.client, 'as_records', False):
+            return records.TrackedObject.from_dict(result)
+        return result
+
+    def find_by_tracking_code(self, tracking_code, last_result=False):
+        key = self._key(tracking_code, last_result)
+        result = self._get(key)
+        if result is None:
+            result = self.client.find_by_tracking_code(tracking_code, last_result=last_result)
+            self._set(key, result)
+        return result
+
+    def find_many(self, tracking_codes, last_result=False):
+        """
+        Como ``CorreiosSROClient.find_many``, consultando o serviço apenas para os códigos fora do cache
+        """
+        results = {}
+        missing = []
+        for tracking_code in tracking_codes:
+            tracking_code = tracking_code.strip().upper()
+            result = self._get(self._key(tracking_code, last_result))
+            if result is None:
+                missing.append(tracking_code)
+            else:
+                results[tracking_code] = result
+
+        for tracking_code, result in self.client.iter_many(missing, last_result=last_result):
+            self._set(self._key(tracking_code, last_result), result)
+            results[tracking_code] = result
+        return results
+
+    def invalidate(self, tracking_code):
+        for last_result in (False, True):
+            self._delete(self._key(tracking_code, last_result))
@@ -0,0 +1,342 @@
+# coding: utf-8
+"""
+Histórico de eventos de rastreio em colunas, para relatórios de desempenho das entregas.
+
+Os resultados do :class:`sigep.correios_client.CorreiosSROClient` são acrescentados em arrays de inteiros e
+de números de ponto flutuante, um por campo, com os textos repetidos (tipo, status, unidade, cidade, UF)
+substituídos pelo índice em um dicionário. As consultas percorrem as colunas uma única vez, sem montar os
+dicionários de cada evento, e o histórico é gravado em um arquivo binário lido de volta sem interpretação
+dos valores.
+
+O pacote não depende do NumPy: as colunas usam o módulo ``array`` e as consultas são laços em Python, sem
+vetorização. O ganho em relação aos resultados originais está na memória e em evitar os dicionários, não
+em operações vetoriais.
+"""
+import array
+import calendar
+import collections
+import json
+import os
+import struct
+import sys
+import tempfile
+
+try:
+    from itertools import izip
+except ImportError:
+    izip = zip
+
+MAGIC = b'SIGEPEV1\n'
+
+# colunas dos eventos e dos objetos, com o typecode do array
+EVENT_COLUMNS = (
+    ('object', 'i'), ('type', 'i'), ('status', 'i'), ('time', 'd'),
+    ('local', 'i'), ('city', 'i'), ('uf', 'i'), ('description', 'i'),
+)
+OBJECT_COLUMNS = (('service', 'i'),)
+
+# colunas de texto codificadas em dicionários; ``code`` é o código de rastreio de cada objeto
+DICTIONARIES = ('code', 'service', 'type', 'status', 'local', 'city', 'uf', 'description')
+
+
+class _Dictionary(object):
+    """
+    Textos distintos de uma coluna, na ordem em que apareceram
+    """
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.index = dict((value, position) for position, value in enumerate(self.values))
+
+    def encode(self, value):
+        position = self.index.get(value)
+        if position is None:
+            position = self.index[value] = len(self.values)
+            self.values.append(value)
+        return position
+
+    def __len__(self):
+        return len(self.values)
+
+
+def _summary(values):
+    """
+    :param values: lista de durações em segundos
+    :return: dicionário com ``count``, ``mean``, ``min``, ``p50``, ``p90``, ``p99`` e ``max``
+    """
+    values = sorted(values)
+    count = len(values)
+
+    def percentile(q):
+        return values[min(count - 1, int(count * q / 100.0))]
+
+    return {
+        'count': count, 'mean': sum(values) / count, 'min': values[0],
+        'p50': percentile(50), 'p90': percentile(90), 'p99': percentile(99), 'max': values[-1],
+    }
+
+
+class EventStore(object):
+    """
+    Eventos de rastreio em colunas::
+
+        store = EventStore()
+        store.extend(client.find_many(tracking_codes))
+        store.delivery_times()     # {'PC': {'count': ..., 'p50': ..., ...}}, em segundos
+        store.save('eventos.bin')
+
+        store = EventStore.load('eventos.bin')
+
+    Um objeto pode ser acrescentado várias vezes, ex: a cada nova consulta ao rastreio; os eventos já
+    registrados, com a mesma data e hora, tipo, status e unidade, são ignorados. Como os Correios informam a
+    hora sem segundos, eventos diferentes no mesmo minuto são mantidos. Eventos sem data válida são
+    ignorados. As datas e horas são as informadas pelos Correios, sem fuso horário.
+    """
+    POSTING_TYPES = frozenset(['PO'])
+    # (tipo, status) dos eventos de entrega ao destinatário
+    DELIVERY_EVENTS = frozenset((event_type, '01') for event_type in ('BDE', 'BDI', 'BDR'))
+    # tipos de baixa em que os status diferentes de ``DELIVERY_EVENTS`` são exceções (ausente, recusado, ...)
+    EXCEPTION_TYPES = frozenset(['BDE', 'BDI', 'BDR'])
+
+    def __init__(self, service_key='sigla'):
+        """
+        :param service_key: chave do resultado do rastreio usada como serviço do objeto, ``sigla`` (ex: PC)
+            ou ``name``
+        """
+        self.service_key = service_key
+        self.dictionaries = dict((name, _Dictionary()) for name in DICTIONARIES)
+        self.columns = collections.OrderedDict(
+            (name, array.array(typecode)) for name, typecode in EVENT_COLUMNS + OBJECT_COLUMNS
+        )
+        self._days = {}
+        # {objeto: chaves dos eventos registrados}, montado a partir das colunas quando necessário
+        self._keys = {}
+
+    def __len__(self):
+        return len(self.columns['object'])
+
+    @property
+    def object_count(self):
+        return len(self.dictionaries['code'])
+
+    def _day(self, date):
+        day = self._days.get(date)
+        if day is None:
+            day = self._days[date] = calendar.timegm((int(date[6:10]), int(date[3:5]), int(date[0:2]), 0, 0, 0))
+        return day
+
+    def _timestamp(self, event):
+        if not isinstance(event, dict):
+            when = event.datetime
+            return calendar.timegm(when.timetuple()) if when is not None else None
+        hour = event['hour']
+        try:
+            return self._day(event['date']) + (int(hour[0:2]) * 3600 + int(hour[3:5]) * 60 if hour else 0)
+        except (TypeError, ValueError):
+            return None
+
+    def _event_keys(self):
+        """
+        :return: dicionário {objeto: conjunto de (hora, tipo, status, unidade) dos eventos registrados}
+        """
+        if self._keys is None:
+            keys = self._keys = collections.defaultdict(set)
+            columns = self.columns
+            for obj, timestamp, event_type, status, local in izip(
+                    columns['object'], columns['time'], columns['type'], columns['status'], columns['local']):
+                keys[obj].add((timestamp, event_type, status, local))
+        return self._keys
+
+    def append(self, result):
+        """
+        :param result: resultado de ``CorreiosSROClient.find_by_tracking_code``, dicionário ou
+            :class:`sigep.records.TrackedObject`. Objetos com erro são ignorados
+        :return: quantidade de eventos acrescentados
+        """
+        if not result['status']:
+            return 0
+        dictionaries, columns = self.dictionaries, self.columns
+        obj = dictionaries['code'].encode(result['tracking_code'])
+        if obj == len(columns['service']):
+            columns['service'].append(dictionaries['service'].encode(result[self.service_key]))
+
+        keys = self._event_keys().setdefault(obj, set())
+        types, statuses, locals_ = (dictionaries[name] for name in ('type', 'status', 'local'))
+        encoders = [(name, columns[name].append, dictionaries[name].encode) for name in ('city', 'uf', 'description')]
+        added = 0
+        for event in result['event_list']:
+            timestamp = self._timestamp(event)
+            if timestamp is None:
+                continue
+            key = (timestamp, types.encode(event['type']), statuses.encode(event['status']),
+                   locals_.encode(event['local']))
+            if key in keys:
+                continue
+            keys.add(key)
+            columns['object'].append(obj)
+            for name, value in zip(('time', 'type', 'status', 'local'), key):
+                columns[name].append(value)
+            for name, append, encode in encoders:
+                append(encode(event[name]))
+            added += 1
+        return added
+
+    def extend(self, results):
+        """
+        :param results: iterável de resultados, ou o dicionário retornado por ``CorreiosSROClient.find_many``
+        :return: quantidade de eventos acrescentados
+        """
+        if isinstance(results, dict):
+            results = results.values()
+        return sum(self.append(result) for result in results)
+
+    def _ids(self, name, values):
+        index = self.dictionaries[name].index
+        return frozenset(index[value] for value in values if value in index)
+
+    def _pairs(self, events):
+        types, statuses = self.dictionaries['type'].index, self.dictionaries['status'].index
+        return frozenset(
+            (types[event_type], statuses[status]) for event_type, status in events
+            if event_type in types and status in statuses
+        )
+
+    def _group_column(self, by):
+        """
+        :return: tupla (valores da coluna de agrupamento por evento, textos do dicionário)
+        """
+        if by == 'service':
+            services = self.columns['service']
+            return (services[obj] for obj in self.columns['object']), self.dictionaries['service'].values
+        if by not in ('type', 'status', 'local', 'city', 'uf'):
+            raise ValueError('cannot group events by %r' % by)
+        return self.columns[by], self.dictionaries[by].values
+
+    def delivery_times(self):
+        """
+        Tempo entre a postagem e a entrega de cada objeto entregue, por serviço
+
+        :return: dicionário {serviço: estatísticas em segundos, veja ``_summary``}
+        """
+        posting = self._ids('type', self.POSTING_TYPES)
+        delivery = self._pairs(self.DELIVERY_EVENTS)
+        posted, delivered = {}, {}
+        columns = self.columns
+        for obj, event_type, status, timestamp in izip(
+                columns['object'], columns['type'], columns['status'], columns['time']):
+            if event_type in posting:
+                if timestamp < posted.get(obj, float('inf')):
+                    posted[obj] = timestamp
+            elif (event_type, status) in delivery:
+                if timestamp < delivered.get(obj, float('inf')):
+                    delivered[obj] = timestamp
+
+        durations = collections.defaultdict(list)
+        services = columns['service']
+        for obj, timestamp in delivered.items():
+            if obj in posted:
+                durations[services[obj]].append(timestamp - posted[obj])
+        names = self.dictionaries['service'].values
+        return dict((names[service], _summary(values)) for service, values in durations.items())
+
+    def stuck_times(self, by='local', now=None):
+        """
+        Tempo de permanência dos objetos em cada unidade, entre um evento e o seguinte do mesmo objeto
+
+        :param by: coluna da unidade: ``local``, ``city`` ou ``uf``
+        :param now: datetime usado como fim da permanência no último evento dos objetos ainda não entregues.
+            Por padrão a permanência atual não é contada
+        :return: dicionário {unidade: estatísticas em segundos}
+        """
+        units, names = self._group_column(by)
+        units = array.array('i', units)
+        columns = self.columns
+        objects, times = columns['object'], columns['time']
+        order = sorted(range(len(objects)), key=lambda position: (objects[position], times[position]))
+        final = self._pairs(self.DELIVERY_EVENTS)
+        types, statuses = columns['type'], columns['status']
+        until = calendar.timegm(now.timetuple()) if now is not None else None
+
+        durations = collections.defaultdict(list)
+        for current, following in izip(order, order[1:] + [None]):
+            if following is not None and objects[following] == objects[current]:
+                durations[units[current]].append(times[following] - times[current])
+            elif until is not None and (types[current], statuses[current]) not in final:
+                durations[units[current]].append(until - times[current])
+        return dict((names[unit], _summary(values)) for unit, values in durations.items())
+
+    def exception_rates(self, by='service'):
+        """
+        Proporção dos objetos com eventos de exceção: baixas dos tipos ``EXCEPTION_TYPES`` que não são entregas
+
+        :param by: ``service``, ou coluna dos eventos (``local``, ``city``, ``uf``). Por coluna, os objetos
+            são contados em cada unidade por onde passaram e as exceções na unidade em que ocorreram
+        :return: dicionário {grupo: {'objects': quantidade, 'exceptions': objetos com exceção, 'rate': proporção}}
+        """
+        groups, names = self._group_column(by)
+        exception_types = self._ids('type', self.EXCEPTION_TYPES)
+        delivery = self._pairs(self.DELIVERY_EVENTS)
+        seen = collections.defaultdict(set)
+        exceptions = collections.defaultdict(set)
+        columns = self.columns
+        for group, obj, event_type, status in izip(groups, columns['object'], columns['type'], columns['status']):
+            seen[group].add(obj)
+            if event_type in exception_types and (event_type, status) not in delivery:
+                exceptions[group].add(obj)
+
+        rates = {}
+        for group, objects in seen.items():
+            failed = len(exceptions.get(group, ()))
+            rates[names[group]] = {
+                'objects': len(objects), 'exceptions': failed, 'rate': failed / float(len(objects)),
+            }
+        return rates
+
+    def save(self, path):
+        """
+        Grava o histórico em ``path``: um cabeçalho JSON com os dicionários, seguido das colunas em binário
+        """
+        header = json.dumps({
+            'service_key': self.service_key,
+            'byteorder': sys.byteorder,
+            'dictionaries': dict((name, dictionary.values) for name, dictionary in self.dictionaries.items()),
+            'columns': [(name, column.typecode, column.itemsize, len(column))
+                        for name, column in self.columns.items()],
+        }).encode('utf-8')
+        fd, temp_path = tempfile.mkstemp(prefix='.events-', dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(MAGIC)
+                fp.write(struct.pack('<I', len(header)))
+                fp.write(header)
+                for column in self.columns.values():
+                    column.tofile(fp)
+            os.rename(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """
+        Lê um histórico gravado com :meth:`save`. As colunas são copiadas do arquivo diretamente para os arrays
+        """
+        with open(path, 'rb') as fp:
+            if fp.read(len(MAGIC)) != MAGIC:
+                raise ValueError('%s is not an event store file' % path)
+            size, = struct.unpack('<I', fp.read(4))
+            header = json.loads(fp.read(size).decode('utf-8'))
+
+            store = cls(service_key=header['service_key'])
+            for name, values in header['dictionaries'].items():
+                store.dictionaries[name] = _Dictionary(values)
+            for name, typecode, itemsize, length in header['columns']:
+                column = array.array(str(typecode))
+                if column.itemsize != itemsize:
+                    raise ValueError('column %s was saved with %d-byte items' % (name, itemsize))
+                column.fromfile(fp, length)
+                if header['byteorder'] != sys.byteorder:
+                    column.byteswap()
+                store.columns[name] = column
+        store._keys = None
+        return store
@@ -0,0 +1,272 @@
+# coding: utf-8
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('sigep.labels')
+
+WEIGHTS = (8, 6, 4, 2, 3, 5, 9, 7)
+
+# etiqueta como retornada pelo solicitaEtiquetas, com um espaço no lugar do dígito: PC00000001 BR
+LABEL_RE = re.compile(r'^([A-Z]{2})(\d{8}) ?([A-Z]{2})$')
+TRACKING_CODE_RE = re.compile(r'^([A-Z]{2})(\d{8})(\d)([A-Z]{2})$')
+
+
+def calculate_digit(number):
+    """
+    Calcula o dígito verificador (módulo 11) do número de uma etiqueta
+
+    :param number: os 8 dígitos da etiqueta
+    :return: dígito verificador, de 0 a 9
+    """
+    total = sum(int(digit) * weight for digit, weight in zip(number, WEIGHTS))
+    rest = total % 11
+    if rest == 0:
+        return 5
+    if rest == 1:
+        return 0
+    return 11 - rest
+
+
+def is_label(label):
+    return LABEL_RE.match(label.strip().upper()) is not None
+
+
+def add_verification_digit(label):
+    """
+    Gera o código de rastreio completo de uma etiqueta sem dígito
+
+    :param label: Etiqueta sem dígito, com ou sem o espaço, ex: PC00000001 BR
+    :return: Código de rastreio com dígito, ex: PC000000016BR
+    :raises: ValueError, se a etiqueta não estiver no formato esperado
+    """
+    match = LABEL_RE.match(label.strip().upper())
+    if match is None:
+        raise ValueError('invalid label: %r' % label)
+    prefix, number, suffix = match.groups()
+    return '%s%s%d%s' % (prefix, number, calculate_digit(number), suffix)
+
+
+def add_verification_digits(labels):
+    """
+    Versão em lote de :func:`add_verification_digit`
+
+    :return: lista com os códigos de rastreio, na mesma ordem
+    """
+    return [add_verification_digit(label) for label in labels]
+
+
+def is_valid(tracking_code):
+    """
+    Verifica o formato e o dígito verificador de um código de rastreio
+
+    :param tracking_code: Código de rastreio com dígito, ex: PC000000016BR
+    :return: True se válido
+    """
+    match = TRACKING_CODE_RE.match(tracking_code.strip().upper())
+    if match is None:
+        return False
+    number, digit = match.group(2), match.group(3)
+    return calculate_digit(number) == int(digit)
+
+
+def validate_many(tracking_codes):
+    """
+    :return: lista com os códigos de rastreio inválidos
+    """
+    return [tracking_code for tracking_code in tracking_codes if not is_valid(tracking_code)]
+
+
+def expand_range(first, last):
+    """
+    Gera todas as etiquetas de um intervalo, no mesmo formato retornado pelo solicitaEtiquetas
+
+    :param first: Primeira etiqueta do intervalo, ex: PC00000001 BR
+    :param last: Última etiqueta do intervalo, ex: PC00000010 BR
+    :return: gerador de etiquetas sem dígito
+    :raises: ValueError, se as etiquetas não formarem um intervalo
+    """
+    first_match, last_match = LABEL_RE.match(first.strip()), LABEL_RE.match(last.strip())
+    if first_match is None or last_match is None:
+        raise ValueError('invalid label range: %r, %r' % (first, last))
+
+    prefix, start, suffix = first_match.groups()
+    if (prefix, suffix) != (last_match.group(1), last_match.group(3)) or int(start) > int(last_match.group(2)):
+        raise ValueError('invalid label range: %r, %r' % (first, last))
+
+    for number in range(int(start), int(last_match.group(2)) + 1):
+        yield '%s%08d %s' % (prefix, number, suffix)
+
+
+def parse_labels(response):
+    """
+    Lê a resposta do solicitaEtiquetas, expandindo o intervalo "primeira,última" em todas as etiquetas
+
+    :param response: Resposta do solicitaEtiquetas
+    :return: lista de etiquetas sem dígito
+    """
+    labels = response.split(',')
+    if len(labels) == 2 and all(is_label(label) for label in labels):
+        return list(expand_range(*labels))
+    return labels
+
+
+class LabelPool(object):
+    """
+    Estoque local de códigos de rastreio por serviço, gravado em SQLite.
+
+    Os códigos são solicitados ao SIGEP em lotes de ``batch_size`` e gravados antes de serem entregues, então
+    não se perdem nem são entregues duas vezes entre reinícios ou entre processos que usam o mesmo arquivo.
+    Quando restam menos de ``low_water`` códigos livres um novo lote é solicitado em segundo plano.
+    """
+    BATCH_SIZE = 1000
+    LOW_WATER = 100
+
+    def __init__(self, sigep, path, batch_size=BATCH_SIZE, low_water=LOW_WATER, timeout=30):
+        """
+        :param sigep: Cliente Sigep usado para solicitar as etiquetas
+        :param path: Arquivo SQLite do estoque
+        :param batch_size: Quantidade de etiquetas solicitadas por vez
+        :param low_water: Quantidade mínima de etiquetas livres antes de solicitar um novo lote
+        """
+        self.sigep = sigep
+        self.path = path
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self.timeout = timeout
+        self._local = threading.local()
+        self._refilling = {}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS labels (id INTEGER PRIMARY KEY AUTOINCREMENT, service_id TEXT NOT NULL, '
+            'tracking_code TEXT NOT NULL UNIQUE, claimed_at REAL)'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS labels_available ON labels (service_id, claimed_at, id)')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def available(self, service_id):
+        """
+        :return: quantidade de etiquetas livres do serviço
+        """
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM labels WHERE service_id = ? AND claimed_at IS NULL', (str(service_id),)
+        ).fetchone()[0]
+
+    def _is_low(self, connection, service_id):
+        row = connection.execute(
+            'SELECT id FROM labels WHERE service_id = ? AND claimed_at IS NULL ORDER BY id LIMIT 1 OFFSET ?',
+            (service_id, self.low_water),
+        ).fetchone()
+        return row is None
+
+    def refill(self, service_id, amount=None):
+        """
+        Solicita um lote de etiquetas ao SIGEP e grava no estoque
+
+        :return: quantidade de etiquetas gravadas
+        """
+        tracking_codes = self.sigep.request_new_tracking_codes(service_id, amount or self.batch_size)
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT OR IGNORE INTO labels (service_id, tracking_code) VALUES (?, ?)',
+                [(str(service_id), tracking_code) for tracking_code in tracking_codes],
+            )
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        logger.info(u'label pool - %d labels added for service %s', len(tracking_codes), service_id)
+        return len(tracking_codes)
+
+    def _begin_refill(self, service_id):
+        """
+        :return: tupla (Event sinalizado ao fim da reposição do serviço, se a reposição deve ser feita por quem
+            chamou). Há no máximo uma reposição em andamento por serviço
+        """
+        with self._lock:
+            done = self._refilling.get(service_id)
+            if done is not None:
+                return done, False
+            done = self._refilling[service_id] = threading.Event()
+            return done, True
+
+    def _finish_refill(self, service_id, done):
+        try:
+            self.refill(service_id)
+        finally:
+            with self._lock:
+                del self._refilling[service_id]
+            done.set()
+
+    def _refill_in_background(self, service_id):
+        done, started = self._begin_refill(service_id)
+        if not started:
+            return
+
+        def refill():
+            try:
+                self._finish_refill(service_id, done)
+            except Exception as e:
+                logger.error(u'label pool - refill for service %s failed: %r', service_id, e)
+
+        thread = threading.Thread(target=refill, name='sigep-label-pool-%s' % service_id)
+        thread.daemon = True
+        thread.start()
+
+    def _claim(self, service_id):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT id, tracking_code FROM labels WHERE service_id = ? AND claimed_at IS NULL ORDER BY id LIMIT 1',
+                (service_id,),
+            ).fetchone()
+            if row is not None:
+                connection.execute('UPDATE labels SET claimed_at = ? WHERE id = ?', (time.time(), row[0]))
+                low = self._is_low(connection, service_id)
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        if row is None:
+            return None, True
+        return row[1], low
+
+    def get(self, service_id):
+        """
+        Retorna um código de rastreio com dígito verificador, marcando-o como utilizado
+
+        :param service_id: ID do serviço (PAC, SEDEX)
+        :return: Código de rastreio com dígito verificador
+        """
+        service_id = str(service_id)
+        tracking_code, low = self._claim(service_id)
+        if tracking_code is None:
+            done, started = self._begin_refill(service_id)
+            if started:
+                self._finish_refill(service_id, done)
+            else:
+                # espera a reposição em andamento em vez de solicitar um segundo lote
+                done.wait(self.timeout)
+            tracking_code, low = self._claim(service_id)
+            if tracking_code is None:
+                raise ValueError('no labels available for service %s' % service_id)
+        if low:
+            self._refill_in_background(service_id)
+        return tracking_code
@@ -0,0 +1,296 @@
+# coding: utf-8
+import bisect
+import contextlib
+import copy
+import logging
+import threading
+import time
+
+try:
+    import thread
+except ImportError:
+    import _thread as thread
+
+from suds.transport import Transport
+from suds.transport.https import HttpAuthenticated
+
+logger = logging.getLogger('sigep.metrics')
+
+# limites superiores, em segundos, dos intervalos dos histogramas
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30, 60)
+
+
+class Call(object):
+    """
+    Medições de uma chamada a uma operação SOAP.
+
+    ``phases`` contém o tempo exclusivo de cada fase: ``render`` e ``validate`` (geração e validação da PLP),
+    ``network`` (envio e resposta HTTP) e ``parse`` (montagem do envelope e leitura da resposta). Fases
+    aninhadas não são contadas na fase externa.
+
+    A chamada pode ser medida em outras threads, ex: nas tentativas com prazo de :mod:`sigep.resilience`
+    (veja :meth:`Instrumentation.bind`). Cada thread tem a sua pilha de fases, e as fases de outra thread são
+    descontadas da fase em andamento na thread que criou a chamada.
+    """
+    __slots__ = ('operation', 'started_at', 'duration', 'phases', 'request_bytes', 'response_bytes', 'error',
+                 '_owner', '_stacks')
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.started_at = time.time()
+        self.duration = None
+        self.phases = {}
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.error = None
+        self._owner = thread.get_ident()
+        self._stacks = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        ident = thread.get_ident()
+        stack = self._stacks.setdefault(ident, [])
+        start = time.time()
+        stack.append(0.0)
+        try:
+            yield self
+        finally:
+            elapsed = time.time() - start
+            nested = stack.pop()
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed - nested
+            if not stack and ident != self._owner:
+                stack = self._stacks.get(self._owner)
+            if stack:
+                stack[-1] += elapsed
+
+    def finish(self, error=None):
+        self.duration = time.time() - self.started_at
+        if error is not None:
+            self.error = type(error).__name__
+
+    def __repr__(self):
+        return '<Call %s %.3fs error=%s>' % (self.operation, self.duration or 0, self.error)
+
+
+class Instrumentation(object):
+    """
+    Ganchos chamados antes e depois de cada operação SOAP, recebendo o :class:`Call` da operação.
+
+    Erros nos ganchos são registrados no log e não interrompem a operação.
+    """
+
+    def __init__(self, before=None, after=None):
+        self.before = list(before or [])
+        self.after = list(after or [])
+        self._local = threading.local()
+
+    def add_hook(self, before=None, after=None):
+        if before is not None:
+            self.before.append(before)
+        if after is not None:
+            self.after.append(after)
+
+    def current(self):
+        """
+        :return: o :class:`Call` em andamento na thread atual, ou None
+        """
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    @contextlib.contextmanager
+    def attach(self, call):
+        """
+        Torna ``call`` a chamada em andamento na thread atual durante o bloco ``with``, sem executar os ganchos
+        """
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(call)
+        try:
+            yield call
+        finally:
+            stack.pop()
+
+    def bind(self, function):
+        """
+        :return: ``function`` ligada à chamada em andamento na thread atual, para ser executada em outra thread
+            (ex: pelas tentativas de :class:`sigep.resilience.Policy`) medindo a fase ``network`` e os bytes
+            dessa mesma chamada
+        """
+        call = self.current()
+        if call is None:
+            return function
+
+        def bound():
+            with self.attach(call):
+                return function()
+        return bound
+
+    def _run_hooks(self, hooks, call):
+        for hook in hooks:
+            try:
+                hook(call)
+            except Exception:
+                logger.exception('instrumentation hook %r failed for %s', hook, call.operation)
+
+    @contextlib.contextmanager
+    def call(self, operation):
+        call = Call(operation)
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(call)
+        self._run_hooks(self.before, call)
+        try:
+            yield call
+        except GeneratorExit:
+            call.finish()
+            raise
+        except BaseException as e:
+            call.finish(e)
+            raise
+        else:
+            call.finish()
+        finally:
+            stack.remove(call)
+            self._run_hooks(self.after, call)
+
+
+class InstrumentedTransport(Transport):
+    """
+    Transporte do suds que mede a fase ``network`` e os bytes enviados e recebidos da chamada em andamento,
+    delegando o envio para uma cópia de ``transport``.
+
+    O suds liga as opções do cliente ao transporte atribuindo ``options``; a atribuição é repassada à cópia,
+    que não é compartilhada com outros clientes e não é alterada durante as chamadas. A cópia é rasa, ex: o
+    ``ConnectionPool`` de um :class:`sigep.transport.PooledTransport` continua compartilhado.
+    """
+
+    def __init__(self, transport, instrumentation):
+        self.transport = copy.copy(transport)
+        Transport.__init__(self)
+        self.instrumentation = instrumentation
+
+    def __setattr__(self, name, value):
+        self.__dict__[name] = value
+        if name == 'options':
+            self.transport.options = value
+
+    def open(self, request):
+        return self.transport.open(request)
+
+    def send(self, request):
+        call = self.instrumentation.current()
+        if call is None:
+            return self.transport.send(request)
+
+        call.request_bytes += len(request.message or '')
+        with call.phase('network'):
+            reply = self.transport.send(request)
+        call.response_bytes += len(reply.message or '')
+        return reply
+
+
+def instrument_transport(transport, instrumentation):
+    """
+    :param transport: Transporte do suds, por padrão o ``HttpAuthenticated`` usado pelo suds
+    :return: InstrumentedTransport que mede as chamadas de ``instrumentation``
+    """
+    return InstrumentedTransport(transport or HttpAuthenticated(), instrumentation)
+
+
+class Histogram(object):
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """
+        :param q: percentil, de 0 a 100
+        :return: limite superior do intervalo que contém o percentil, ou o maior valor observado
+        """
+        if not self.count:
+            return None
+        target = self.count * q / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
+
+
+class HistogramCollector(object):
+    """
+    Coletor em memória, para ser usado como gancho ``after``. Mantém um histograma por operação e fase
+    (a fase ``total`` é a duração da chamada), a contagem de erros por classe e os bytes transferidos.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.errors = {}
+        self.bytes = {}
+        self._lock = threading.Lock()
+
+    def _observe(self, key, value):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def __call__(self, call):
+        with self._lock:
+            self._observe((call.operation, 'total'), call.duration)
+            for phase, value in call.phases.items():
+                self._observe((call.operation, phase), value)
+            if call.error is not None:
+                key = (call.operation, call.error)
+                self.errors[key] = self.errors.get(key, 0) + 1
+            sent, received = self.bytes.get(call.operation, (0, 0))
+            self.bytes[call.operation] = (sent + call.request_bytes, received + call.response_bytes)
+
+    def snapshot(self):
+        """
+        :return: dicionário {operação: {'phases': {fase: estatísticas}, 'errors': {classe: quantidade},
+            'request_bytes', 'response_bytes'}}
+        """
+        with self._lock:
+            data = {}
+            for (operation, phase), histogram in self.histograms.items():
+                data.setdefault(operation, {'phases': {}, 'errors': {}})['phases'][phase] = histogram.to_dict()
+            for (operation, error), count in self.errors.items():
+                data.setdefault(operation, {'phases': {}, 'errors': {}})['errors'][error] = count
+            for operation, (sent, received) in self.bytes.items():
+                data.setdefault(operation, {'phases': {}, 'errors': {}}).update(
+                    request_bytes=sent, response_bytes=received,
+                )
+            return data
+
+    def clear(self):
+        with self._lock:
+            self.histograms.clear()
+            self.errors.clear()
+            self.bytes.clear()
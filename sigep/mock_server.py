@@ -0,0 +1,466 @@
+# coding: utf-8
+"""
+Servidor local que simula o SIGEP (AtendeCliente) e o Rastro, para testes e experimentos de carga.
+
+Pode ser usado dentro do processo:
+
+    with MockServer(MockCorreios(latency=(0.05, 0.2), error_rate=0.01)) as server:
+        sigep = Sigep(url=server.sigep_wsdl_url, **credentials)
+        sro = CorreiosSROClient(user, password, url=server.rastro_wsdl_url)
+
+ou de forma independente, com ``python -m sigep.mock_server --port 8080``.
+"""
+import BaseHTTPServer
+import SocketServer
+import argparse
+import collections
+import datetime
+import os
+import random
+import re
+import threading
+import time
+
+from lxml import etree
+
+from sigep import labels, rastro, wsdl
+
+SIGEP_NAMESPACE = 'http://cliente.bean.master.sigep.bsb.correios.com.br/'
+SIGEP_PATH = '/SigepMasterJPA/AtendeClienteService/AtendeCliente'
+RASTRO_PATH = '/service/rastro'
+
+NOT_FOUND = u'Objeto não encontrado na base de dados dos Correios.'
+
+
+class MockFault(Exception):
+    """
+    Erro retornado ao cliente como SOAP Fault
+    """
+
+
+class MockCorreios(object):
+    """
+    Estado e regras de negócio simulados: etiquetas solicitadas, PLPs fechadas e eventos de rastreio.
+
+    Com ``strict`` o fechamento da PLP exige etiquetas solicitadas por ``solicitaEtiquetas`` e ainda não
+    usadas em outra PLP, como o SIGEP. Os objetos de uma PLP fechada passam a ter o evento de postagem no
+    Rastro.
+
+    ``latency`` é o tempo de resposta em segundos: um número, uma tupla (mínimo, máximo) para uma distribuição
+    uniforme ou uma função que recebe o nome da operação. ``error_rate`` é a probabilidade de uma chamada
+    retornar um SOAP Fault, para todas as operações ou por operação em um dicionário. ``faults`` define
+    mensagens de erro fixas por operação.
+    """
+    SERVICES = (
+        ('04162', u'SEDEX CONTRATO AGENCIA', '124849'),
+        ('04669', u'PAC CONTRATO AGENCIA', '124884'),
+    )
+    LABEL_PREFIX = 'PC'
+    LABEL_SUFFIX = 'BR'
+
+    def __init__(self, services=SERVICES, latency=None, error_rate=0, faults=None, unavailable=(), strict=True,
+                 seed=None):
+        """
+        :param services: tuplas (código, descrição, id) dos serviços do contrato
+        :param latency: Tempo de resposta, veja acima
+        :param error_rate: Probabilidade de SOAP Fault, número ou dicionário {operação: probabilidade}
+        :param faults: dicionário {operação: mensagem} de operações que sempre falham
+        :param unavailable: pares (código do serviço, CEP) indisponíveis no verificaDisponibilidadeServico
+        :param strict: Valida as etiquetas no fechamento da PLP
+        :param seed: Semente dos sorteios de latência e erros, para resultados reproduzíveis
+        """
+        self.services = services
+        self.latency = latency
+        self.error_rate = error_rate
+        self.faults = dict(faults or {})
+        self.unavailable = set(unavailable)
+        self.strict = strict
+        self.random = random.Random(seed)
+        self.calls = collections.Counter()
+        self.labels = {}
+        self.used_labels = set()
+        self.plps = collections.OrderedDict()
+        self.events = {}
+        self._next_label = 1
+        self._next_plp = 1
+        self._lock = threading.Lock()
+
+    def get_latency(self, operation):
+        if self.latency is None:
+            return 0
+        if callable(self.latency):
+            return self.latency(operation)
+        if isinstance(self.latency, tuple):
+            with self._lock:
+                return self.random.uniform(*self.latency)
+        return self.latency
+
+    def _should_fail(self, operation):
+        rate = self.error_rate.get(operation, 0) if isinstance(self.error_rate, dict) else self.error_rate
+        if not rate:
+            return False
+        with self._lock:
+            return self.random.random() < rate
+
+    def call(self, operation, params):
+        """
+        Executa uma operação
+
+        :param params: dicionário {parâmetro: lista de valores}
+        :return: lista de elementos ``return`` da resposta
+        :raises: MockFault
+        """
+        self.calls[operation] += 1
+        delay = self.get_latency(operation)
+        if delay:
+            time.sleep(delay)
+        if operation in self.faults:
+            raise MockFault(self.faults[operation])
+        if self._should_fail(operation):
+            raise MockFault(u'Erro simulado em %s' % operation)
+
+        handler = getattr(self, 'op_' + operation, None)
+        if handler is None:
+            raise MockFault(u'Operação não suportada: %s' % operation)
+        return handler(params)
+
+    def add_event(self, tracking_code, event_type='RO', status='01', description=u'Objeto encaminhado',
+                  local=u'CTE VILA MARIA', city=u'SAO PAULO', uf=u'SP', code=u'05311900', when=None,
+                  destiny=None):
+        """
+        Adiciona um evento de rastreio, que passa a ser o mais recente do objeto
+
+        :param destiny: dicionário opcional com ``local``, ``codigo``, ``cidade``, ``bairro`` e ``uf``
+        """
+        when = when or datetime.datetime.now()
+        event = {
+            'tipo': event_type, 'status': status, 'data': when.strftime('%d/%m/%Y'), 'hora': when.strftime('%H:%M'),
+            'descricao': description, 'local': local, 'codigo': code, 'cidade': city, 'uf': uf, 'destino': destiny,
+        }
+        with self._lock:
+            self.events.setdefault(tracking_code, []).insert(0, event)
+
+    def deliver(self, tracking_code):
+        self.add_event(tracking_code, 'BDE', '01', u'Objeto entregue ao destinatário')
+
+    # SIGEP
+
+    def _service_ids(self):
+        return set(service_id for _, _, service_id in self.services)
+
+    def op_buscaServicos(self, params):
+        returns = []
+        for code, description, service_id in self.services:
+            element = etree.Element('return')
+            _sub(element, 'codigo', code)
+            _sub(element, 'descricao', description)
+            _sub(element, 'id', service_id)
+            returns.append(element)
+        return returns
+
+    def op_buscaCliente(self, params):
+        element = etree.Element('return')
+        _sub(element, 'cnpj', u'00000000000000')
+        contract = _sub(element, 'contratos')
+        card = _sub(contract, 'cartoesPostagem')
+        _sub(card, 'numero', _first(params, 'idCartaoPostagem'))
+        for code, description, service_id in self.services:
+            service = _sub(card, 'servicos')
+            _sub(service, 'codigo', code)
+            _sub(service, 'descricao', description)
+            _sub(service, 'id', service_id)
+        _sub(element, 'descricaoStatusCliente', u'Ativo')
+        _sub(element, 'id', u'1')
+        _sub(element, 'nome', u'SIGEPY')
+        return [element]
+
+    def op_verificaDisponibilidadeServico(self, params):
+        code = _first(params, 'numeroServico')
+        zip_code = _first(params, 'cepDestino')
+        if code not in set(code for code, _, _ in self.services) or (code, zip_code) in self.unavailable:
+            return [_return(u'-1#Serviço indisponível para o CEP de destino')]
+        return [_return(u'0#')]
+
+    def op_solicitaEtiquetas(self, params):
+        service_id = _first(params, 'idServico')
+        if service_id not in self._service_ids():
+            raise MockFault(u'Serviço %s não encontrado' % service_id)
+        amount = int(_first(params, 'qtdEtiquetas') or 1)
+        if amount < 1:
+            raise MockFault(u'Quantidade de etiquetas inválida')
+
+        with self._lock:
+            first = self._next_label
+            self._next_label += amount
+        for number in range(first, first + amount):
+            self.labels['%s%08d%s' % (self.LABEL_PREFIX, number, self.LABEL_SUFFIX)] = service_id
+        return [_return(u'%s%08d %s,%s%08d %s' % (
+            self.LABEL_PREFIX, first, self.LABEL_SUFFIX, self.LABEL_PREFIX, first + amount - 1, self.LABEL_SUFFIX,
+        ))]
+
+    def op_geraDigitoVerificadorEtiquetas(self, params):
+        returns = []
+        for label in params.get('etiquetas', []):
+            try:
+                tracking_code = labels.add_verification_digit(label)
+            except ValueError:
+                raise MockFault(u'Etiqueta inválida: %s' % label)
+            returns.append(_return(tracking_code[10]))
+        return returns
+
+    def op_fechaPlpVariosServicos(self, params):
+        label_list = params.get('listaEtiquetas', [])
+        try:
+            document = etree.fromstring(_first(params, 'xml').encode('iso-8859-1', 'xmlcharrefreplace'))
+        except (AttributeError, etree.XMLSyntaxError):
+            raise MockFault(u'XML da PLP inválido')
+
+        numbers = [
+            '%s%s' % (code[:-3], code[-2:]) for code in document.xpath('objeto_postal/numero_etiqueta/text()')
+        ]
+        if sorted(numbers) != sorted(label_list):
+            raise MockFault(u'As etiquetas da lista não conferem com as etiquetas do XML')
+
+        with self._lock:
+            if self.strict:
+                for label in label_list:
+                    if label not in self.labels:
+                        raise MockFault(u'Etiqueta %s não encontrada' % label)
+                    if label in self.used_labels:
+                        raise MockFault(u'Etiqueta %s já utilizada em outra PLP' % label)
+            self.used_labels.update(label_list)
+            plp_id = self._next_plp
+            self._next_plp += 1
+            self.plps[plp_id] = {
+                'xml': _first(params, 'xml'),
+                'intern_number': _first(params, 'idPlpCliente'),
+                'labels': list(label_list),
+            }
+
+        for label in label_list:
+            tracking_code = labels.add_verification_digit(label)
+            if tracking_code not in self.events:
+                self.add_event(tracking_code, 'PO', '01', u'Objeto postado')
+        return [_return(plp_id)]
+
+    def op_solicitaPLP(self, params):
+        plp_id = int(_first(params, 'idPlpMaster') or 0)
+        plp = self.plps.get(plp_id)
+        if plp is None:
+            raise MockFault(u'PLP %s não encontrada' % plp_id)
+        return [_return(plp['xml'])]
+
+    # Rastro
+
+    def op_buscaEventos(self, params):
+        objects = (_first(params, 'objetos') or '').strip().upper()
+        codes = [objects[start:start + 13] for start in range(0, len(objects), 13)]
+        if _first(params, 'tipo') == 'F' and len(codes) == 2:
+            prefix, suffix = codes[0][:2], codes[0][-2:]
+            codes = [
+                labels.add_verification_digit('%s%08d%s' % (prefix, number, suffix))
+                for number in range(int(codes[0][2:10]), int(codes[1][2:10]) + 1)
+            ]
+        last_result = _first(params, 'resultado') == 'U'
+
+        result = etree.Element('return')
+        _sub(result, 'versao', u'2.0')
+        _sub(result, 'qtd', len(codes))
+        for code in codes:
+            obj = _sub(result, 'objeto')
+            _sub(obj, 'numero', code)
+            events = self.events.get(code)
+            if not events:
+                _sub(obj, 'erro', NOT_FOUND)
+                continue
+            _sub(obj, 'sigla', code[:2])
+            _sub(obj, 'nome', u'ETIQUETA LOGICA SEDEX')
+            _sub(obj, 'categoria', u'SEDEX')
+            for event in events[:1] if last_result else events:
+                element = _sub(obj, 'evento')
+                for tag in ('tipo', 'status', 'data', 'hora', 'descricao', 'local', 'codigo', 'cidade', 'uf'):
+                    _sub(element, tag, event[tag])
+                if event['destino']:
+                    destiny = _sub(element, 'destino')
+                    for tag in ('local', 'codigo', 'cidade', 'bairro', 'uf'):
+                        _sub(destiny, tag, event['destino'].get(tag))
+        return [result]
+
+
+def _first(params, name):
+    values = params.get(name)
+    return values[0] if values else None
+
+
+def _text(value):
+    if value is None:
+        return None
+    return value if isinstance(value, unicode) else str(value).decode('utf-8')
+
+
+def _sub(parent, tag, value=None):
+    element = etree.SubElement(parent, tag)
+    element.text = _text(value)
+    return element
+
+
+def _return(value):
+    element = etree.Element('return')
+    element.text = _text(value)
+    return element
+
+
+def parse_request(body):
+    """
+    :return: tupla (operação, dicionário {parâmetro: lista de valores})
+    """
+    root = etree.fromstring(body)
+    body = root.find('{%s}Body' % rastro.SOAP_NAMESPACE)
+    if body is None or not len(body):
+        raise MockFault(u'Envelope SOAP inválido')
+    operation = body[0]
+    params = collections.defaultdict(list)
+    for child in operation:
+        params[etree.QName(child).localname].append(child.text or u'')
+    return etree.QName(operation).localname, params
+
+
+def build_response(namespace, operation, returns):
+    envelope = etree.Element('{%s}Envelope' % rastro.SOAP_NAMESPACE, nsmap={'soap': rastro.SOAP_NAMESPACE})
+    body = etree.SubElement(envelope, '{%s}Body' % rastro.SOAP_NAMESPACE)
+    response = etree.SubElement(body, '{%s}%sResponse' % (namespace, operation), nsmap={'ns2': namespace})
+    response.extend(returns)
+    return etree.tostring(envelope, xml_declaration=True, encoding='UTF-8')
+
+
+def build_fault(message):
+    envelope = etree.Element('{%s}Envelope' % rastro.SOAP_NAMESPACE, nsmap={'soap': rastro.SOAP_NAMESPACE})
+    body = etree.SubElement(envelope, '{%s}Body' % rastro.SOAP_NAMESPACE)
+    fault = etree.SubElement(body, '{%s}Fault' % rastro.SOAP_NAMESPACE)
+    _sub(fault, 'faultcode', u'soap:Server')
+    _sub(fault, 'faultstring', message)
+    return etree.tostring(envelope, xml_declaration=True, encoding='UTF-8')
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        document = self.server.documents.get(self.path.split('?')[0])
+        if document is None:
+            return self._reply(404, b'')
+        self._reply(200, document)
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        namespaces = {SIGEP_PATH: SIGEP_NAMESPACE, RASTRO_PATH: rastro.NAMESPACE}
+        if path not in namespaces:
+            return self._reply(404, b'')
+
+        body = self.rfile.read(int(self.headers.getheader('content-length') or 0))
+        try:
+            operation, params = parse_request(body)
+            returns = self.server.correios.call(operation, params)
+        except MockFault as e:
+            return self._reply(500, build_fault(e.args[0]))
+        except etree.XMLSyntaxError:
+            return self._reply(500, build_fault(u'Envelope SOAP inválido'))
+        self._reply(200, build_response(namespaces[path], operation, returns))
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class MockServer(object):
+    """
+    Servidor HTTP do :class:`MockCorreios`, executado em uma thread. Serve também os WSDLs do pacote com o
+    endereço dos serviços apontando para o próprio servidor.
+    """
+
+    def __init__(self, correios=None, host='127.0.0.1', port=0):
+        self.correios = correios or MockCorreios()
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.correios = self.correios
+        self.server.documents = {
+            SIGEP_PATH: self._document(wsdl.SIGEP_WSDL, SIGEP_PATH),
+            RASTRO_PATH + '/Rastro.wsdl': self._document(wsdl.RASTRO_WSDL, RASTRO_PATH),
+        }
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    @property
+    def sigep_wsdl_url(self):
+        return self.url + SIGEP_PATH + '?wsdl'
+
+    @property
+    def rastro_wsdl_url(self):
+        return self.url + RASTRO_PATH + '/Rastro.wsdl'
+
+    def _document(self, path, service_path):
+        with open(os.path.join(wsdl.BASE_DIR, path)) as fp:
+            document = fp.read()
+        return re.sub(r'location="[^"]+"', 'location="%s%s"' % (self.url, service_path), document)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='sigep-mock-server')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=u'Servidor simulado do SIGEP e do Rastro')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, nargs='+', help='segundos, ou mínimo e máximo')
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--no-strict', dest='strict', action='store_false')
+    args = parser.parse_args(argv)
+
+    latency = None
+    if args.latency:
+        latency = tuple(args.latency) if len(args.latency) > 1 else args.latency[0]
+    correios = MockCorreios(latency=latency, error_rate=args.error_rate, strict=args.strict, seed=args.seed)
+    server = MockServer(correios, args.host, args.port)
+    print('SIGEP:  %s' % server.sigep_wsdl_url)
+    print('Rastro: %s' % server.rastro_wsdl_url)
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+# coding: utf-8
+import collections
+import io
+
+from lxml import etree
+
+ENCODING = 'ISO-8859-1'
+FILE_VERSION = '2.3'
+
+
+def _text(value):
+    if value is None:
+        return u''
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return unicode(value)
+
+
+def _cdata(value):
+    """
+    Conteúdo em CDATA, como no template. Caracteres fora do ISO-8859-1 não podem ser representados dentro de
+    uma seção CDATA, nesse caso o valor é escrito como texto e o lxml gera as referências de caractere.
+    """
+    value = _text(value)
+    try:
+        value.encode(ENCODING)
+    except UnicodeEncodeError:
+        return value
+    return etree.CDATA(value)
+
+
+def _sub(parent, tag, value=None, cdata=False):
+    element = etree.SubElement(parent, tag)
+    if cdata:
+        element.text = _cdata(value)
+    elif value is not None:
+        element.text = _text(value)
+    return element
+
+
+def _build_plp(card):
+    plp = etree.Element('plp')
+    _sub(plp, 'id_plp')
+    _sub(plp, 'valor_global')
+    _sub(plp, 'mcu_unidade_postagem')
+    _sub(plp, 'nome_unidade_postagem')
+    _sub(plp, 'cartao_postagem', card)
+    return plp
+
+
+def _build_sender(contract, regional_code, admin_code, sender_info):
+    sender = etree.Element('remetente')
+    _sub(sender, 'numero_contrato', contract)
+    _sub(sender, 'numero_diretoria', regional_code)
+    _sub(sender, 'codigo_administrativo', admin_code)
+    _sub(sender, 'nome_remetente', sender_info.get('name'), cdata=True)
+    _sub(sender, 'logradouro_remetente', sender_info.get('street'), cdata=True)
+    _sub(sender, 'numero_remetente', sender_info.get('number'))
+    _sub(sender, 'complemento_remetente', sender_info.get('complement'), cdata=True)
+    _sub(sender, 'bairro_remetente', sender_info.get('neighborhood'), cdata=True)
+    _sub(sender, 'cep_remetente', sender_info.get('zipcode'), cdata=True)
+    _sub(sender, 'cidade_remetente', sender_info.get('city'), cdata=True)
+    _sub(sender, 'uf_remetente', sender_info.get('state'))
+    _sub(sender, 'telefone_remetente', sender_info.get('phone'), cdata=True)
+    _sub(sender, 'fax_remetente', sender_info.get('fax'), cdata=True)
+    _sub(sender, 'email_remetente', sender_info.get('email'), cdata=True)
+    return sender
+
+
+def build_object(item):
+    """
+    Gera o elemento ``objeto_postal`` de um objeto, equivalente ao trecho do template xml/plp.xml
+
+    :param item: dicionário do objeto, com as mesmas chaves aceitas por ``Sigep.create_plp``
+    :return: etree.Element
+    """
+    obj = etree.Element('objeto_postal')
+    _sub(obj, 'numero_etiqueta', item.get('tracking_code'))
+    _sub(obj, 'codigo_objeto_cliente')
+    _sub(obj, 'codigo_servico_postagem', item.get('service_code'))
+    _sub(obj, 'cubagem')
+    _sub(obj, 'peso', item.get('weight'))
+    _sub(obj, 'rt1')
+    _sub(obj, 'rt2')
+
+    receiver = _sub(obj, 'destinatario')
+    _sub(receiver, 'nome_destinatario', item.get('receiver_name'), cdata=True)
+    _sub(receiver, 'telefone_destinatario', item.get('receiver_home_phone'), cdata=True)
+    _sub(receiver, 'celular_destinatario', item.get('receiver_mobile_phone'), cdata=True)
+    _sub(receiver, 'email_destinatario', item.get('receiver_email'), cdata=True)
+    _sub(receiver, 'logradouro_destinatario', item.get('receiver_address'), cdata=True)
+    _sub(receiver, 'complemento_destinatario', item.get('receiver_complement'), cdata=True)
+    _sub(receiver, 'numero_end_destinatario', item.get('receiver_number'))
+
+    national = _sub(obj, 'nacional')
+    _sub(national, 'bairro_destinatario', item.get('receiver_neighborhood'), cdata=True)
+    _sub(national, 'cidade_destinatario', item.get('receiver_city'), cdata=True)
+    _sub(national, 'uf_destinatario', item.get('receiver_state'))
+    _sub(national, 'cep_destinatario', item.get('receiver_zip_code'), cdata=True)
+    _sub(national, 'codigo_usuario_postal')
+    _sub(national, 'centro_custo_cliente')
+    _sub(national, 'numero_nota_fiscal', item.get('nfe_number') or None)
+    _sub(national, 'serie_nota_fiscal')
+    _sub(national, 'valor_nota_fiscal')
+    _sub(national, 'natureza_nota_fiscal')
+    _sub(national, 'descricao_objeto', u'', cdata=True)
+    _sub(national, 'valor_a_cobrar')
+
+    additional = _sub(obj, 'servico_adicional')
+    _sub(additional, 'codigo_servico_adicional', '025')
+    if item.get('is_insurance'):
+        _sub(additional, 'codigo_servico_adicional', '019')
+        _sub(additional, 'valor_declarado', item.get('total'))
+    else:
+        _sub(additional, 'valor_declarado')
+
+    dimension = _sub(obj, 'dimensao_objeto')
+    _sub(dimension, 'tipo_objeto', '002')
+    _sub(dimension, 'dimensao_altura', item.get('dimension_height'))
+    _sub(dimension, 'dimensao_largura', item.get('dimension_width'))
+    _sub(dimension, 'dimensao_comprimento', item.get('dimension_length'))
+    _sub(dimension, 'dimensao_diametro', item.get('dimension_diameter'))
+
+    _sub(obj, 'data_postagem_sara')
+    _sub(obj, 'status_processamento', '0')
+    _sub(obj, 'numero_comprovante_postagem')
+    _sub(obj, 'valor_cobrado')
+    return obj
+
+
+def write_plp(output, card, contract, regional_code, admin_code, sender_info, object_list):
+    """
+    Escreve o XML da PLP de forma incremental, um ``objeto_postal`` por vez, já compacto e em ISO-8859-1.
+
+    Apenas um objeto fica em memória durante a escrita, então ``object_list`` pode ser qualquer iterável,
+    inclusive um gerador.
+
+    :param output: arquivo (ou file-like) binário onde o XML será escrito
+    :param object_list: iterável com os dicionários dos objetos
+    :return: lista com os códigos de rastreio dos objetos escritos, na ordem do XML
+    """
+    tracking_code_list = []
+    with etree.xmlfile(output, encoding=ENCODING) as xf:
+        xf.write_declaration()
+        with xf.element('correioslog'):
+            tipo_arquivo = etree.Element('tipo_arquivo')
+            tipo_arquivo.text = u'Postagem'
+            xf.write(tipo_arquivo)
+            versao_arquivo = etree.Element('versao_arquivo')
+            versao_arquivo.text = FILE_VERSION
+            xf.write(versao_arquivo)
+            xf.write(_build_plp(card))
+            xf.write(_build_sender(contract, regional_code, admin_code, sender_info))
+            xf.write(etree.Element('forma_pagamento'))
+            for item in object_list:
+                xf.write(build_object(item))
+                tracking_code_list.append(item.get('tracking_code'))
+    return tracking_code_list
+
+
+def build_plp(card, contract, regional_code, admin_code, sender_info, object_list):
+    """
+    Gera o XML da PLP em memória
+
+    :return: tupla (XML em bytes, lista de códigos de rastreio)
+    """
+    output = io.BytesIO()
+    tracking_code_list = write_plp(output, card, contract, regional_code, admin_code, sender_info, object_list)
+    return output.getvalue(), tracking_code_list
+
+
+def shard_objects(object_list, shard_size, group_by_service=False):
+    """
+    Divide os objetos em lotes de no máximo ``shard_size`` objetos, mantendo a ordem original
+
+    :param object_list: iterável com os dicionários dos objetos
+    :param shard_size: Quantidade máxima de objetos por lote
+    :param group_by_service: Se verdadeiro, cada lote contém objetos de um único ``service_code``
+    :return: gerador de listas de objetos
+    """
+    if shard_size < 1:
+        raise ValueError('shard_size must be greater than zero')
+
+    if not group_by_service:
+        shard = []
+        for item in object_list:
+            shard.append(item)
+            if len(shard) == shard_size:
+                yield shard
+                shard = []
+        if shard:
+            yield shard
+        return
+
+    shards = collections.OrderedDict()
+    for item in object_list:
+        service_code = item.get('service_code')
+        shard = shards.setdefault(service_code, [])
+        shard.append(item)
+        if len(shard) == shard_size:
+            yield shard
+            shards[service_code] = []
+    for shard in shards.values():
+        if shard:
+            yield shard
+
+
+def _element_dict(element):
+    data = {}
+    for child in element:
+        value = _element_dict(child) if len(child) else (child.text or u'').strip()
+        if child.tag in data:
+            if not isinstance(data[child.tag], list):
+                data[child.tag] = [data[child.tag]]
+            data[child.tag].append(value)
+        else:
+            data[child.tag] = value
+    return data
+
+
+def iter_objects(source):
+    """
+    Lê os ``objeto_postal`` de uma PLP de forma incremental com ``iterparse``, liberando cada objeto assim que
+    ele é convertido
+
+    :param source: XML da PLP em bytes, ou um arquivo aberto em modo binário
+    :return: gerador de dicionários com as tags do objeto. Tags compostas, como ``destinatario``, viram
+        dicionários e tags repetidas, como ``codigo_servico_adicional``, viram listas
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    for _, element in etree.iterparse(source, events=('end',), tag='objeto_postal'):
+        yield _element_dict(element)
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
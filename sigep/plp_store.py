@@ -0,0 +1,170 @@
+# coding: utf-8
+import collections
+import contextlib
+import gzip
+import io
+import logging
+import os
+import re
+import tempfile
+
+from sigep import plp, wsdl
+from sigep.cache import LRUCache
+
+logger = logging.getLogger('sigep.plp_store')
+
+DECLARATION_RE = re.compile(r'^\s*<\?xml[^>]*\?>\s*')
+
+
+def encode_xml(xml):
+    """
+    :param xml: XML retornado pelo ``solicitaPLP``
+    :return: XML em bytes UTF-8, com a declaração de encoding correspondente
+    """
+    if isinstance(xml, bytes):
+        xml = xml.decode('utf-8')
+    return b'<?xml version="1.0" encoding="UTF-8"?>\n' + DECLARATION_RE.sub(u'', xml).encode('utf-8')
+
+
+class PLPStore(object):
+    """
+    XML das PLPs fechadas, que não mudam mais, gravado em ``path`` com um arquivo gzip por PLP e mantido em
+    um LRU em memória. Uma PLP é buscada no SIGEP apenas na primeira vez em que é lida.
+
+    A mesma pasta pode ser usada por vários processos: cada arquivo é gravado em um temporário e renomeado.
+    """
+    WORKERS = 4
+
+    def __init__(self, sigep, path, maxsize=100, workers=None, compresslevel=6):
+        """
+        :param sigep: cliente :class:`sigep.sigep_client.Sigep` usado nas consultas
+        :param path: Pasta onde as PLPs são gravadas
+        :param maxsize: Quantidade de PLPs mantidas em memória
+        :param workers: Consultas simultâneas do ``fetch_many``, por padrão ``WORKERS``
+        :param compresslevel: Nível de compressão do gzip, de 1 a 9
+        """
+        self.sigep = sigep
+        self.path = path
+        self.memory = LRUCache(maxsize)
+        self.workers = workers or self.WORKERS
+        self.compresslevel = compresslevel
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def _path(self, plp_id):
+        return os.path.join(self.path, '%d.xml.gz' % int(plp_id))
+
+    def __contains__(self, plp_id):
+        return self.memory.get(int(plp_id)) is not None or os.path.exists(self._path(plp_id))
+
+    def put(self, plp_id, xml):
+        """
+        Grava o XML de uma PLP fechada
+
+        :param xml: XML retornado pelo ``solicitaPLP``, em texto ou bytes
+        """
+        data = encode_xml(xml)
+        fd, temp_path = tempfile.mkstemp(prefix='.plp-', dir=self.path)
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                with contextlib.closing(gzip.GzipFile(fileobj=fp, mode='wb',
+                                                      compresslevel=self.compresslevel)) as gz:
+                    gz.write(data)
+            os.rename(temp_path, self._path(plp_id))
+        except Exception:
+            os.remove(temp_path)
+            raise
+        self.memory.set(int(plp_id), data)
+
+    def _fetch(self, plp_id, tracking_code_list=()):
+        logger.info(u'fetching PLP %s', plp_id)
+        xml = self.sigep.request_xml_plp(plp_id, list(tracking_code_list))
+        self.put(plp_id, xml)
+        return self.memory.get(int(plp_id)) or encode_xml(xml)
+
+    def get_bytes(self, plp_id, tracking_code_list=()):
+        """
+        :return: XML da PLP em bytes UTF-8, da memória, do disco ou do SIGEP, nessa ordem
+        """
+        data = self.memory.get(int(plp_id))
+        if data is not None:
+            return data
+        try:
+            with contextlib.closing(gzip.open(self._path(plp_id), 'rb')) as fp:
+                data = fp.read()
+        except IOError:
+            return self._fetch(plp_id, tracking_code_list)
+        self.memory.set(int(plp_id), data)
+        return data
+
+    def get(self, plp_id, tracking_code_list=()):
+        """
+        :return: XML da PLP em texto, como o retornado por ``Sigep.request_xml_plp``
+        """
+        return self.get_bytes(plp_id, tracking_code_list).decode('utf-8')
+
+    def open(self, plp_id, tracking_code_list=()):
+        """
+        :return: arquivo binário com o XML da PLP, lido do disco de forma incremental se ela não está em memória
+        """
+        data = self.memory.get(int(plp_id))
+        if data is not None:
+            return io.BytesIO(data)
+        if not os.path.exists(self._path(plp_id)):
+            return io.BytesIO(self._fetch(plp_id, tracking_code_list))
+        return gzip.open(self._path(plp_id), 'rb')
+
+    def iter_objects(self, plp_id, tracking_code_list=()):
+        """
+        :return: gerador com os ``objeto_postal`` da PLP, veja :func:`sigep.plp.iter_objects`
+        """
+        with contextlib.closing(self.open(plp_id, tracking_code_list)) as fp:
+            for obj in plp.iter_objects(fp):
+                yield obj
+
+    def _fetch_one(self, args):
+        plp_id, tracking_code_list = args
+        try:
+            self._fetch(plp_id, tracking_code_list)
+        except Exception as e:
+            logger.error(u'fetch_many - PLP %s failed: %r', plp_id, e)
+            return plp_id, {'status': False, 'erro': e}
+        return plp_id, {'status': True, 'cached': False}
+
+    def fetch_many(self, plps, workers=None):
+        """
+        Busca várias PLPs em paralelo, ignorando as que já estão gravadas. As threads da busca usam cópias
+        próprias do cliente suds do ``Sigep``, veja :func:`sigep.wsdl.worker_pool`
+
+        :param plps: iterável com os números das PLPs, ou dicionário {número: lista de códigos de rastreio}
+        :param workers: Quantidade máxima de consultas simultâneas
+        :return: dicionário {número: {'status': True, 'cached': se já estava gravada}} ou
+            {'status': False, 'erro': exceção} para as consultas que falharam
+        """
+        items = plps.items() if isinstance(plps, dict) else [(plp_id, ()) for plp_id in plps]
+        items = collections.OrderedDict((int(plp_id), codes) for plp_id, codes in items)
+
+        results = {}
+        pending = []
+        for plp_id, tracking_code_list in items.items():
+            if plp_id in self:
+                results[plp_id] = {'status': True, 'cached': True}
+            else:
+                pending.append((plp_id, tracking_code_list))
+        if not pending:
+            return results
+
+        pool = wsdl.worker_pool(min(workers or self.workers, len(pending)))
+        try:
+            results.update(pool.map(self._fetch_one, pending))
+        finally:
+            pool.close()
+            pool.join()
+        return results
+
+    def delete(self, plp_id):
+        self.memory.delete(int(plp_id))
+        try:
+            os.remove(self._path(plp_id))
+        except OSError:
+            pass
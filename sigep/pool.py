@@ -0,0 +1,189 @@
+# coding: utf-8
+import collections
+import contextlib
+import httplib
+import socket
+import threading
+import time
+import urllib2
+from xml.sax import SAXException
+
+from suds.transport import TransportError
+
+from sigep import metrics
+from sigep.correios_client import CorreiosSROClient
+from sigep.sigep_client import Sigep
+from sigep.wsdl import clone_client
+
+POOL_SIZE = 8
+CHECKOUT_TIMEOUT = 30
+IDLE_TIMEOUT = 300
+
+# erros de transporte ou de protocolo, depois dos quais o estado do cliente suds não é confiável
+BROKEN_CLIENT_ERRORS = (socket.error, httplib.HTTPException, urllib2.URLError, TransportError, SAXException)
+
+
+class PoolTimeout(Exception):
+    """
+    Nenhum cliente ficou livre dentro do tempo de espera
+    """
+
+
+class ClientPool(object):
+    """
+    Pool limitado de clientes prontos, seguro para uso entre threads, ex: em um servidor WSGI com threads::
+
+        pool = ClientPool.sigep(maxsize=8, **credenciais)
+        with pool.client() as sigep:
+            sigep.check_service_available('04162', '01310100')
+
+    Cada cliente é usado por uma única thread por vez. Os clientes são criados sob demanda até ``maxsize``;
+    sem cliente livre, ``checkout`` espera até ``timeout`` segundos. Clientes livres há mais de
+    ``idle_timeout`` segundos são descartados.
+    """
+
+    def __init__(self, factory, maxsize=POOL_SIZE, timeout=CHECKOUT_TIMEOUT, idle_timeout=IDLE_TIMEOUT):
+        """
+        :param factory: função sem parâmetros que cria um novo cliente
+        """
+        self.factory = factory
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.size = 0
+        self.waiting = 0
+        self.counters = collections.Counter()
+        self.wait_time = metrics.Histogram()
+        self._idle = []
+        self._condition = threading.Condition()
+
+    @classmethod
+    def sigep(cls, maxsize=POOL_SIZE, timeout=CHECKOUT_TIMEOUT, idle_timeout=IDLE_TIMEOUT, **kwargs):
+        """
+        Pool de :class:`Sigep`. O WSDL é lido uma única vez e compartilhado entre os clientes.
+
+        :param kwargs: parâmetros do :class:`Sigep`
+        """
+        prototype = Sigep(**kwargs)
+        kwargs = dict(kwargs, url=prototype.url, instrumentation=prototype.instrumentation)
+        return cls(lambda: Sigep(client=clone_client(prototype.client), **kwargs), maxsize, timeout, idle_timeout)
+
+    @classmethod
+    def sro(cls, affiliation_id, password, maxsize=POOL_SIZE, timeout=CHECKOUT_TIMEOUT, idle_timeout=IDLE_TIMEOUT,
+            **kwargs):
+        """
+        Pool de :class:`CorreiosSROClient`. O WSDL é lido uma única vez e compartilhado entre os clientes.
+
+        :param kwargs: demais parâmetros do :class:`CorreiosSROClient`
+        """
+        prototype = CorreiosSROClient(affiliation_id, password, **kwargs)
+        kwargs = dict(kwargs, instrumentation=prototype.instrumentation)
+        return cls(
+            lambda: CorreiosSROClient(affiliation_id, password, client=clone_client(prototype.client), **kwargs),
+            maxsize, timeout, idle_timeout,
+        )
+
+    def _evict(self, now):
+        if self.idle_timeout is None:
+            return
+        expired = [item for item in self._idle if now - item[1] > self.idle_timeout]
+        if expired:
+            self._idle = [item for item in self._idle if now - item[1] <= self.idle_timeout]
+            self.size -= len(expired)
+            self.counters['evicted'] += len(expired)
+
+    def checkout(self, timeout=None):
+        """
+        :param timeout: Tempo máximo de espera em segundos, por padrão ``timeout`` do pool
+        :return: cliente livre, que deve ser devolvido com ``checkin``
+        :raises: PoolTimeout
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.time()
+        with self._condition:
+            self._evict(start)
+            while not self._idle and self.size >= self.maxsize:
+                remaining = start + timeout - time.time()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise PoolTimeout('no client available after %.3fs' % timeout)
+                self.waiting += 1
+                try:
+                    self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+            self.counters['checkouts'] += 1
+            self.wait_time.observe(time.time() - start)
+            if self._idle:
+                return self._idle.pop()[0]
+            self.size += 1
+
+        try:
+            client = self.factory()
+        except Exception:
+            with self._condition:
+                self.size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self.counters['created'] += 1
+        return client
+
+    def checkin(self, client):
+        with self._condition:
+            self._idle.append((client, time.time()))
+            self._condition.notify()
+
+    def discard(self, client):
+        """
+        Descarta um cliente retirado do pool em vez de devolvê-lo, ex: após um erro inesperado
+        """
+        with self._condition:
+            self.size -= 1
+            self.counters['discarded'] += 1
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def client(self, timeout=None):
+        """
+        Retira um cliente do pool durante o bloco ``with``. O cliente volta ao pool ao fim do bloco, inclusive
+        após SOAP Faults e erros de validação; é descartado apenas após erros de transporte ou de protocolo (ou
+        interrupções), que podem deixar o estado do cliente suds inválido
+        """
+        client = self.checkout(timeout)
+        try:
+            yield client
+        except BaseException as e:
+            if _is_broken(e):
+                self.discard(client)
+            else:
+                self.checkin(client)
+            raise
+        self.checkin(client)
+
+    def stats(self):
+        """
+        :return: dicionário com o tamanho do pool (``size``, ``idle``, ``in_use``, ``waiting``), os contadores
+            (``checkouts``, ``created``, ``evicted``, ``discarded``, ``timeouts``) e as estatísticas do tempo de
+            espera do checkout em segundos (``wait``)
+        """
+        with self._condition:
+            data = dict(
+                size=self.size, maxsize=self.maxsize, idle=len(self._idle), in_use=self.size - len(self._idle),
+                waiting=self.waiting, wait=self.wait_time.to_dict(),
+            )
+            for name in ('checkouts', 'created', 'evicted', 'discarded', 'timeouts'):
+                data[name] = self.counters[name]
+            return data
+
+
+def _is_broken(error):
+    """
+    Verifica se o erro pode ter deixado o cliente inválido. Interrupções (KeyboardInterrupt, GeneratorExit...)
+    também descartam o cliente, já que a chamada pode ter sido cortada no meio
+    """
+    if not isinstance(error, Exception) or isinstance(error, BROKEN_CLIENT_ERRORS):
+        return True
+    # o suds levanta Exception((status, motivo)) para erros HTTP sem SOAP Fault
+    return type(error) is Exception and bool(error.args) and isinstance(error.args[0], tuple)
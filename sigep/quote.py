@@ -0,0 +1,319 @@
+# coding: utf-8
+import bisect
+import collections
+import decimal
+import logging
+import math
+import urllib
+import urllib2
+from multiprocessing.pool import ThreadPool
+
+from lxml import etree
+
+from sigep.cache import TTLCache
+from sigep.sigep_client import normalize_zip_code
+
+logger = logging.getLogger('sigep.quote')
+
+URL = 'http://ws.correios.com.br/calculador/CalcPrecoPrazo.aspx'
+TIMEOUT = 30
+
+# faixas de peso, em gramas, da tabela de preços. Acima da última o preço muda a cada quilo
+WEIGHT_BRACKETS = (300, 500) + tuple(range(1000, 30001, 1000))
+
+# erros informativos, em que o preço e o prazo são calculados normalmente (ex: área com entrega restrita)
+WARNING_CODES = frozenset(['', '0', '010', '011'])
+
+BOX_FORMAT = 1
+
+
+def weight_bracket(weight):
+    """
+    :param weight: Peso em gramas
+    :return: maior peso, em gramas, da faixa de preço em que o peso se encontra
+    """
+    weight = int(math.ceil(float(weight)))
+    index = bisect.bisect_left(WEIGHT_BRACKETS, weight)
+    if index < len(WEIGHT_BRACKETS):
+        return WEIGHT_BRACKETS[index]
+    return int(math.ceil(weight / 1000.0)) * 1000
+
+
+def _dimension(value):
+    return int(math.ceil(float(value or 0)))
+
+
+def _text(element, tag):
+    return (element.findtext(tag) or u'').strip()
+
+
+def _decimal(value):
+    return decimal.Decimal((value or u'0').replace(u'.', u'').replace(u',', u'.'))
+
+
+def parse_response(data):
+    """
+    Lê a resposta XML do CalcPrecoPrazo
+
+    :param data: corpo da resposta em bytes
+    :return: dicionário {código do serviço: resultado}
+    """
+    results = {}
+    for service in etree.fromstring(data).iter('cServico'):
+        service_code = _text(service, 'Codigo').zfill(5)
+        error_code = _text(service, 'Erro')
+        results[service_code] = {
+            'status': error_code in WARNING_CODES,
+            'service_code': service_code,
+            'price': _decimal(_text(service, 'Valor')),
+            'price_without_extras': _decimal(_text(service, 'ValorSemAdicionais')),
+            'delivery_time': int(_text(service, 'PrazoEntrega') or 0),
+            'home_delivery': _text(service, 'EntregaDomiciliar') == u'S',
+            'saturday_delivery': _text(service, 'EntregaSabado') == u'S',
+            'error_code': error_code,
+            'erro': _text(service, 'MsgErro'),
+        }
+    return results
+
+
+class PriceClient(object):
+    """
+    Cliente do serviço de cálculo de preços e prazos (CalcPrecoPrazo) dos correios
+    """
+
+    def __init__(self, company_code='', password='', url=URL, timeout=TIMEOUT):
+        """
+        :param company_code: Código administrativo, para consultar os preços do contrato
+        :param password: Senha do código administrativo
+        :param url: Endereço do serviço
+        :param timeout: Prazo em segundos de cada chamada
+        """
+        self.company_code = company_code
+        self.password = password
+        self.url = url
+        self.timeout = timeout
+
+    def build_params(self, service_codes, origin_zip_code, receiver_zip_code, weight, height=0, width=0, length=0,
+                     diameter=0, declared_value=0):
+        return [
+            ('nCdEmpresa', self.company_code),
+            ('sDsSenha', self.password),
+            ('nCdServico', ','.join(service_codes)),
+            ('sCepOrigem', normalize_zip_code(origin_zip_code)),
+            ('sCepDestino', normalize_zip_code(receiver_zip_code)),
+            ('nVlPeso', '%g' % (weight / 1000.0)),
+            ('nCdFormato', BOX_FORMAT),
+            ('nVlComprimento', length),
+            ('nVlAltura', height),
+            ('nVlLargura', width),
+            ('nVlDiametro', diameter),
+            ('sCdMaoPropria', 'N'),
+            ('nVlValorDeclarado', declared_value),
+            ('sCdAvisoRecebimento', 'N'),
+            ('StrRetorno', 'xml'),
+            ('nIndicaCalculo', 3),
+        ]
+
+    def quote(self, service_codes, origin_zip_code, receiver_zip_code, weight, height=0, width=0, length=0,
+              diameter=0, declared_value=0):
+        """
+        Calcula o preço e o prazo de vários serviços para a mesma encomenda, em uma única chamada
+
+        :param service_codes: lista de códigos de serviço
+        :param weight: Peso em gramas
+        :param height: Altura em centímetros
+        :param width: Largura em centímetros
+        :param length: Comprimento em centímetros
+        :param diameter: Diâmetro em centímetros
+        :param declared_value: Valor declarado
+        :return: dicionário {código do serviço: resultado}
+        """
+        params = self.build_params(service_codes, origin_zip_code, receiver_zip_code, weight, height, width, length,
+                                   diameter, declared_value)
+        response = urllib2.urlopen('%s?%s' % (self.url, urllib.urlencode(params)), timeout=self.timeout)
+        try:
+            return parse_response(response.read())
+        finally:
+            response.close()
+
+
+class StubPriceClient(object):
+    """
+    Substituto local do ``PriceClient``, para testes e desenvolvimento sem acesso ao serviço.
+
+    O preço é ``base + por_quilo * quilos`` e o prazo é fixo por serviço. Serviços fora de ``prices``
+    retornam o erro -1 (código de serviço inválido). As chamadas ficam registradas em ``calls``.
+    """
+    PRICES = {
+        '04014': (decimal.Decimal('20.00'), decimal.Decimal('4.50')),
+        '04510': (decimal.Decimal('15.00'), decimal.Decimal('2.50')),
+    }
+    DELIVERY_TIMES = {'04014': 2, '04510': 7}
+
+    def __init__(self, prices=None, delivery_times=None):
+        """
+        :param prices: dicionário {código do serviço: (preço base, preço por quilo)}
+        :param delivery_times: dicionário {código do serviço: prazo em dias}
+        """
+        self.prices = prices if prices is not None else self.PRICES
+        self.delivery_times = delivery_times if delivery_times is not None else self.DELIVERY_TIMES
+        self.calls = []
+
+    def quote(self, service_codes, origin_zip_code, receiver_zip_code, weight, height=0, width=0, length=0,
+              diameter=0, declared_value=0):
+        self.calls.append((tuple(service_codes), origin_zip_code, receiver_zip_code, weight))
+        results = {}
+        for service_code in service_codes:
+            # como o serviço, responde com o código de 5 dígitos
+            service_code = str(service_code).zfill(5)
+            if service_code not in self.prices:
+                results[service_code] = {
+                    'status': False,
+                    'service_code': service_code,
+                    'price': decimal.Decimal('0'),
+                    'price_without_extras': decimal.Decimal('0'),
+                    'delivery_time': 0,
+                    'home_delivery': False,
+                    'saturday_delivery': False,
+                    'error_code': '-1',
+                    'erro': u'Código de serviço inválido.',
+                }
+                continue
+            base, per_kg = self.prices[service_code]
+            price = base + per_kg * int(math.ceil(weight / 1000.0))
+            results[service_code] = {
+                'status': True,
+                'service_code': service_code,
+                'price': price,
+                'price_without_extras': price,
+                'delivery_time': self.delivery_times.get(service_code, 0),
+                'home_delivery': True,
+                'saturday_delivery': False,
+                'error_code': '0',
+                'erro': u'',
+            }
+        return results
+
+
+class QuoteEngine(TTLCache):
+    """
+    Cálculo em lote de preços e prazos, com cache em memória.
+
+    As consultas são normalizadas antes de consultar o cache: o peso é arredondado para a faixa de preço
+    (``weight_bracket``), as dimensões para centímetros inteiros e, com ``zip_code_key``, os CEPs são agrupados
+    por faixa. Consultas iguais após a normalização são feitas uma única vez, e os serviços de uma mesma
+    encomenda são calculados em uma única chamada. As chamadas que faltam no cache são feitas em paralelo.
+    """
+    TTL = 6 * 60 * 60
+    ERROR_TTL = 10 * 60
+    WORKERS = 5
+
+    def __init__(self, client, origin_zip_code=None, maxsize=10000, ttl=TTL, error_ttl=ERROR_TTL,
+                 zip_code_key=None, workers=WORKERS):
+        """
+        :param client: PriceClient, ou StubPriceClient nos testes
+        :param origin_zip_code: CEP de origem das consultas que não informam ``origin_zip_code``
+        :param maxsize: Quantidade máxima de resultados em memória
+        :param ttl: Validade em segundos dos resultados
+        :param error_ttl: Validade em segundos dos resultados com erro retornados pelo serviço
+        :param zip_code_key: Função que converte o CEP (8 dígitos) na chave do cache, por padrão o próprio CEP
+        :param workers: Quantidade máxima de chamadas simultâneas
+        """
+        super(QuoteEngine, self).__init__(maxsize, ttl=ttl, error_ttl=error_ttl)
+        self.client = client
+        self.origin_zip_code = origin_zip_code
+        self.zip_code_key = zip_code_key
+        self.workers = workers
+
+    def _zip_code_key(self, zip_code):
+        return self.zip_code_key(zip_code) if self.zip_code_key is not None else zip_code
+
+    def normalize(self, request):
+        """
+        :param request: dicionário com os campos ``service_code``, ``receiver_zip_code``, ``weight`` (gramas),
+            ``dimension_height``, ``dimension_width``, ``dimension_length`` e ``dimension_diameter``, como os
+            objetos da PLP, e opcionalmente ``origin_zip_code`` e ``declared_value``
+        :return: tupla (código do serviço, chave da encomenda, parâmetros da chamada)
+        """
+        origin_zip_code = normalize_zip_code(request.get('origin_zip_code') or self.origin_zip_code)
+        receiver_zip_code = normalize_zip_code(request['receiver_zip_code'])
+        params = {
+            'origin_zip_code': origin_zip_code,
+            'receiver_zip_code': receiver_zip_code,
+            'weight': weight_bracket(request['weight']),
+            'height': _dimension(request.get('dimension_height')),
+            'width': _dimension(request.get('dimension_width')),
+            'length': _dimension(request.get('dimension_length')),
+            'diameter': _dimension(request.get('dimension_diameter')),
+            'declared_value': '%.2f' % float(request.get('declared_value') or 0),
+        }
+        key = '%s:%s:%d:%dx%dx%dx%d:%s' % (
+            self._zip_code_key(origin_zip_code), self._zip_code_key(receiver_zip_code), params['weight'],
+            params['height'], params['width'], params['length'], params['diameter'], params['declared_value'],
+        )
+        return str(request['service_code']).zfill(5), key, params
+
+    def get_ttl(self, result):
+        return self.ttl if result['status'] else self.error_ttl
+
+    def _quote_package(self, args):
+        service_codes, params = args
+        try:
+            response = self.client.quote(service_codes, **params)
+        except Exception as e:
+            logger.error(u'quote - %s to %s failed: %r', service_codes, params['receiver_zip_code'], e)
+            return dict((service_code, {'status': False, 'service_code': service_code, 'erro': e})
+                        for service_code in service_codes)
+
+        for service_code in service_codes:
+            response.setdefault(service_code, {
+                'status': False, 'service_code': service_code, 'error_code': '', 'erro': u'Serviço sem resposta',
+            })
+        return response
+
+    def quote_many(self, requests):
+        """
+        Calcula o preço e o prazo de várias encomendas
+
+        :param requests: iterável de dicionários, veja :meth:`normalize`
+        :return: lista de resultados, na ordem das consultas. Falhas na chamada ao serviço retornam
+            {'status': False, 'service_code', 'erro': exceção} e não ficam em cache
+        """
+        normalized = [self.normalize(request) for request in requests]
+        results = {}
+        packages = collections.OrderedDict()
+        for service_code, key, params in normalized:
+            cache_key = '%s:%s' % (service_code, key)
+            if cache_key in results:
+                continue
+            result = self._get(cache_key)
+            if result is None:
+                service_codes, _ = packages.setdefault(key, ([], params))
+                if service_code not in service_codes:
+                    service_codes.append(service_code)
+            else:
+                results[cache_key] = result
+
+        if packages:
+            pool = ThreadPool(min(self.workers, len(packages)))
+            try:
+                responses = pool.map(self._quote_package, packages.values())
+            finally:
+                pool.close()
+                pool.join()
+
+            for key, response in zip(packages, responses):
+                for service_code, result in response.items():
+                    cache_key = '%s:%s' % (service_code, key)
+                    if not isinstance(result.get('erro'), Exception):
+                        self._set(cache_key, result)
+                    results[cache_key] = result
+
+        return [results['%s:%s' % (service_code, key)] for service_code, key, _ in normalized]
+
+    def quote(self, service_code, receiver_zip_code, weight, **kwargs):
+        """
+        Calcula o preço e o prazo de uma encomenda, veja :meth:`quote_many`
+        """
+        request = dict(kwargs, service_code=service_code, receiver_zip_code=receiver_zip_code, weight=weight)
+        return self.quote_many([request])[0]
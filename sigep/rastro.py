@@ -0,0 +1,166 @@
+# coding: utf-8
+import io
+
+from lxml import etree
+
+URL = 'http://webservice.correios.com.br:80/service/rastro'
+NAMESPACE = 'http://resource.webservice.correios.com.br/'
+SOAP_NAMESPACE = 'http://schemas.xmlsoap.org/soap/envelope/'
+
+MAX_OBJECTS = 5000
+
+text_type = type(u'')
+
+
+class RastroError(Exception):
+    """
+    Erro HTTP ou SOAP Fault retornado pelo serviço Rastro
+    """
+
+    def __init__(self, message, status=None):
+        super(RastroError, self).__init__(message)
+        self.status = status
+
+
+def is_range(tracking_codes):
+    """
+    Verifica se os códigos, já ordenados, formam um intervalo contínuo (mesmo prefixo e sufixo e números
+    sequenciais), que pode ser consultado com o tipo F informando apenas o primeiro e o último código
+    """
+    if len(tracking_codes) < 3:
+        return False
+    prefix, suffix = tracking_codes[0][:2], tracking_codes[0][-2:]
+    numbers = []
+    for code in tracking_codes:
+        if len(code) != 13 or code[:2] != prefix or code[-2:] != suffix or not code[2:10].isdigit():
+            return False
+        numbers.append(int(code[2:10]))
+    return numbers == list(range(numbers[0], numbers[0] + len(numbers)))
+
+
+def build_request(user, password, objects, search_type='L', last_result=False, language=101):
+    """
+    Monta o envelope SOAP do buscaEventos
+
+    :param objects: códigos de rastreio concatenados
+    :return: envelope em bytes (UTF-8)
+    """
+    envelope = etree.Element('{%s}Envelope' % SOAP_NAMESPACE, nsmap={'soapenv': SOAP_NAMESPACE, 'res': NAMESPACE})
+    body = etree.SubElement(envelope, '{%s}Body' % SOAP_NAMESPACE)
+    operation = etree.SubElement(body, '{%s}buscaEventos' % NAMESPACE)
+    for tag, value in (
+        ('usuario', user),
+        ('senha', password),
+        ('tipo', search_type),
+        ('resultado', 'U' if last_result else 'T'),
+        ('lingua', language),
+        ('objetos', objects),
+    ):
+        etree.SubElement(operation, tag).text = text_type(value)
+    return etree.tostring(envelope, xml_declaration=True, encoding='UTF-8')
+
+
+def _text(element, tag):
+    return text_type(element.findtext(tag) or u'')
+
+
+def get_destiny(event):
+    destiny = event.find('destino')
+    if destiny is None:
+        return None
+    return {
+        'local': _text(destiny, 'local'),
+        'codigo': _text(destiny, 'codigo'),
+        'cidade': _text(destiny, 'cidade'),
+        'bairro': _text(destiny, 'bairro'),
+        'uf': _text(destiny, 'uf'),
+    }
+
+
+def get_event_list(obj):
+    return [{
+        'status': _text(event, 'status'),
+        'code': _text(event, 'codigo'),
+        'type': _text(event, 'tipo'),
+        'date': _text(event, 'data'),
+        'hour': _text(event, 'hora'),
+        'description': _text(event, 'descricao'),
+        'local': _text(event, 'local'),
+        'city': _text(event, 'cidade'),
+        'uf': _text(event, 'uf'),
+        'destiny': get_destiny(event),
+    } for event in obj.iterfind('evento')]
+
+
+def get_object(obj):
+    """
+    Converte um elemento ``objeto`` no mesmo dicionário retornado por ``CorreiosSROClient.find_by_tracking_code``
+    """
+    if obj.find('erro') is not None:
+        return {
+            'status': False,
+            'tracking_code': _text(obj, 'numero'),
+            'erro': _text(obj, 'erro'),
+        }
+
+    event = obj.find('evento')
+    return {
+        'status': True,
+        'tracking_code': _text(obj, 'numero'),
+        'sigla': _text(obj, 'sigla'),
+        'name': _text(obj, 'nome'),
+        'category': _text(obj, 'categoria'),
+        'event_list': get_event_list(obj),
+        'current_status': _text(event, 'descricao') if event is not None else None,
+    }
+
+
+def parse_response(data, status=200):
+    """
+    Lê a resposta do buscaEventos
+
+    :param data: corpo da resposta HTTP em bytes
+    :param status: status HTTP da resposta
+    :return: lista de dicionários no formato de ``CorreiosSROClient.find_by_tracking_code``
+    :raises: RastroError, se a resposta for um SOAP Fault ou um erro HTTP
+    """
+    try:
+        root = etree.fromstring(data)
+    except etree.XMLSyntaxError:
+        raise RastroError(u'invalid response (HTTP {})'.format(status), status)
+
+    fault = root.find('{%s}Body/{%s}Fault' % (SOAP_NAMESPACE, SOAP_NAMESPACE))
+    if fault is not None:
+        raise RastroError(_text(fault, 'faultstring'), status)
+    if status != 200:
+        raise RastroError(u'HTTP {}'.format(status), status)
+
+    return [get_object(obj) for obj in root.iter('objeto')]
+
+
+def iter_response(source, status=200):
+    """
+    Lê a resposta do buscaEventos de forma incremental com ``iterparse``, liberando cada ``objeto`` assim que
+    ele é convertido. Indicado para respostas com muitos objetos ou com históricos longos.
+
+    :param source: corpo da resposta HTTP em bytes, ou um arquivo aberto
+    :param status: status HTTP da resposta
+    :return: gerador de dicionários no formato de ``CorreiosSROClient.find_by_tracking_code``
+    :raises: RastroError, se a resposta for um SOAP Fault ou um erro HTTP
+    """
+    if status != 200:
+        parse_response(source.read() if hasattr(source, 'read') else source, status)
+    if not hasattr(source, 'read'):
+        source = io.BytesIO(source)
+
+    fault_tag = '{%s}Fault' % SOAP_NAMESPACE
+    try:
+        for _, element in etree.iterparse(source, events=('end',), tag=('objeto', fault_tag)):
+            if element.tag == fault_tag:
+                raise RastroError(_text(element, 'faultstring'), status)
+            yield get_object(element)
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+    except etree.XMLSyntaxError:
+        raise RastroError(u'invalid response (HTTP {})'.format(status), status)
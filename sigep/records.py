@@ -0,0 +1,179 @@
+# coding: utf-8
+import datetime
+
+# quantidade máxima de textos na tabela de ``intern_text``
+MAX_STRINGS = 10000
+
+_strings = {}
+
+
+def intern_text(value):
+    """
+    Retorna uma única instância de cada texto repetido (status, UF, cidade), funciona também com unicode no
+    Python 2. A tabela é esvaziada ao atingir ``MAX_STRINGS`` textos, para não crescer indefinidamente com
+    textos pouco repetidos (ex: descrições com o nome do destinatário); os textos frequentes voltam a ser
+    compartilhados logo em seguida
+    """
+    if value is None:
+        return None
+    text = _strings.get(value)
+    if text is None:
+        if len(_strings) >= MAX_STRINGS:
+            _strings.clear()
+        text = _strings.setdefault(value, value)
+    return text
+
+
+def parse_datetime(date, hour):
+    """
+    :param date: data no formato dd/mm/aaaa
+    :param hour: hora no formato hh:mm
+    :return: datetime, ou None se a data for inválida
+    """
+    try:
+        return datetime.datetime(
+            int(date[6:10]), int(date[3:5]), int(date[0:2]),
+            int(hour[0:2]) if hour else 0, int(hour[3:5]) if hour else 0,
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+class Record(object):
+    """
+    Base dos registros, que também podem ser lidos como os dicionários equivalentes: ``event['city']``
+    """
+    __slots__ = ()
+    KEYS = ()
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        return dict((key, self[key]) for key in self.KEYS)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.to_dict())
+
+
+class Destiny(Record):
+    __slots__ = ('local', 'codigo', 'cidade', 'bairro', 'uf')
+    KEYS = __slots__
+
+    def __init__(self, local, codigo, cidade, bairro, uf):
+        self.local = intern_text(local)
+        self.codigo = codigo
+        self.cidade = intern_text(cidade)
+        self.bairro = bairro
+        self.uf = intern_text(uf)
+
+    @classmethod
+    def from_dict(cls, data):
+        if data is None:
+            return None
+        return cls(data['local'], data['codigo'], data['cidade'], data['bairro'], data['uf'])
+
+
+class Event(Record):
+    """
+    Evento de rastreio. A data e a hora são guardadas em ``datetime`` e retornadas no formato original por
+    ``date`` e ``hour``
+    """
+    __slots__ = ('status', 'code', 'type', 'datetime', 'description', 'local', 'city', 'uf', 'destiny')
+    KEYS = ('status', 'code', 'type', 'date', 'hour', 'description', 'local', 'city', 'uf', 'destiny')
+
+    def __init__(self, status, code, type, datetime, description, local, city, uf, destiny=None):
+        self.status = intern_text(status)
+        self.code = code
+        self.type = intern_text(type)
+        self.datetime = datetime
+        self.description = intern_text(description)
+        self.local = intern_text(local)
+        self.city = intern_text(city)
+        self.uf = intern_text(uf)
+        self.destiny = destiny
+
+    @property
+    def date(self):
+        if self.datetime is None:
+            return u''
+        return u'%02d/%02d/%04d' % (self.datetime.day, self.datetime.month, self.datetime.year)
+
+    @property
+    def hour(self):
+        if self.datetime is None:
+            return u''
+        return u'%02d:%02d' % (self.datetime.hour, self.datetime.minute)
+
+    def to_dict(self):
+        data = super(Event, self).to_dict()
+        if self.destiny is not None:
+            data['destiny'] = self.destiny.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['status'], data['code'], data['type'], parse_datetime(data['date'], data['hour']),
+            data['description'], data['local'], data['city'], data['uf'], Destiny.from_dict(data.get('destiny')),
+        )
+
+
+class TrackedObject(Record):
+    """
+    Objeto rastreado, no formato de ``CorreiosSROClient.find_by_tracking_code``. Objetos com erro têm apenas
+    ``status``, ``tracking_code`` e ``erro``
+    """
+    __slots__ = ('status', 'tracking_code', 'sigla', 'name', 'category', 'event_list', 'erro')
+    KEYS = ('status', 'tracking_code', 'sigla', 'name', 'category', 'event_list', 'current_status')
+    ERROR_KEYS = ('status', 'tracking_code', 'erro')
+
+    def __init__(self, status, tracking_code, sigla=None, name=None, category=None, event_list=(), erro=None):
+        self.status = status
+        self.tracking_code = tracking_code
+        self.sigla = intern_text(sigla)
+        self.name = intern_text(name)
+        self.category = intern_text(category)
+        self.event_list = tuple(event_list)
+        self.erro = erro
+
+    @property
+    def current_status(self):
+        return self.event_list[0].description if self.event_list else None
+
+    def __getitem__(self, key):
+        if key not in (self.KEYS if self.status else self.ERROR_KEYS):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def to_dict(self):
+        if not self.status:
+            return dict((key, self[key]) for key in self.ERROR_KEYS)
+        data = super(TrackedObject, self).to_dict()
+        data['event_list'] = [event.to_dict() for event in self.event_list]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data['status']:
+            return cls(False, data['tracking_code'], erro=data['erro'])
+        return cls(
+            True, data['tracking_code'], data['sigla'], data['name'], data['category'],
+            [Event.from_dict(event) for event in data['event_list']],
+        )
@@ -0,0 +1,108 @@
+# coding: utf-8
+import threading
+
+from sigep import wsdl
+from sigep.correios_client import CorreiosSROClient
+from sigep.sigep_client import Sigep
+
+
+class ClientRegistry(object):
+    """
+    Clientes de vários contratos que compartilham o WSDL, lido uma única vez por endpoint.
+
+    Os dados do contrato (credenciais, cartão, remetente) são enviados em cada operação, então cada contrato
+    recebe apenas uma instância leve de :class:`Sigep` ou :class:`CorreiosSROClient` com uma cópia do cliente
+    suds do endpoint (veja :func:`sigep.wsdl.clone_client`). O cliente suds guarda o estado da chamada em
+    andamento, então contratos diferentes podem ser usados ao mesmo tempo, mas cada instância deve ser usada
+    por uma thread por vez::
+
+        registry = ClientRegistry(wsdl_cache=wsdl.file_cache(), transport=PooledTransport())
+        registry.register('loja-1', sigep=credenciais_1, sro={'affiliation_id': 'usuario', 'password': 'senha'})
+        registry.sigep('loja-1').check_service_available('04162', '01310100')
+    """
+
+    def __init__(self, sandbox=False, wsdl_snapshot=False, wsdl_cache=None, transport=None, instrumentation=None,
+                 resilience=None, sigep_url=None, rastro_url=None, sigep_options=None, sro_options=None):
+        """
+        :param sigep_options: demais parâmetros repassados a todos os :class:`Sigep`, ex: ``template``
+        :param sro_options: demais parâmetros repassados a todos os :class:`CorreiosSROClient`, ex: ``fast_parse``
+        """
+        self.sigep_url = sigep_url or (Sigep.SIGEP_SANDBOX_URL if sandbox else Sigep.SIGEP_PRODUCTION_URL)
+        self.rastro_url = rastro_url or CorreiosSROClient.RASTRO_URL
+        self.wsdl_snapshot = wsdl_snapshot
+        self.wsdl_cache = wsdl_cache
+        self.transport = transport
+        self.instrumentation = instrumentation
+        self.resilience = resilience
+        self.options = {Sigep: sigep_options or {}, CorreiosSROClient: sro_options or {}}
+        self.tenants = {}
+        self._clients = {}
+        self._handles = {}
+        self._lock = threading.Lock()
+
+    def _client(self, factory, url):
+        key = (factory, url)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = factory.build_client(
+                        url, self.wsdl_snapshot, self.wsdl_cache, self.transport, self.instrumentation,
+                    )
+        return client
+
+    def register(self, tenant, sigep=None, sro=None):
+        """
+        :param sigep: parâmetros do contrato do :class:`Sigep` (contract, cnpj, user, password, card, ...)
+        :param sro: parâmetros do :class:`CorreiosSROClient` (affiliation_id e password)
+        """
+        with self._lock:
+            self.tenants[tenant] = {'sigep': sigep, 'sro': sro}
+            self._handles.pop((tenant, Sigep), None)
+            self._handles.pop((tenant, CorreiosSROClient), None)
+
+    def unregister(self, tenant):
+        with self._lock:
+            self.tenants.pop(tenant, None)
+            self._handles.pop((tenant, Sigep), None)
+            self._handles.pop((tenant, CorreiosSROClient), None)
+
+    def _handle(self, tenant, factory, name, url):
+        key = (tenant, factory)
+        while True:
+            handle = self._handles.get(key)
+            if handle is not None:
+                return handle
+
+            with self._lock:
+                entry = self.tenants[tenant]
+            params = entry[name]
+            if params is None:
+                raise KeyError('%s has no %s credentials' % (tenant, name))
+            kwargs = dict(self.options[factory], **params)
+            if factory is Sigep:
+                kwargs['url'] = url
+            handle = factory(
+                client=wsdl.clone_client(self._client(factory, url)), instrumentation=self.instrumentation,
+                resilience=self.resilience, **kwargs
+            )
+            with self._lock:
+                # o contrato pode ter sido registrado de novo enquanto o handle era criado: um handle com os
+                # dados antigos não é guardado e a criação é refeita com os dados atuais
+                if self.tenants.get(tenant) is entry:
+                    return self._handles.setdefault(key, handle)
+
+    def sigep(self, tenant):
+        """
+        :return: :class:`Sigep` do contrato, criado na primeira chamada
+        :raises: KeyError, se o contrato não foi registrado
+        """
+        return self._handle(tenant, Sigep, 'sigep', self.sigep_url)
+
+    def sro(self, tenant):
+        """
+        :return: :class:`CorreiosSROClient` do contrato, criado na primeira chamada
+        :raises: KeyError, se o contrato não foi registrado
+        """
+        return self._handle(tenant, CorreiosSROClient, 'sro', self.rastro_url)
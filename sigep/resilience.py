@@ -0,0 +1,309 @@
+# coding: utf-8
+"""
+Prazos por chamada, novas tentativas com espera aleatória, circuit breaker por endpoint e requisições
+duplicadas (hedged) para as consultas aos correios.
+
+Operações que alteram dados no SIGEP (ex: ``fechaPlpVariosServicos`` e ``solicitaEtiquetas``) são executadas
+uma única vez: uma falha de rede não indica se a operação foi ou não concluída no servidor.
+"""
+import Queue
+import collections
+import contextlib
+import httplib
+import logging
+import random
+import socket
+import threading
+import time
+import urllib2
+
+from suds.transport import TransportError
+
+from sigep import wsdl
+from sigep.rastro import RastroError
+
+logger = logging.getLogger('sigep.resilience')
+
+# operações somente de consulta, que podem ser repetidas e duplicadas
+IDEMPOTENT = frozenset([
+    'buscaServicos', 'verificaDisponibilidadeServico', 'buscaCliente', 'solicitaPLP',
+    'geraDigitoVerificadorEtiquetas', 'buscaEventos',
+])
+
+RETRY_STATUSES = (502, 503, 504)
+
+# amostras de latência por operação usadas no cálculo do atraso da requisição duplicada
+HEDGE_SAMPLES = 100
+HEDGE_MIN_SAMPLES = 20
+
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    """
+    O prazo da chamada terminou antes da resposta
+    """
+
+
+class CircuitOpenError(Exception):
+    """
+    O circuit breaker do endpoint está aberto e a chamada não foi enviada
+    """
+
+
+def remaining():
+    """
+    :return: segundos restantes do prazo em andamento na thread atual, ou None se não há prazo
+    """
+    return _local.deadline - time.time() if getattr(_local, 'deadline', None) is not None else None
+
+
+@contextlib.contextmanager
+def deadline_at(at):
+    """
+    Define o instante limite das chamadas feitas dentro do bloco. Um prazo interno nunca estende um prazo
+    externo mais curto.
+    """
+    previous = getattr(_local, 'deadline', None)
+    if at is not None and previous is not None:
+        at = min(at, previous)
+    _local.deadline = previous if at is None else at
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def deadline(seconds):
+    """
+    Prazo, em segundos, para as chamadas feitas dentro do bloco, ex::
+
+        with deadline(2):
+            sigep.check_service_available('04162', '01310100')
+            sro.find_by_tracking_code('PC000000014BR')
+    """
+    return deadline_at(time.time() + seconds if seconds is not None else None)
+
+
+def is_retryable(error):
+    """
+    Verifica se o erro é transitório (rede, prazo ou indisponibilidade do serviço). SOAP Faults são erros de
+    negócio e não são repetidos.
+    """
+    if isinstance(error, (DeadlineExceeded, socket.error, httplib.HTTPException, urllib2.URLError)):
+        return True
+    if isinstance(error, TransportError):
+        return error.httpcode is None or error.httpcode in RETRY_STATUSES
+    if isinstance(error, RastroError):
+        return error.status in RETRY_STATUSES
+    # o suds levanta Exception((status, motivo)) para erros HTTP sem SOAP Fault
+    if type(error) is Exception and error.args and isinstance(error.args[0], tuple):
+        return error.args[0][0] in RETRY_STATUSES
+    return False
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker de um endpoint. Abre quando a proporção de falhas nas últimas ``window`` chamadas passa de
+    ``failure_rate``; aberto, recusa as chamadas por ``reset_timeout`` segundos e depois deixa passar uma
+    única chamada de teste, que fecha o circuito se for bem sucedida.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate=0.5, window=20, min_calls=10, reset_timeout=30):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.opened_at = None
+        self._outcomes = collections.deque(maxlen=window)
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial = False
+            if self.state == self.HALF_OPEN:
+                if self._trial:
+                    return False
+                self._trial = True
+                return True
+            return self.state == self.CLOSED
+
+    def record(self, success):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if success:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (self.state == self.CLOSED and len(self._outcomes) >= self.min_calls and
+                    failures >= self.failure_rate * len(self._outcomes)):
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.time()
+        self._outcomes.clear()
+
+
+class Policy(object):
+    """
+    Política de execução das operações SOAP, compartilhável entre clientes e threads.
+
+    Cada chamada tem prazo de ``timeout`` segundos, incluindo as novas tentativas. Operações em ``idempotent``
+    são repetidas até ``attempts`` vezes após erros transitórios, com espera aleatória entre 0 e
+    ``backoff * 2 ** tentativa`` (limitada a ``max_backoff``). Com ``hedge``, uma segunda requisição é enviada
+    quando a primeira demora mais que o percentil ``hedge_quantile`` das latências recentes da operação, e a
+    primeira resposta é usada.
+
+    O prazo é garantido para as operações idempotentes, executadas em threads. As demais são executadas na
+    thread atual e o prazo limita apenas os timeouts de conexão e leitura do
+    :class:`sigep.transport.PooledTransport`.
+    """
+
+    def __init__(self, timeout=None, attempts=3, backoff=0.1, max_backoff=2, hedge=False, hedge_quantile=95,
+                 idempotent=IDEMPOTENT, breaker=CircuitBreaker, seed=None):
+        """
+        :param breaker: função que cria o :class:`CircuitBreaker` de cada endpoint, ou None para desativar
+        """
+        self.timeout = timeout
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.idempotent = idempotent
+        self.breaker = breaker
+        self.breakers = {}
+        self.random = random.Random(seed)
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def get_breaker(self, endpoint):
+        if self.breaker is None:
+            return None
+        with self._lock:
+            breaker = self.breakers.get(endpoint)
+            if breaker is None:
+                breaker = self.breakers[endpoint] = self.breaker()
+            return breaker
+
+    def get_backoff(self, attempt):
+        with self._lock:
+            return self.random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def observe(self, operation, duration):
+        with self._lock:
+            samples = self._latencies.get(operation)
+            if samples is None:
+                samples = self._latencies[operation] = collections.deque(maxlen=HEDGE_SAMPLES)
+            samples.append(duration)
+
+    def get_hedge_delay(self, operation):
+        """
+        :return: atraso da requisição duplicada em segundos, ou None enquanto não há amostras suficientes
+        """
+        with self._lock:
+            samples = sorted(self._latencies.get(operation, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * self.hedge_quantile / 100.0))]
+
+    def call(self, endpoint, operation, function):
+        """
+        Executa ``function``, que faz uma chamada a ``operation`` em ``endpoint``
+
+        :raises: CircuitOpenError, DeadlineExceeded ou o erro da última tentativa
+        """
+        breaker = self.get_breaker(endpoint)
+        idempotent = operation in self.idempotent
+        attempts = self.attempts if idempotent else 1
+
+        with deadline(self.timeout):
+            at = getattr(_local, 'deadline', None)
+            for attempt in range(attempts):
+                if breaker is not None and not breaker.allow():
+                    raise CircuitOpenError(endpoint)
+                if at is not None and at <= time.time():
+                    raise DeadlineExceeded(operation)
+
+                start = time.time()
+                try:
+                    result = self._attempt(operation, function, at) if idempotent else function()
+                except Exception as e:
+                    retryable = is_retryable(e)
+                    if breaker is not None:
+                        breaker.record(not retryable)
+                    if not retryable or attempt == attempts - 1:
+                        raise
+                    delay = self.get_backoff(attempt)
+                    if at is not None:
+                        delay = min(delay, max(0, at - time.time()))
+                    logger.warning(u'%s failed (%r), retrying in %.3fs', operation, e, delay)
+                    time.sleep(delay)
+                    continue
+
+                if breaker is not None:
+                    breaker.record(True)
+                self.observe(operation, time.time() - start)
+                return result
+
+    def _spawn(self, function, at, results):
+        def run():
+            # a tentativa pode continuar depois do prazo, junto com a chamada seguinte, ou em paralelo com a
+            # requisição de reserva: cada thread usa uma cópia própria do cliente suds
+            wsdl.start_worker()
+            with deadline_at(at):
+                try:
+                    results.put((True, function()))
+                except Exception as e:
+                    results.put((False, e))
+
+        thread = threading.Thread(target=run, name='sigep-attempt')
+        thread.daemon = True
+        thread.start()
+
+    def _attempt(self, operation, function, at):
+        hedge_delay = self.get_hedge_delay(operation) if self.hedge else None
+        if at is None and hedge_delay is None:
+            return function()
+
+        results = Queue.Queue()
+        start = time.time()
+        self._spawn(function, at, results)
+        pending = 1
+        error = None
+        while pending:
+            timeouts = []
+            if at is not None:
+                timeouts.append(at - time.time())
+            if hedge_delay is not None:
+                timeouts.append(start + hedge_delay - time.time())
+            try:
+                success, value = results.get(timeout=max(0, min(timeouts)) if timeouts else None)
+            except Queue.Empty:
+                if hedge_delay is not None and (at is None or at > time.time()):
+                    logger.debug(u'%s slower than %.3fs, sending hedged request', operation, hedge_delay)
+                    self._spawn(function, at, results)
+                    pending += 1
+                    hedge_delay = None
+                    continue
+                raise DeadlineExceeded(operation)
+
+            pending -= 1
+            if success:
+                return value
+            error = value
+            if not is_retryable(error):
+                break
+        raise error
@@ -0,0 +1,82 @@
+# coding: utf-8
+import os
+import threading
+
+from lxml import etree
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PLP_SCHEMA = 'xml/schema.xsd'
+
+
+class SchemaRegistry(object):
+    """
+    Registro de schemas XSD compilados uma única vez por processo.
+
+    O ``etree.XMLSchema`` guarda o log de erros da última validação no próprio objeto, por isso cada
+    schema possui um lock próprio e pode ser compartilhado entre threads.
+    """
+
+    def __init__(self):
+        self._schemas = {}
+        self._lock = threading.Lock()
+
+    def _get_path(self, path):
+        if os.path.isabs(path):
+            return path
+        return os.path.join(BASE_DIR, path)
+
+    def get(self, path=PLP_SCHEMA):
+        """
+        Retorna o schema compilado, compilando-o na primeira chamada
+
+        :param path: Caminho do XSD, absoluto ou relativo ao pacote sigep
+        :return: tupla (etree.XMLSchema, threading.Lock)
+        """
+        path = self._get_path(path)
+        entry = self._schemas.get(path)
+        if entry is None:
+            with self._lock:
+                entry = self._schemas.get(path)
+                if entry is None:
+                    entry = (etree.XMLSchema(etree=etree.parse(path)), threading.Lock())
+                    self._schemas[path] = entry
+        return entry
+
+    def preload(self, *paths):
+        """
+        Compila os schemas antecipadamente, ex: no import ou no início de um worker
+
+        :param paths: Caminhos dos XSDs, por padrão o schema da PLP
+        """
+        for path in paths or (PLP_SCHEMA,):
+            self.get(path)
+
+    def clear(self):
+        with self._lock:
+            self._schemas.clear()
+
+    def validate(self, xml, path=PLP_SCHEMA):
+        """
+        Valida um XML contra o schema informado, se for valido não retorna nada
+
+        :param xml: bytes com o XML, ou documento já parseado (_Element ou _ElementTree)
+        :param path: Caminho do XSD
+        :return:
+        :raises: etree.DocumentInvalid, se inválido
+        """
+        if isinstance(xml, bytes):
+            xml = etree.fromstring(xml)
+        schema, lock = self.get(path)
+        with lock:
+            schema.assertValid(xml)
+
+
+registry = SchemaRegistry()
+
+
+def preload(*paths):
+    registry.preload(*paths)
+
+
+def validate(xml, path=PLP_SCHEMA):
+    registry.validate(xml, path)
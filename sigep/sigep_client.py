@@ -1,24 +1,36 @@
 # coding: utf-8
-import StringIO
+import collections
+import itertools
 import logging
-import os
 
-import jinja2
-from lxml import etree
 from suds import WebFault
 from suds.client import Client
 
+from sigep import labels, metrics, plp, schema, templates, wsdl
+from sigep.cache import TTLCache
+
 logger = logging.getLogger('sigep.webservice')
 
 
+def normalize_zip_code(zip_code):
+    """
+    :return: CEP apenas com os 8 dígitos, ex: 01310-100 -> 01310100
+    """
+    return zip_code.replace('-', '').strip().rjust(8, '0')
+
+
 class Sigep(object):
     SIGEP_SANDBOX_URL = 'https://apphom.correios.com.br/SigepMasterJPA/AtendeClienteService/AtendeCliente?wsdl'
     SIGEP_PRODUCTION_URL = 'https://apps.correios.com.br/SigepMasterJPA/AtendeClienteService/AtendeCliente?wsdl'
     TEMPLATE = 'xml/plp.xml'
     TEMPLATE_XSD = 'xml/schema.xsd'
+    PLP_SHARD_SIZE = 500
+    PLP_WORKERS = 4
+    AVAILABILITY_WORKERS = 5
 
     def __init__(self, contract, cnpj, user, password, card, origin_zipcode, admin_code, regional_code, sender_info,
-                 sandbox=False):
+                 sandbox=False, template=None, wsdl_snapshot=False, wsdl_cache=None,
+                 transport=None, instrumentation=None, url=None, resilience=None, client=None):
         """
         Cliente para o SIGEP (Sistema de Gerenciamento de Postagens) dos correios
 
@@ -32,8 +44,19 @@ class Sigep(object):
         :param regional_code:
         :param sender_info: (name, street, number, complement, neighborhood, zipcode, city, state, phone, fax, email)
         :param sandbox: Modo sandbox, para testes
+        :param template: Template da PLP, absoluto ou relativo ao pacote sigep. Por padrão ``TEMPLATE``
+        :param wsdl_snapshot: Usa o WSDL distribuído com o pacote em vez de baixá-lo dos correios
+        :param wsdl_cache: Cache dos documentos WSDL/XSD, veja :func:`sigep.wsdl.file_cache`
+        :param transport: Transporte do suds, ex: :class:`sigep.transport.PooledTransport`
+        :param instrumentation: :class:`sigep.metrics.Instrumentation` com os ganchos chamados em cada operação
+        :param url: Endereço do WSDL, ex: o de um :class:`sigep.mock_server.MockServer`. Por padrão o de
+            produção ou, com ``sandbox``, o de homologação
+        :param resilience: :class:`sigep.resilience.Policy` com prazo, novas tentativas e circuit breaker das
+            operações. Operações que alteram dados, como o fechamento da PLP, nunca são repetidas
+        :param client: Cliente suds já criado com :meth:`build_client`, compartilhado entre instâncias. Nesse
+            caso ``wsdl_snapshot``, ``wsdl_cache`` e ``transport`` são ignorados, veja :mod:`sigep.registry`
         """
-        self.url = self.SIGEP_SANDBOX_URL if sandbox else self.SIGEP_PRODUCTION_URL
+        self.url = url or (self.SIGEP_SANDBOX_URL if sandbox else self.SIGEP_PRODUCTION_URL)
         self.contract = contract
         self.cnpj = cnpj
         self.user = user
@@ -43,8 +66,64 @@ class Sigep(object):
         self.admin_code = admin_code
         self.regional_code = regional_code
         self.sender_info = sender_info
+        self.template = template or self.TEMPLATE
+
+        self.client = client or self.build_client(self.url, wsdl_snapshot, wsdl_cache, transport, instrumentation)
+        self.instrumentation = instrumentation or metrics.Instrumentation()
+        self.resilience = resilience
+
+    @classmethod
+    def build_client(cls, url, wsdl_snapshot=False, wsdl_cache=None, transport=None, instrumentation=None):
+        """
+        Cria o cliente suds do SIGEP. O cliente não guarda dados do contrato, que são enviados em cada operação,
+        e pode ser compartilhado entre instâncias de contratos diferentes.
 
-        self.client = Client(self.url, location=self.url.replace('?wsdl', ''))
+        :param url: Endereço do WSDL
+        """
+        wsdl_url = wsdl.snapshot_url(wsdl.SIGEP_WSDL) if wsdl_snapshot else url
+        options = {'location': url.replace('?wsdl', '')}
+        if wsdl_cache is not None:
+            options['cache'] = wsdl_cache
+        if instrumentation is not None:
+            transport = metrics.instrument_transport(transport, instrumentation)
+        if transport is not None:
+            options['transport'] = transport
+        return Client(wsdl_url, **options)
+
+    @classmethod
+    def preload(cls, template=None):
+        """
+        Compila antecipadamente os recursos usados na geração da PLP, para ser chamado no import ou no início
+        de um worker: o schema de validação e, se informado, o template customizado. O template padrão é
+        escrito diretamente por :mod:`sigep.plp`, sem Jinja2, e não precisa ser compilado.
+
+        :param template: Template customizado passado ao ``Sigep``
+        """
+        schema.preload(cls.TEMPLATE_XSD)
+        if template is not None and template != templates.PLP_TEMPLATE:
+            templates.preload(template)
+
+    def _service(self, operation, **kwargs):
+        """
+        Chama uma operação SOAP, medindo a fase ``parse`` e, com um transporte instrumentado, a fase ``network``.
+        Com ``resilience`` a chamada é feita pela política. As tentativas fazem parte da chamada em andamento,
+        ex: a de ``create_plp``, mesmo quando executadas em outra thread; sem ela cada tentativa é medida
+        separadamente.
+        """
+        if self.resilience is None:
+            return self._call(operation, kwargs)
+        function = self.instrumentation.bind(lambda: self._call(operation, kwargs))
+        return self.resilience.call(self.url, operation, function)
+
+    def _call(self, operation, kwargs):
+        call = self.instrumentation.current()
+        if call is not None and call.operation == operation:
+            with call.phase('parse'):
+                return getattr(wsdl.thread_client(self.client).service, operation)(**kwargs)
+
+        with self.instrumentation.call(operation) as call:
+            with call.phase('parse'):
+                return getattr(wsdl.thread_client(self.client).service, operation)(**kwargs)
 
     def _remove_dv_tracking_code(self, tracking_code):
         """
@@ -58,17 +137,13 @@ class Sigep(object):
         """
         Valida se o XML da PLP é valido baseado no schema.xsd se for valido não retorna nada
 
-        :param xml: XML que contém a PLP gerada
+        O schema é compilado uma única vez por processo, veja :mod:`sigep.schema`.
+
+        :param xml: XML que contém a PLP gerada, em bytes ou já parseado
         :return:
-        :raises: AssertException, se inválido
+        :raises: DocumentInvalid, se inválido
         """
-        filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), self.TEMPLATE_XSD)
-
-        parsed_file = etree.parse(filename)
-        schema = etree.XMLSchema(etree=parsed_file)
-
-        doc = etree.parse(StringIO.StringIO(xml))
-        schema.assertValid(doc)
+        schema.validate(xml, self.TEMPLATE_XSD)
 
     def request_xml_plp(self, plp_number, tracking_code_list):
         """
@@ -78,16 +153,14 @@ class Sigep(object):
         :param tracking_code_list: lista de códigos de rastreio
         :return: XML contendo as PLPs geradas para os códigos de rastreio informados
         """
-        plp = self.client.service.solicitaPLP(
+        plp = self._service(
+            'solicitaPLP',
             numEtiqueta=tracking_code_list,
             idPlpMaster=plp_number,
             usuario=self.user,
             senha=self.password
         )
-        logger.info(u'request_xml_plp for PLP {} and tracking_code_list: {}'.format(
-            plp_number,
-            tracking_code_list,
-        ))
+        logger.info(u'request_xml_plp for PLP %s and tracking_code_list: %s', plp_number, tracking_code_list)
         return plp
 
     def search_service(self):
@@ -96,7 +169,8 @@ class Sigep(object):
 
         :return: XML com os serviços disponíveis para o contrato
         """
-        return self.client.service.buscaServicos(
+        return self._service(
+            'buscaServicos',
             idContrato=self.contract,
             idCartaoPostagem=self.card,
             usuario=self.user,
@@ -111,11 +185,11 @@ class Sigep(object):
         :param zip_code: CEP
         :return: {'mensagem_erro': 'mensagem do erro'}, ou False, se offline
         """
-        zip_code = zip_code.replace('-', '')
-        zip_code = zip_code.rjust(8, '0')
+        zip_code = normalize_zip_code(zip_code)
 
         try:
-            response = self.client.service.verificaDisponibilidadeServico(
+            response = self._service(
+                'verificaDisponibilidadeServico',
                 codAdministrativo=self.admin_code,
                 cepOrigem=self.origin_zipcode,
                 usuario=self.user,
@@ -123,24 +197,54 @@ class Sigep(object):
                 cepDestino=zip_code,
                 numeroServico=code,
             )
-            logger.info(u'check_service_available for code {0} and zip_code {1}: {2}'.format(
-                code,
-                zip_code,
-                response,
-            ))
+            logger.info(u'check_service_available for code %s and zip_code %s: %s', code, zip_code, response)
             return response
 
         except WebFault as e:
-            logger.error(u'check_service_available WebFault Exception: {} for code {}'.format(e, code))
+            logger.error(u'check_service_available WebFault Exception: %s for code %s', e, code)
             return False
 
+    def _check_pair(self, pair):
+        return pair, self.check_service_available(*pair)
+
+    def check_availability_many(self, pairs, workers=None):
+        """
+        Consulta a disponibilidade de vários pares (serviço, CEP) em paralelo, uma única vez por par.
+        Cada thread usa uma cópia própria do cliente suds, veja :func:`sigep.wsdl.thread_client`.
+
+        :param pairs: iterável de tuplas (código do serviço, CEP)
+        :param workers: Quantidade máxima de consultas simultâneas, por padrão ``AVAILABILITY_WORKERS``
+        :return: dicionário {(código do serviço, CEP): resposta de ``check_service_available``}
+        """
+        pairs = list(collections.OrderedDict.fromkeys(
+            (code, normalize_zip_code(zip_code)) for code, zip_code in pairs
+        ))
+        if not pairs:
+            return {}
+
+        pool = wsdl.worker_pool(min(workers or self.AVAILABILITY_WORKERS, len(pairs)))
+        try:
+            return dict(pool.map(self._check_pair, pairs))
+        finally:
+            pool.close()
+            pool.join()
+
+    def check_availability_matrix(self, codes, zip_codes, workers=None):
+        """
+        Consulta a disponibilidade de todos os serviços para todos os CEPs
+
+        :return: dicionário {(código do serviço, CEP): resposta de ``check_service_available``}
+        """
+        return self.check_availability_many(itertools.product(codes, zip_codes), workers=workers)
+
     def get_client_data(self):
         """
         Busca dados do usuário no SIGEP
 
         :return: XML contendo informações dos contratos do cliente
         """
-        return self.client.service.buscaCliente(
+        return self._service(
+            'buscaCliente',
             idContrato=self.contract,
             idCartaoPostagem=self.card,
             usuario=self.user,
@@ -153,9 +257,10 @@ class Sigep(object):
 
         :param service_id: ID do serviço (PAC, SEDEX)
         :param amount: Quantidade de etiquetas a serem geradas
-        :return: lista com as etiquetas já com o digito verificador.
+        :return: lista com as etiquetas sem o dígito verificador, com o intervalo retornado já expandido
         """
-        post = self.client.service.solicitaEtiquetas(
+        post = self._service(
+            'solicitaEtiquetas',
             tipoDestinatario='C',
             identificador=self.cnpj,
             idServico=service_id,
@@ -163,11 +268,22 @@ class Sigep(object):
             senha=self.password,
             qtdEtiquetas=amount,
         )
-        code = post.split(',')
+        code = labels.parse_labels(post)
         if amount == 1:
             code = [code[0]]
         return code
 
+    def request_new_tracking_codes(self, service_id, amount=1):
+        """
+        Solicita novos códigos de rastreio e calcula localmente o dígito verificador, com uma única chamada
+        ao SIGEP para qualquer quantidade
+
+        :param service_id: ID do serviço (PAC, SEDEX)
+        :param amount: Quantidade de etiquetas a serem geradas
+        :return: lista com os códigos de rastreio com dígito verificador
+        """
+        return labels.add_verification_digits(self.request_tracking_codes(service_id, amount))
+
     def generate_verification_code(self, tracking_code):
         """
         Gera dígito verificador para um determinado código de rastreio
@@ -175,31 +291,72 @@ class Sigep(object):
         :param tracking_code: Código de rastreio sem digito verificador
         :return: Código de rastreio com digito verificador
         """
-        verification = self.client.service.geraDigitoVerificadorEtiquetas(
+        verification = self._service(
+            'geraDigitoVerificadorEtiquetas',
             usuario=self.user,
             senha=self.password,
             etiquetas=tracking_code,
         )
         return tracking_code.replace(' ', str(verification[0]))
 
+    def generate_verification_codes(self, tracking_codes):
+        """
+        Gera pelo SIGEP os dígitos verificadores de várias etiquetas em uma única chamada
+
+        :param tracking_codes: lista de etiquetas sem dígito verificador
+        :return: lista com os códigos de rastreio com dígito verificador, na mesma ordem
+        """
+        verification = self._service(
+            'geraDigitoVerificadorEtiquetas',
+            usuario=self.user,
+            senha=self.password,
+            etiquetas=tracking_codes,
+        )
+        return [code.replace(' ', str(digit)) for code, digit in zip(tracking_codes, verification)]
+
+    def check_verification_codes(self, tracking_codes):
+        """
+        Compara o dígito verificador calculado localmente com o gerado pelo SIGEP
+
+        :param tracking_codes: lista de etiquetas sem dígito verificador
+        :return: lista de tuplas (calculado localmente, gerado pelo SIGEP) das etiquetas divergentes
+        """
+        local = labels.add_verification_digits(tracking_codes)
+        remote = self.generate_verification_codes(tracking_codes)
+        return [(a, b) for a, b in zip(local, remote) if a != b]
+
     def get_new_tracking_code(self, service_id):
         """
-        Utiliza os serviços do SIGEP para gerar um código de rastreio com dígito verificador
+        Utiliza os serviços do SIGEP para gerar um código de rastreio com dígito verificador. O dígito é
+        calculado localmente quando a etiqueta está no formato padrão.
 
         :param service_id: ID do serviço (PAC, SEDEX)
         :return: Código de rastreio com dígito verificador
         """
         code = self.request_tracking_codes(service_id=service_id)
+        if labels.is_label(code[0]):
+            return labels.add_verification_digit(code[0])
         return self.generate_verification_code(code[0])
 
-    def create_plp(self, intern_plp_number, object_list):
+    def _render_plp(self, object_list):
         """
-        Gera uma nova PLP (Pré Lista de Postagem)
+        Gera o XML da PLP. O template padrão é escrito de forma incremental por :mod:`sigep.plp`, templates
+        customizados são renderizados pelo Jinja2 e compactados.
 
-        :param intern_plp_number: Número de controle interno sequêncial para a geração da PLP
-        :param object_list:
-        :return:
+        :param object_list: iterável com os objetos da PLP
+        :return: tupla (XML em bytes, lista de códigos de rastreio com dígito)
         """
+        if self.template == templates.PLP_TEMPLATE:
+            return plp.build_plp(
+                card=self.card,
+                contract=self.contract,
+                regional_code=self.regional_code,
+                admin_code=self.admin_code,
+                sender_info=self.sender_info,
+                object_list=object_list,
+            )
+
+        object_list = list(object_list)
         data = {
             'card': self.card,
             'contract': self.contract,
@@ -209,39 +366,172 @@ class Sigep(object):
             'object_list': object_list,
         }
 
-        template_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), self.TEMPLATE)
-        path, filename = os.path.split(template_path)
-        xml = jinja2.Environment(loader=jinja2.FileSystemLoader(path or './')).get_template(filename).render(data)
+        xml = templates.render(self.template, **data)
         xml = xml.encode('ascii', 'xmlcharrefreplace')
         xml = xml.replace("  ", "")
         xml = xml.replace('\n', '')
         xml = xml.replace('\t', '')
         xml = xml.replace("> <", "><")
+        return xml, [item.get('tracking_code') for item in object_list]
 
-        self._validate_xml(xml)
+    def create_plp(self, intern_plp_number, object_list):
+        """
+        Gera uma nova PLP (Pré Lista de Postagem)
 
-        tracking_code_list = []
-        for item in object_list:
-            tracking_code = self._remove_dv_tracking_code(item.get('tracking_code'))
-            tracking_code_list.append(tracking_code)
+        :param intern_plp_number: Número de controle interno sequêncial para a geração da PLP
+        :param object_list: iterável (lista ou gerador) com os objetos da PLP
+        :return:
+        """
+        with self.instrumentation.call('fechaPlpVariosServicos') as call:
+            with call.phase('render'):
+                xml, tracking_code_list = self._render_plp(object_list)
 
-        logger.info(u'create_plp - xml: {} tracking_code_list: {}'.format(
-            xml,
-            ', '.join(tracking_code_list),
-        ))
+            with call.phase('validate'):
+                self._validate_xml(xml)
 
-        plp_id = self.client.service.fechaPlpVariosServicos(
-            xml=xml,
-            idPlpCliente=intern_plp_number,
-            cartaoPostagem=self.card,
-            listaEtiquetas=tracking_code_list,
-            usuario=self.user,
-            senha=self.password,
-        )
+            tracking_code_list = [self._remove_dv_tracking_code(code) for code in tracking_code_list]
+
+            # o XML é enviado como texto dentro do envelope SOAP, o suds só aceita bytes em ASCII
+            xml = xml.decode(plp.ENCODING)
 
-        logger.info(u'create_plp - tracking_code_list: {} plp: {}'.format(', '.join(tracking_code_list), plp_id))
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(u'create_plp - xml: %s tracking_code_list: %s', xml, ', '.join(tracking_code_list))
+
+            plp_id = self._service(
+                'fechaPlpVariosServicos',
+                xml=xml,
+                idPlpCliente=intern_plp_number,
+                cartaoPostagem=self.card,
+                listaEtiquetas=tracking_code_list,
+                usuario=self.user,
+                senha=self.password,
+            )
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(u'create_plp - tracking_code_list: %s plp: %s', ', '.join(tracking_code_list), plp_id)
 
         return {
             'plp_id': plp_id,
             'tracking_code_list': tracking_code_list,
         }
+
+    def _create_plp_shard(self, args):
+        intern_plp_number, object_list = args
+        try:
+            result = self.create_plp(intern_plp_number, object_list)
+        except Exception as e:
+            logger.error(u'create_plps - PLP %s failed: %r', intern_plp_number, e)
+            # o erro pode ter sido causado justamente por um objeto sem código de rastreio
+            tracking_codes = [item.get('tracking_code') for item in object_list]
+            return {
+                'status': False,
+                'intern_plp_number': intern_plp_number,
+                'tracking_code_list': [self._remove_dv_tracking_code(code) if code else code
+                                       for code in tracking_codes],
+                'erro': e,
+            }
+        result.update(status=True, intern_plp_number=intern_plp_number)
+        return result
+
+    def create_plps(self, intern_plp_number, object_list, shard_size=None, group_by_service=False, workers=None):
+        """
+        Gera várias PLPs, dividindo os objetos em lotes que são gerados, validados e enviados em paralelo.
+
+        Cada lote recebe um número de controle interno sequencial a partir de ``intern_plp_number``. Um lote
+        com erro não interrompe os demais, o erro é informado no resultado do próprio lote.
+        Cada thread usa uma cópia própria do cliente suds, veja :func:`sigep.wsdl.thread_client`.
+
+        :param intern_plp_number: Número de controle interno da primeira PLP
+        :param object_list: iterável com os objetos
+        :param shard_size: Quantidade máxima de objetos por PLP, por padrão ``PLP_SHARD_SIZE``
+        :param group_by_service: Se verdadeiro, cada PLP contém objetos de um único ``service_code``
+        :param workers: Quantidade máxima de PLPs enviadas ao mesmo tempo, por padrão ``PLP_WORKERS``
+        :return: lista, na ordem dos lotes, com {'status': True, 'intern_plp_number', 'plp_id',
+            'tracking_code_list'} ou {'status': False, 'intern_plp_number', 'tracking_code_list', 'erro'}
+        """
+        shard_size = shard_size or self.PLP_SHARD_SIZE
+        if shard_size < 1:
+            raise ValueError('shard_size must be greater than zero')
+
+        shards = plp.shard_objects(object_list, shard_size, group_by_service)
+        tasks = ((int(intern_plp_number) + index, shard) for index, shard in enumerate(shards))
+
+        pool = wsdl.worker_pool(workers or self.PLP_WORKERS)
+        try:
+            results = pool.map(self._create_plp_shard, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+        logger.info(u'create_plps - %d PLPs, %d failed', len(results), len([r for r in results if not r['status']]))
+        return results
+
+
+class AvailabilityCache(TTLCache):
+    """
+    Cache das consultas de disponibilidade de serviço do ``Sigep``, por código do serviço e CEP de destino.
+
+    Com ``zip_code_key`` as consultas são agrupadas por faixa de CEP, ex: ``lambda zip_code: zip_code[:5]``
+    consulta o serviço uma vez por prefixo de 5 dígitos. Consultas que falham com WebFault (resposta False)
+    ficam em cache por ``error_ttl``.
+    """
+    TTL = 24 * 60 * 60
+    ERROR_TTL = 10 * 60
+
+    def __init__(self, sigep, maxsize=10000, backend=None, ttl=TTL, error_ttl=ERROR_TTL, zip_code_key=None):
+        """
+        :param sigep: Cliente Sigep usado nas consultas
+        :param maxsize: Quantidade máxima de respostas em memória
+        :param backend: Cache compartilhado opcional, ex: SQLiteCache
+        :param ttl: Validade em segundos das respostas
+        :param error_ttl: Validade em segundos das consultas com erro
+        :param zip_code_key: Função que converte o CEP (8 dígitos) na chave do cache, por padrão o próprio CEP
+        """
+        super(AvailabilityCache, self).__init__(maxsize, backend, ttl, error_ttl)
+        self.sigep = sigep
+        self.zip_code_key = zip_code_key
+
+    def _key(self, code, zip_code):
+        if self.zip_code_key is not None:
+            zip_code = self.zip_code_key(zip_code)
+        return '%s:%s' % (code, zip_code)
+
+    def get_ttl(self, response):
+        return self.error_ttl if response is False else self.ttl
+
+    def check_service_available(self, code, zip_code):
+        zip_code = normalize_zip_code(zip_code)
+        key = self._key(code, zip_code)
+        response = self._get(key)
+        if response is None:
+            response = self.sigep.check_service_available(code, zip_code)
+            self._set(key, response)
+        return response
+
+    def check_availability_matrix(self, codes, zip_codes, workers=None):
+        """
+        Como ``Sigep.check_availability_matrix``, consultando o serviço uma única vez por chave fora do cache
+        """
+        results = {}
+        pending = collections.OrderedDict()
+        for code, zip_code in itertools.product(codes, zip_codes):
+            pair = (code, normalize_zip_code(zip_code))
+            if pair in results:
+                continue
+            key = self._key(*pair)
+            response = self._get(key)
+            if response is None:
+                pending.setdefault(key, []).append(pair)
+            else:
+                results[pair] = response
+
+        responses = self.sigep.check_availability_many([pairs[0] for pairs in pending.values()], workers=workers)
+        for key, pairs in pending.items():
+            response = responses[pairs[0]]
+            self._set(key, response)
+            for pair in pairs:
+                results[pair] = response
+        return results
+
+    def invalidate(self, code, zip_code):
+        self._delete(self._key(code, normalize_zip_code(zip_code)))
@@ -0,0 +1,102 @@
+# coding: utf-8
+import os
+import threading
+
+import jinja2
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PLP_TEMPLATE = 'xml/plp.xml'
+
+
+class TemplateCache(object):
+    """
+    Cache de templates Jinja2 compilados uma única vez por processo.
+
+    Mantém um ``jinja2.Environment`` por diretório, com ``auto_reload`` desligado para que o template não
+    seja verificado no disco a cada renderização. Opcionalmente usa um ``FileSystemBytecodeCache`` para que
+    novos processos não precisem recompilar o template.
+    """
+
+    def __init__(self, bytecode_cache_dir=None):
+        self.bytecode_cache_dir = bytecode_cache_dir
+        self._environments = {}
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def _get_path(self, path):
+        if os.path.isabs(path):
+            return path
+        return os.path.join(BASE_DIR, path)
+
+    def configure(self, bytecode_cache_dir=None):
+        """
+        Altera o diretório do cache de bytecode, descartando os templates já carregados
+
+        :param bytecode_cache_dir: Diretório onde o bytecode dos templates será salvo, ou None para desligar
+        """
+        with self._lock:
+            self.bytecode_cache_dir = bytecode_cache_dir
+            self._environments.clear()
+            self._templates.clear()
+
+    def _get_environment(self, directory):
+        environment = self._environments.get(directory)
+        if environment is None:
+            bytecode_cache = None
+            if self.bytecode_cache_dir:
+                if not os.path.isdir(self.bytecode_cache_dir):
+                    os.makedirs(self.bytecode_cache_dir)
+                bytecode_cache = jinja2.FileSystemBytecodeCache(self.bytecode_cache_dir)
+            environment = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(directory),
+                bytecode_cache=bytecode_cache,
+                auto_reload=False,
+            )
+            self._environments[directory] = environment
+        return environment
+
+    def get(self, path=PLP_TEMPLATE):
+        """
+        Retorna o template compilado, compilando-o na primeira chamada
+
+        :param path: Caminho do template, absoluto ou relativo ao pacote sigep
+        :return: jinja2.Template
+        """
+        path = self._get_path(path)
+        template = self._templates.get(path)
+        if template is None:
+            with self._lock:
+                template = self._templates.get(path)
+                if template is None:
+                    directory, filename = os.path.split(path)
+                    template = self._get_environment(directory).get_template(filename)
+                    self._templates[path] = template
+        return template
+
+    def preload(self, *paths):
+        """
+        Compila os templates antecipadamente, ex: no import ou antes do fork dos workers. O ``Sigep`` só
+        renderiza pelo Jinja2 os templates customizados, veja :meth:`sigep.sigep_client.Sigep.preload`
+
+        :param paths: Caminhos dos templates, por padrão o template da PLP
+        """
+        for path in paths or (PLP_TEMPLATE,):
+            self.get(path)
+
+    def render(self, path=PLP_TEMPLATE, **data):
+        return self.get(path).render(data)
+
+
+cache = TemplateCache()
+
+
+def configure(bytecode_cache_dir=None):
+    cache.configure(bytecode_cache_dir)
+
+
+def preload(*paths):
+    cache.preload(*paths)
+
+
+def render(path=PLP_TEMPLATE, **data):
+    return cache.render(path, **data)
@@ -0,0 +1,208 @@
+# coding: utf-8
+import Queue
+import errno
+import httplib
+import io
+import logging
+import socket
+import threading
+import urllib2
+import urlparse
+import zlib
+
+from suds.transport import Reply, Transport, TransportError
+
+from sigep import resilience
+
+logger = logging.getLogger('sigep.transport')
+
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30
+POOL_SIZE = 4
+
+# erros no envio que indicam uma conexão reutilizada já fechada pelo servidor
+STALE_ERRNOS = frozenset([errno.ECONNRESET, errno.EPIPE])
+
+
+class ConnectionPool(object):
+    """
+    Pool de conexões HTTP/HTTPS persistentes, separado por (esquema, host, porta).
+
+    Conexões livres são reutilizadas na ordem inversa em que foram devolvidas. Quando não há conexão
+    livre uma nova é aberta, e conexões devolvidas além de ``pool_size`` por host são fechadas.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self, key):
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.setdefault(key, Queue.LifoQueue(self.pool_size))
+        return pool
+
+    def _new_connection(self, scheme, host, port, timeout=None):
+        connect_timeout = self.connect_timeout if timeout is None else min(self.connect_timeout, timeout)
+        if scheme == 'https':
+            connection = httplib.HTTPSConnection(host, port, timeout=connect_timeout)
+        else:
+            connection = httplib.HTTPConnection(host, port, timeout=connect_timeout)
+        connection.connect()
+        connection.sock.settimeout(self.read_timeout)
+        return connection
+
+    def get(self, scheme, host, port, timeout=None, fresh=False):
+        """
+        Retorna uma conexão livre para o host, ou uma nova conexão
+
+        :param timeout: limite, em segundos, para os timeouts de conexão e leitura desta requisição
+        :param fresh: abre uma nova conexão mesmo que haja conexões livres
+        :return: tupla (conexão, se a conexão foi reutilizada)
+        """
+        try:
+            if fresh:
+                raise Queue.Empty
+            connection, reused = self._get_pool((scheme, host, port)).get_nowait(), True
+        except Queue.Empty:
+            connection, reused = self._new_connection(scheme, host, port, timeout), False
+        if timeout is not None:
+            connection.sock.settimeout(min(self.read_timeout, timeout))
+        return connection, reused
+
+    def put(self, scheme, host, port, connection, timeout=None):
+        """
+        Devolve a conexão ao pool
+
+        :param timeout: limite usado no ``get``, para que o timeout de leitura padrão seja restaurado
+        """
+        if timeout is not None:
+            connection.sock.settimeout(self.read_timeout)
+        try:
+            self._get_pool((scheme, host, port)).put_nowait(connection)
+        except Queue.Full:
+            connection.close()
+
+    def clear(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except Queue.Empty:
+                    break
+
+
+def is_stale(error, sent):
+    """
+    Indica se o erro de uma conexão reutilizada ocorreu porque o servidor a fechou enquanto estava livre no
+    pool, antes de receber a requisição: conexão fechada durante o envio, ou linha de status vazia sem nenhum
+    byte da resposta. Timeouts nunca são considerados, o servidor pode estar processando a requisição.
+
+    :param sent: se a requisição foi enviada por completo
+    """
+    if isinstance(error, socket.timeout):
+        return False
+    if not sent:
+        return isinstance(error, socket.error) and error.errno in STALE_ERRNOS
+    return isinstance(error, httplib.BadStatusLine) and error.line in ('', "''")
+
+
+def _decode_body(body, encoding):
+    if encoding == 'gzip':
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+class PooledTransport(Transport):
+    """
+    Transporte do suds com conexões persistentes (keep-alive) e respostas comprimidas com gzip/deflate.
+
+    O mesmo ``ConnectionPool`` pode ser compartilhado entre vários transportes, ex: entre os clientes do
+    SIGEP e do Rastro. URLs que não são http/https (ex: os WSDLs distribuídos com o pacote) são abertas
+    pelo urllib2.
+    """
+
+    def __init__(self, pool=None, **kwargs):
+        """
+        :param pool: ConnectionPool compartilhado, se não informado um novo pool é criado
+        :param kwargs: pool_size, connect_timeout e read_timeout do novo pool
+        """
+        Transport.__init__(self)
+        self.pool = pool or ConnectionPool(**kwargs)
+
+    def _request(self, method, url, body=None, headers=None):
+        parsed = urlparse.urlsplit(url)
+        scheme = parsed.scheme
+        port = parsed.port or (443 if scheme == 'https' else 80)
+        target = parsed.path or '/'
+        if parsed.query:
+            target = '%s?%s' % (target, parsed.query)
+
+        headers = dict(headers or {})
+        headers['Accept-Encoding'] = 'gzip, deflate'
+        headers['Connection'] = 'keep-alive'
+
+        retry = False
+        while True:
+            # o prazo da chamada em andamento (veja :mod:`sigep.resilience`) limita os timeouts
+            timeout = resilience.remaining()
+            if timeout is not None and timeout <= 0:
+                raise resilience.DeadlineExceeded(url)
+            connection, reused = self.pool.get(scheme, parsed.hostname, port, timeout, fresh=retry)
+            sent = False
+            try:
+                connection.request(method, target, body, headers)
+                sent = True
+                response = connection.getresponse()
+                data = response.read()
+            except (httplib.HTTPException, socket.error) as e:
+                connection.close()
+                # a requisição é reenviada uma única vez, em uma nova conexão, e apenas se o servidor não a
+                # recebeu: operações que alteram dados não podem ser executadas duas vezes
+                if reused and not retry and is_stale(e, sent):
+                    logger.debug(u'stale connection to %s: %r', parsed.hostname, e)
+                    retry = True
+                    continue
+                raise
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            self.pool.put(scheme, parsed.hostname, port, connection, timeout)
+
+        response_headers = dict(response.getheaders())
+        data = _decode_body(data, response_headers.get('content-encoding'))
+        return response.status, response.reason, response_headers, data
+
+    def open(self, request):
+        url = request.url
+        cache = self.options.cache
+        fp = cache.get(url)
+        if fp is not None:
+            return fp
+
+        if urlparse.urlsplit(url).scheme not in ('http', 'https'):
+            return cache.put(url, urllib2.urlopen(url))
+
+        status, reason, headers, data = self._request('GET', url, headers=self.options.headers)
+        if status >= 300:
+            raise TransportError(reason, status, io.BytesIO(data))
+        return cache.put(url, io.BytesIO(data))
+
+    def send(self, request):
+        status, reason, headers, data = self._request('POST', request.url, request.message, request.headers)
+        if status >= 300 or status in (202, 204):
+            raise TransportError(reason, status, io.BytesIO(data))
+        return Reply(status, headers, data)
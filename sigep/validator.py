@@ -0,0 +1,229 @@
+# coding: utf-8
+"""
+Validação dos objetos da PLP antes da geração do XML, com as restrições do XSD aplicadas diretamente aos
+dicionários dos objetos. Os erros são informados por objeto e por campo, ao contrário da validação do
+documento completo, que para no primeiro erro e não indica o objeto.
+
+As regras são lidas do XSD e a correspondência entre as chaves do objeto e os elementos do XML é obtida do
+próprio :func:`sigep.plp.build_object`, então ambas acompanham alterações no schema e no gerador.
+"""
+import decimal
+import multiprocessing
+import os
+import re
+
+from lxml import etree
+
+from sigep import plp, schema
+
+XS = 'http://www.w3.org/2001/XMLSchema'
+
+# limites dos tipos inteiros do XSD
+INTEGER_RANGES = {
+    'byte': (-2 ** 7, 2 ** 7 - 1),
+    'short': (-2 ** 15, 2 ** 15 - 1),
+    'int': (-2 ** 31, 2 ** 31 - 1),
+    'long': (-2 ** 63, 2 ** 63 - 1),
+    'integer': (None, None),
+}
+
+INTEGER_RE = re.compile(r'^[+-]?\d+$')
+DECIMAL_RE = re.compile(r'^[+-]?(\d+(\.\d*)?|\.\d+)$')
+
+CHUNK_SIZE = 1000
+
+
+class _Markers(dict):
+    """
+    Objeto que responde a qualquer chave com um marcador, usado para descobrir em qual elemento cada chave
+    é escrita
+    """
+
+    def get(self, key, default=None):
+        return u'{%s}' % key
+
+
+def field_elements():
+    """
+    :return: dicionário {chave do objeto: elemento do XML em que o valor é escrito}
+    """
+    fields = {}
+    for element in plp.build_object(_Markers()).iter():
+        text = element.text or u''
+        if text.startswith(u'{') and text.endswith(u'}'):
+            fields[text[1:-1]] = element.tag
+    return fields
+
+
+def _build_check(base, facets):
+    enumeration = facets.get('enumeration')
+    max_length = facets.get('maxLength')
+    min_length = facets.get('minLength')
+    patterns = [re.compile(u'^(?:%s)$' % pattern) for pattern in facets.get('pattern', [])]
+    minimum = facets.get('minInclusive')
+    maximum = facets.get('maxInclusive')
+
+    if base in INTEGER_RANGES or base == 'decimal':
+        # o Decimal é usado apenas no tipo decimal, os tipos inteiros são comparados como int
+        number_re, number = (DECIMAL_RE, decimal.Decimal) if base == 'decimal' else (INTEGER_RE, int)
+        low, high = INTEGER_RANGES.get(base, (None, None))
+        if minimum is not None:
+            low = number(minimum) if low is None else max(low, number(minimum))
+        if maximum is not None:
+            high = number(maximum) if high is None else min(high, number(maximum))
+        if enumeration is not None:
+            enumeration = set(number(value) for value in enumeration)
+
+        def check(text):
+            text = text.strip()
+            if not number_re.match(text):
+                return u'%r is not a valid %s' % (text, base)
+            value = number(text)
+            if enumeration is not None and value not in enumeration:
+                return u'%r is not one of %s' % (text, sorted(facets['enumeration']))
+            if low is not None and value < low:
+                return u'%s is less than %s' % (text, low)
+            if high is not None and value > high:
+                return u'%s is greater than %s' % (text, high)
+        return check
+
+    if enumeration is not None:
+        enumeration = frozenset(enumeration)
+
+    def check(text):
+        if max_length is not None and len(text) > max_length:
+            return u'longer than %d characters' % max_length
+        if min_length is not None and len(text) < min_length:
+            return u'shorter than %d characters' % min_length
+        if enumeration is not None and text not in enumeration:
+            return u'%r is not one of %s' % (text, sorted(enumeration))
+        for pattern in patterns:
+            if not pattern.match(text):
+                return u'%r does not match %s' % (text, pattern.pattern)
+    return check
+
+
+def load_rules(path=schema.PLP_SCHEMA):
+    """
+    Lê as restrições dos tipos simples do XSD
+
+    :param path: Caminho do XSD, absoluto ou relativo ao pacote sigep
+    :return: dicionário {elemento: função que recebe o texto do elemento e retorna a mensagem de erro ou None}
+    """
+    if not os.path.isabs(path):
+        path = os.path.join(schema.BASE_DIR, path)
+
+    rules = {}
+    for element in etree.parse(path).iter('{%s}element' % XS):
+        name = element.get('name')
+        if name is None:
+            continue
+        if element.get('type', '').startswith('xs:'):
+            base, facets = element.get('type')[3:], {}
+        else:
+            restriction = element.find('{%s}simpleType/{%s}restriction' % (XS, XS))
+            if restriction is None:
+                continue
+            base, facets = restriction.get('base', 'xs:string')[3:], {}
+            for facet in restriction:
+                if not isinstance(facet.tag, str):
+                    continue
+                kind, value = etree.QName(facet).localname, facet.get('value')
+                if kind in ('enumeration', 'pattern'):
+                    facets.setdefault(kind, []).append(value)
+                elif kind in ('maxLength', 'minLength'):
+                    facets[kind] = int(value)
+                elif kind in ('minInclusive', 'maxInclusive'):
+                    facets[kind] = value
+        if base == 'string' and not facets:
+            continue
+        rules[name] = _build_check(base, facets)
+    return rules
+
+
+class ObjectValidator(object):
+    """
+    Valida os dicionários dos objetos da PLP, com as mesmas chaves aceitas por ``Sigep.create_plp``::
+
+        validator = ObjectValidator()
+        valid, invalid = validator.split(object_list)
+        sigep.create_plp('1', valid)
+    """
+
+    def __init__(self, path=schema.PLP_SCHEMA):
+        self.path = path
+        rules = load_rules(path)
+        self.checks = sorted(
+            (key, element, rules[element]) for key, element in field_elements().items() if element in rules
+        )
+
+    def validate(self, item):
+        """
+        :param item: dicionário do objeto
+        :return: dicionário {chave: mensagem de erro}, vazio se o objeto é válido
+        """
+        errors = {}
+        for key, element, check in self.checks:
+            error = check(plp._text(item.get(key)))
+            if error is not None:
+                errors[key] = u'%s: %s' % (element, error)
+        return errors
+
+    def _validate_chunk(self, start, object_list):
+        reports = []
+        for index, item in enumerate(object_list, start):
+            errors = self.validate(item)
+            if errors:
+                reports.append({'index': index, 'tracking_code': item.get('tracking_code'), 'errors': errors})
+        return reports
+
+    def validate_many(self, object_list, processes=None, chunk_size=CHUNK_SIZE):
+        """
+        Valida vários objetos
+
+        :param object_list: lista com os dicionários dos objetos
+        :param processes: Quantidade de processos usados na validação, por padrão a validação é feita no
+            processo atual. Indicado apenas para listas muito grandes
+        :param chunk_size: Quantidade de objetos enviados a cada processo por vez
+        :return: lista de relatórios dos objetos inválidos, na ordem original, com ``index`` (posição na
+            lista), ``tracking_code`` e ``errors`` (veja :meth:`validate`)
+        """
+        if not processes or len(object_list) <= chunk_size:
+            return self._validate_chunk(0, object_list)
+
+        chunks = [(self.path, start, object_list[start:start + chunk_size])
+                  for start in range(0, len(object_list), chunk_size)]
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_validate_chunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+        return [report for reports in results for report in reports]
+
+    def split(self, object_list, processes=None, chunk_size=CHUNK_SIZE):
+        """
+        :return: tupla (lista dos objetos válidos, relatórios dos inválidos)
+        """
+        object_list = list(object_list)
+        reports = self.validate_many(object_list, processes, chunk_size)
+        invalid = set(report['index'] for report in reports)
+        return [item for index, item in enumerate(object_list) if index not in invalid], reports
+
+
+_validators = {}
+
+
+def get_validator(path=schema.PLP_SCHEMA):
+    """
+    :return: ObjectValidator do schema, criado uma única vez por processo
+    """
+    validator = _validators.get(path)
+    if validator is None:
+        validator = _validators[path] = ObjectValidator(path)
+    return validator
+
+
+def _validate_chunk(args):
+    path, start, object_list = args
+    return get_validator(path)._validate_chunk(start, object_list)
@@ -0,0 +1,157 @@
+# coding: utf-8
+import copy
+import os
+import threading
+import urllib
+import weakref
+from multiprocessing.pool import ThreadPool
+
+from suds.client import Client, Port, Service, Wrapper
+from suds.options import Options
+from suds.transport.cache import FileCache
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SIGEP_WSDL = 'xml/wsdl/AtendeCliente.wsdl'
+RASTRO_WSDL = 'xml/wsdl/Rastro.wsdl'
+
+CACHE_TTL = 24 * 60 * 60
+
+_worker = threading.local()
+
+
+def snapshot_url(path):
+    """
+    URL ``file://`` de um WSDL distribuído com o pacote
+
+    :param path: Caminho do WSDL, absoluto ou relativo ao pacote sigep
+    :return: URL que pode ser passada ao ``suds.client.Client`` sem acesso à rede
+    """
+    if not os.path.isabs(path):
+        path = os.path.join(BASE_DIR, path)
+    return 'file://' + urllib.pathname2url(path)
+
+
+def file_cache(location=None, ttl=CACHE_TTL):
+    """
+    Cache em disco dos documentos WSDL/XSD baixados pelo suds
+
+    :param location: Diretório do cache, por padrão o diretório temporário do suds
+    :param ttl: Tempo em segundos que um documento permanece válido, 0 para nunca expirar
+    :return: suds.transport.cache.FileCache
+    """
+    cache = FileCache(location, seconds=ttl)
+    cache.mktmp()
+    return cache
+
+
+class _Service(Service):
+    """
+    ``client.service`` que resolve os métodos em uma cópia do serviço do WSDL, veja :func:`_copy_service`
+    """
+
+    def __init__(self, client, service):
+        Service.__init__(self, client)
+        self.wsdl_service = service
+
+    def resolve(self, name):
+        port = self.dport(self.wsdl_service)
+        if port is None:
+            port = self.wsdl_service.port(name)
+        return Wrapper(_Port(self.client, (name, port), self.wsdl_service))
+
+
+class _Port(Port):
+    def __init__(self, client, port, service):
+        Port.__init__(self, client, port)
+        self.wsdl_service = service
+
+    def finder(self):
+        return self.wsdl_service if self.anyport() else self.realport()
+
+
+def _copy_service(service, definitions):
+    """
+    Copia o serviço do WSDL com métodos e bindings próprios. O suds guarda nos bindings o estado da chamada
+    em andamento (``binding.options`` e as pilhas do marshaller), que não pode ser compartilhado por clientes
+    usados em threads diferentes; o schema e os tipos continuam compartilhados.
+
+    :param service: suds.wsdl.Service
+    :param definitions: suds.wsdl.Definitions do serviço
+    :return: suds.wsdl.Service
+    """
+    clone = copy.copy(service)
+    clone.ports = []
+    for port in service.ports:
+        port = copy.copy(port)
+        port._Port__service = clone
+        clone.ports.append(port)
+
+    bindings = {}
+    methods = {}
+    for method in service.methods.values():
+        if id(method) in methods:
+            continue
+        own = methods[id(method)] = copy.copy(method)
+        own.binding = copy.copy(method.binding)
+        for name in ('input', 'output'):
+            binding = getattr(method.binding, name)
+            if binding is not None:
+                if id(binding) not in bindings:
+                    bindings[id(binding)] = binding.__class__(definitions)
+                setattr(own.binding, name, bindings[id(binding)])
+    clone.methods = dict((name, methods[id(method)]) for name, method in service.methods.items())
+    return clone
+
+
+def clone_client(client):
+    """
+    Cria um cliente suds que compartilha o WSDL já lido de ``client``, com opções, bindings e estado de chamada
+    próprios
+
+    :param client: suds.client.Client
+    :return: suds.client.Client
+    """
+    clone = Client.__new__(Client)
+    # cópia direta dos valores: ``Options.set`` reapontaria as opções do transporte compartilhado
+    clone.options = Options()
+    for name in Options.__options__:
+        clone.options.__dict__[name] = client.options.__dict__[name]
+    clone.options.__defined__ = set(client.options.__defined__)
+    clone.wsdl = client.wsdl
+    clone.service = Wrapper(_Service(clone, _copy_service(client.wsdl.service, client.wsdl)))
+    clone.factory = client.factory
+    clone.sd = client.sd
+    clone.messages = dict(tx=None, rx=None)
+    return clone
+
+
+def start_worker():
+    """
+    Marca a thread atual como worker: a partir daí :func:`thread_client` retorna uma cópia própria de cada
+    cliente suds usado na thread
+    """
+    _worker.clients = weakref.WeakKeyDictionary()
+
+
+def thread_client(client):
+    """
+    O cliente suds guarda o estado da chamada em andamento e não pode ser usado por duas threads ao mesmo
+    tempo. Nas threads marcadas com :func:`start_worker` cada cliente é substituído por uma cópia criada com
+    :func:`clone_client` na primeira chamada; nas demais threads o próprio cliente é retornado.
+    """
+    clients = getattr(_worker, 'clients', None)
+    if clients is None:
+        return client
+    clone = clients.get(client)
+    if clone is None:
+        clone = clients[client] = clone_client(client)
+    return clone
+
+
+def worker_pool(processes):
+    """
+    :return: ThreadPool em que cada thread usa as suas próprias cópias dos clientes suds, veja
+        :func:`thread_client`
+    """
+    return ThreadPool(processes, initializer=start_worker)
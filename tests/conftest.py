@@ -0,0 +1,6 @@
+# coding: utf-8
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 6):
+    collect_ignore.append('test_aio.py')
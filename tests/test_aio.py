@@ -0,0 +1,193 @@
+# coding: utf-8
+import asyncio
+
+import pytest
+
+from sigep import rastro
+from sigep.aio import AsyncCorreiosSROClient
+
+dev = {
+    'affiliation_id': 'sigepy', 'password': 'sigepy@pass',
+}
+
+body = """<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+ <soapenv:Body>
+ <ns2:buscaEventosResponse xmlns:ns2="http://resource.webservice.correios.com.br/">
+ <return>
+ <versao>2.0</versao>
+ <qtd>2</qtd>
+ <objeto>
+ <numero>JF598971235BR</numero>
+ <sigla>JF</sigla>
+ <nome>REMESSA ECONÔMICA C/AR DIGITAL</nome>
+ <categoria>REMESSA ECONÔMICA TALÃO/CARTÃO</categoria>
+ <evento>
+ <tipo>BDE</tipo>
+ <status>23</status>
+ <data>18/03/2014</data>
+ <hora>18:37</hora>
+ <descricao>Objeto devolvido ao remetente</descricao>
+ <local>CTCE MACEIO</local>
+ <codigo>57060971</codigo>
+ <cidade>MACEIO</cidade>
+ <uf>AL</uf>
+ </evento>
+ </objeto>
+ <objeto>
+ <numero>PN123456789BR</numero>
+ <erro>Objeto não encontrado na base de dados dos Correios.</erro>
+ </objeto>
+ </return>
+ </ns2:buscaEventosResponse>
+ </soapenv:Body>
+</soapenv:Envelope>
+""".encode('utf-8')
+
+
+class StubServer(object):
+    """
+    Servidor HTTP local que responde todo POST com ``body``
+    """
+
+    def __init__(self, delay=0, chunked=False, raw=None):
+        """
+        :param raw: resposta enviada no lugar da resposta HTTP, ex: b'' para fechar a conexão sem responder
+        """
+        self.delay = delay
+        self.chunked = chunked
+        self.raw = raw
+        self.requests = []
+        self.active = self.max_active = 0
+
+    async def handle(self, reader, writer):
+        headers = {}
+        await reader.readline()
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.lower()] = value.strip()
+        self.requests.append(await reader.readexactly(int(headers['content-length'])))
+
+        self.active += 1
+        self.max_active = max(self.active, self.max_active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+
+        if self.raw is not None:
+            writer.write(self.raw)
+        elif self.chunked:
+            writer.write(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n')
+            for start in range(0, len(body), 100):
+                chunk = body[start:start + 100]
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            writer.write(b'0\r\n\r\n')
+        else:
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body))
+        await writer.drain()
+        writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return 'http://127.0.0.1:%d/service/rastro' % self.server.sockets[0].getsockname()[1]
+
+
+class TestAsyncSRO:
+    def run(self, coroutine):
+        # asyncio.run não existe no Python 3.6
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    @pytest.mark.parametrize('chunked', [False, True])
+    def test_find_by_tracking_code(self, chunked):
+        async def scenario():
+            stub = StubServer(chunked=chunked)
+            client = AsyncCorreiosSROClient(url=await stub.start(), **dev)
+            data = await client.find_by_tracking_code('JF598971235BR')
+            return stub, data
+
+        stub, data = self.run(scenario())
+        assert b'<objetos>JF598971235BR</objetos>' in stub.requests[0]
+        assert data == {
+            'status': True, 'category': u'REMESSA ECONÔMICA TALÃO/CARTÃO',
+            'name': u'REMESSA ECONÔMICA C/AR DIGITAL',
+            'current_status': u'Objeto devolvido ao remetente',
+            'tracking_code': u'JF598971235BR',
+            'event_list': [
+                {
+                    'status': u'23', 'city': u'MACEIO', 'code': u'57060971',
+                    'description': u'Objeto devolvido ao remetente',
+                    'hour': u'18:37', 'date': u'18/03/2014',
+                    'local': u'CTCE MACEIO', 'uf': u'AL',
+                    'type': u'BDE', 'destiny': None
+                }
+            ],
+            'sigla': u'JF'
+        }
+
+    def test_find_many_concurrency(self):
+        async def scenario():
+            stub = StubServer(delay=0.05)
+            client = AsyncCorreiosSROClient(url=await stub.start(), concurrency=2, **dev)
+            client.MAX_OBJECTS = 1
+            codes = ['JF598971235BR', 'PN123456789BR', 'PN000000001BR', 'PN000000002BR', 'PN000000003BR']
+            data = await client.find_many(codes)
+            return stub, data
+
+        stub, data = self.run(scenario())
+        assert len(stub.requests) == 5
+        assert stub.max_active == 2
+        assert data['PN123456789BR']['status'] is False
+        assert data['JF598971235BR']['status'] is True
+
+    def test_client_across_loops(self):
+        client = AsyncCorreiosSROClient(concurrency=1, **dev)
+
+        async def scenario():
+            stub = StubServer(delay=0.02)
+            client.url = await stub.start()
+            await asyncio.gather(*[client.find_by_tracking_code('JF598971235BR') for _ in range(3)])
+            return stub
+
+        # o cliente é criado fora do loop e o semáforo pertence ao loop em que as chamadas são feitas
+        for _ in range(2):
+            stub = self.run(scenario())
+            assert (len(stub.requests), stub.max_active) == (3, 1)
+
+    def test_timeout(self):
+        async def scenario():
+            stub = StubServer(delay=1)
+            client = AsyncCorreiosSROClient(url=await stub.start(), timeout=0.05, **dev)
+            await client.find_by_tracking_code('JF598971235BR')
+
+        with pytest.raises(asyncio.TimeoutError):
+            self.run(scenario())
+
+    @pytest.mark.parametrize('raw, message', [
+        (b'', 'connection closed'),
+        (b'\r\n', 'invalid HTTP status line'),
+        (b'garbage\r\n', 'invalid HTTP status line'),
+        (b'HTTP/1.1 OK\r\n', 'invalid HTTP status line'),
+    ])
+    def test_bad_status_line(self, raw, message):
+        async def scenario():
+            stub = StubServer(raw=raw)
+            client = AsyncCorreiosSROClient(url=await stub.start(), **dev)
+            await client.find_by_tracking_code('JF598971235BR')
+
+        with pytest.raises(rastro.RastroError) as e:
+            self.run(scenario())
+        assert message in str(e.value)
+
+    def test_fault(self):
+        fault = b"""<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"><soapenv:Body>
+            <soapenv:Fault><faultcode>soap:Server</faultcode><faultstring>Usuario invalido</faultstring></soapenv:Fault>
+            </soapenv:Body></soapenv:Envelope>"""
+        with pytest.raises(rastro.RastroError) as e:
+            rastro.parse_response(fault, 500)
+        assert e.value.status == 500
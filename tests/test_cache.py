@@ -0,0 +1,169 @@
+# coding: utf-8
+import threading
+
+import pytest
+
+from sigep.cache import LRUCache, SQLiteCache, TTLCache
+from sigep.correios_client import TrackingCache
+from sigep.sigep_client import AvailabilityCache, Sigep
+
+
+def tracking_result(tracking_code, event_type='BDE', status='01'):
+    return {
+        'status': True,
+        'tracking_code': tracking_code,
+        'sigla': u'JF',
+        'name': u'REMESSA',
+        'category': u'REMESSA',
+        'event_list': [{
+            'status': status, 'city': u'MACEIO', 'code': u'57060971', 'description': u'Objeto entregue',
+            'hour': u'18:37', 'date': u'18/03/2014', 'local': u'CTCE MACEIO', 'uf': u'AL', 'type': event_type,
+            'destiny': None,
+        }],
+        'current_status': u'Objeto entregue',
+    }
+
+
+class FakeSROClient(object):
+    def __init__(self):
+        self.calls = []
+
+    def find_by_tracking_code(self, tracking_code, last_result=False):
+        self.calls.append([tracking_code])
+        return tracking_result(tracking_code, status='01' if tracking_code.startswith('JF') else '09')
+
+    def iter_many(self, tracking_codes, last_result=False):
+        self.calls.append(list(tracking_codes))
+        for tracking_code in tracking_codes:
+            yield tracking_code, tracking_result(tracking_code)
+
+
+class FakeSigep(Sigep):
+    def __init__(self):
+        self.calls = []
+
+    def check_service_available(self, code, zip_code):
+        self.calls.append((code, zip_code))
+        if zip_code.startswith('99'):
+            return False
+        return u'0#'
+
+
+class TestCache:
+    def test_lru(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+
+        cache.set('d', 4, ttl=-1)
+        assert cache.get('d', 'missing') == 'missing'
+
+    def test_sqlite(self, tmpdir):
+        path = str(tmpdir.join('cache', 'tracking.db'))
+        cache = SQLiteCache(path)
+        cache.set('a', {'status': True})
+        cache.set('b', {'status': False}, ttl=-1)
+
+        other = SQLiteCache(path)
+        assert other.get('a') == {'status': True}
+        assert other.get('b') is None
+
+        other.purge()
+        other.delete('a')
+        assert cache.get('a') is None
+
+    def test_ttl_counters(self):
+        class Cache(TTLCache):
+            def get_ttl(self, value):
+                return None
+
+        cache = Cache()
+        cache._set('a', 1)
+
+        def lookup():
+            for _ in range(2000):
+                cache._get('a')
+                cache._get('b')
+
+        threads = [threading.Thread(target=lookup) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert (cache.hits, cache.misses) == (8000, 8000)
+
+
+class TestTrackingCache:
+    @pytest.fixture
+    def client(self):
+        return FakeSROClient()
+
+    def test_ttl(self, client):
+        cache = TrackingCache(client)
+        assert cache.get_ttl(tracking_result('JF598971235BR')) is None
+        assert cache.get_ttl(tracking_result('JF598971235BR', status='23')) is None
+        assert cache.get_ttl(tracking_result('JF598971235BR', event_type='RO')) == cache.ttl
+        assert cache.get_ttl({'status': False, 'tracking_code': u'', 'erro': u'erro'}) == cache.error_ttl
+
+    def test_find(self, client, tmpdir):
+        backend = SQLiteCache(str(tmpdir.join('tracking.db')))
+        cache = TrackingCache(client, backend=backend)
+
+        assert cache.find_by_tracking_code('JF598971235BR')['status'] is True
+        assert cache.find_by_tracking_code('jf598971235br')['tracking_code'] == 'JF598971235BR'
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        data = cache.find_many(['JF598971235BR', 'PN123456789BR'])
+        assert sorted(data) == ['JF598971235BR', 'PN123456789BR']
+        assert client.calls == [['JF598971235BR'], ['PN123456789BR']]
+
+        # outro processo usando o mesmo arquivo
+        other = TrackingCache(client, backend=SQLiteCache(str(tmpdir.join('tracking.db'))))
+        other.find_by_tracking_code('PN123456789BR')
+        assert other.hits == 1 and len(client.calls) == 2
+
+        cache.invalidate('PN123456789BR')
+        other.memory.clear()
+        other.find_by_tracking_code('PN123456789BR')
+        assert other.misses == 1 and len(client.calls) == 3
+
+
+class TestAvailabilityCache:
+    def test_matrix(self):
+        sigep = FakeSigep()
+        data = sigep.check_availability_matrix(['04162', '04669'], ['01310-100', '01310100', '99999000'])
+        assert sorted(data) == [
+            ('04162', '01310100'), ('04162', '99999000'), ('04669', '01310100'), ('04669', '99999000'),
+        ]
+        assert data[('04162', '99999000')] is False
+        assert len(sigep.calls) == 4
+
+    def test_cache(self, tmpdir):
+        sigep = FakeSigep()
+        cache = AvailabilityCache(sigep, backend=SQLiteCache(str(tmpdir.join('availability.db'))))
+        assert cache.check_service_available('04162', '01310-100') == u'0#'
+        assert cache.check_service_available('04162', '01310100') == u'0#'
+        assert cache.check_service_available('04162', '99999000') is False
+        assert cache.check_service_available('04162', '99999000') is False
+        assert len(sigep.calls) == 2
+        assert cache.get_ttl(False) == cache.error_ttl
+
+        data = cache.check_availability_matrix(['04162', '04669'], ['01310100', '99999000'])
+        assert len(data) == 4
+        assert sorted(sigep.calls[2:]) == [('04669', '01310100'), ('04669', '99999000')]
+
+        cache.invalidate('04162', '01310100')
+        cache.memory.clear()
+        cache.check_service_available('04669', '01310100')
+        assert len(sigep.calls) == 4
+
+    def test_zip_code_key(self):
+        sigep = FakeSigep()
+        cache = AvailabilityCache(sigep, zip_code_key=lambda zip_code: zip_code[:5])
+        data = cache.check_availability_matrix(['04162'], ['01310100', '01310200', '20040002'])
+        assert len(data) == 3
+        assert len(sigep.calls) == 2
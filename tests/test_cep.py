@@ -0,0 +1,55 @@
+# coding: utf-8
+import pytest
+
+from sigep import cep
+from sigep.cep import CEPIndex
+from sigep.quote import QuoteEngine, StubPriceClient
+from tests.test_plp import make_object
+
+
+def test_lookup():
+    assert cep.lookup('01310-100') == ('SP', None)
+    assert cep.lookup('37902000') == ('MG', None)
+    assert cep.lookup('70040-010') == ('DF', None)
+    assert cep.lookup('72900000') == ('GO', None)
+    assert cep.lookup('69301000') == ('RR', None)
+    assert cep.lookup('00999999') is None
+    assert cep.lookup('0131010') is None
+    assert cep.lookup('abcdefgh') is None
+
+
+def test_cities():
+    index = CEPIndex([
+        ('SP', 1000000, 19999999, None),
+        ('SP', 13000000, 13139999, u'Campinas'),
+        ('MG', 30000000, 39999999, None),
+    ])
+    assert index.lookup('13010-000') == ('SP', u'Campinas')
+    assert index.lookup('14020273') == ('SP', None)
+    assert index('13010000') == u'SP:Campinas'
+    assert index('14020273') == 'SP'
+    assert index('00000001') == '00000001'
+
+    with pytest.raises(ValueError):
+        CEPIndex([('SP', 1000000, 19999999, None), ('RJ', 19000000, 28999999, None)])
+
+
+def test_validate():
+    object_list = [
+        make_object(1, receiver_zip_code='37902-000', receiver_state='MG'),
+        make_object(2, receiver_zip_code='01310100', receiver_state='MG'),
+        make_object(3, receiver_zip_code='123', receiver_state='SP'),
+        make_object(4, receiver_zip_code='01310100', receiver_state='sp'),
+    ]
+    reports = cep.validate(object_list)
+    assert [report['index'] for report in reports] == [1, 2]
+    assert reports[0]['tracking_code'] == 'PC000002HK'
+    assert reports[0]['errors'] == {'receiver_zip_code': u'CEP 01310100 belongs to SP, not MG'}
+
+
+def test_zip_code_key():
+    client = StubPriceClient()
+    engine = QuoteEngine(client, origin_zip_code='14020273', zip_code_key=cep.get_index())
+    engine.quote('04014', '01310100', weight=300)
+    engine.quote('04014', '04538132', weight=300)
+    assert len(client.calls) == 1
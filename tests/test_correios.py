@@ -2,6 +2,8 @@
 import httpretty
 import pytest
 
+from sigep import rastro
+
 dev = {
     'affiliation_id': 'sigepy', 'password': 'sigepy@pass',
 }
@@ -21,6 +23,40 @@ def fake_body(content='OK', tag='ID'):
 
 SOAP_URL = 'http://webservice.correios.com.br:80/service/rastro'
 
+MANY_BODY = """
+        <soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+         <soapenv:Body>
+         <ns2:buscaEventosResponse xmlns:ns2="http://resource.webservice.correios.com.br/">
+         <return>
+         <versao>2.0</versao>
+         <qtd>2</qtd>
+         <objeto>
+         <numero>JF598971235BR</numero>
+         <sigla>JF</sigla>
+         <nome>REMESSA ECONOMICA C/AR DIGITAL</nome>
+         <categoria>REMESSA ECONOMICA TALAO/CARTAO</categoria>
+         <evento>
+         <tipo>BDE</tipo>
+         <status>23</status>
+         <data>18/03/2014</data>
+         <hora>18:37</hora>
+         <descricao>Objeto devolvido ao remetente</descricao>
+         <local>CTCE MACEIO</local>
+         <codigo>57060971</codigo>
+         <cidade>MACEIO</cidade>
+         <uf>AL</uf>
+         </evento>
+         </objeto>
+         <objeto>
+         <numero>PN123456789BR</numero>
+         <erro>Objeto não encontrado na base de dados dos Correios.</erro>
+         </objeto>
+         </return>
+         </ns2:buscaEventosResponse>
+         </soapenv:Body>
+        </soapenv:Envelope>
+"""
+
 
 class TestSRO:
     @pytest.fixture
@@ -29,6 +65,11 @@ class TestSRO:
         client = CorreiosSROClient(**dev)
         return client
 
+    @pytest.fixture
+    def snapshot_client(self):
+        from sigep.correios_client import CorreiosSROClient
+        return CorreiosSROClient(wsdl_snapshot=True, **dev)
+
     def test_find_tracking_code(self, client):
         httpretty.enable()
         data = """
@@ -117,4 +158,75 @@ class TestSRO:
         httpretty.register_uri(httpretty.POST, SOAP_URL, data=data, body=body)
         data = client.find_by_tracking_code(tracking_code='JF598971235BR')
         assert data['status'] is False
-        
\ No newline at end of file
+        
+    def test_find_many(self, snapshot_client):
+        client = snapshot_client
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(httpretty.POST, SOAP_URL, body=MANY_BODY)
+
+        data = client.find_many(['JF598971235BR', 'pn123456789br', 'JF598971235BR'])
+        assert '<objetos>JF598971235BRPN123456789BR</objetos>' in httpretty.last_request().body
+        assert '<tipo>L</tipo>' in httpretty.last_request().body
+        assert data['JF598971235BR']['current_status'] == u'Objeto devolvido ao remetente'
+        assert data['PN123456789BR']['status'] is False
+
+        client.find_many(['PN123456772BR', 'PN123456769BR', 'PN123456786BR'])
+        assert '<objetos>PN123456769BRPN123456786BR</objetos>' in httpretty.last_request().body
+        assert '<tipo>F</tipo>' in httpretty.last_request().body
+        httpretty.disable()
+
+    def test_fast_parse(self, snapshot_client):
+        client = snapshot_client
+        from sigep.correios_client import CorreiosSROClient
+        fast_client = CorreiosSROClient(wsdl_snapshot=True, fast_parse=True, **dev)
+
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(httpretty.POST, SOAP_URL, body=MANY_BODY)
+        try:
+            expected = client.find_many(['JF598971235BR', 'PN123456789BR'])
+            data = fast_client.find_many(['JF598971235BR', 'PN123456789BR'])
+            assert '<objetos>JF598971235BRPN123456789BR</objetos>' in httpretty.last_request().body
+
+            httpretty.register_uri(httpretty.POST, SOAP_URL, status=500, body="""
+                <soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+                 <soapenv:Body>
+                 <soapenv:Fault><faultcode>soapenv:Server</faultcode><faultstring>Usuario invalido</faultstring>
+                 </soapenv:Fault>
+                 </soapenv:Body>
+                </soapenv:Envelope>
+            """)
+            with pytest.raises(rastro.RastroError) as e:
+                fast_client.find_by_tracking_code('JF598971235BR')
+            assert e.value.status == 500
+        finally:
+            httpretty.disable()
+
+        assert data == expected
+
+    def test_fast_parse_transport_error(self):
+        from suds.transport import TransportError
+
+        from sigep.correios_client import CorreiosSROClient
+        from sigep.transport import PooledTransport
+
+        class FailingTransport(PooledTransport):
+            def send(self, request):
+                raise TransportError('Service Unavailable', 503, None)
+
+        client = CorreiosSROClient(wsdl_snapshot=True, fast_parse=True, transport=FailingTransport(), **dev)
+        with pytest.raises(TransportError) as e:
+            client.find_by_tracking_code('JF598971235BR')
+        assert e.value.httpcode == 503
+
+    def test_iter_response(self):
+        objects = rastro.iter_response(MANY_BODY)
+        first = next(objects)
+        assert first['tracking_code'] == u'JF598971235BR'
+        assert first['event_list'][0]['city'] == u'MACEIO'
+        assert next(objects)['status'] is False
+        assert list(objects) == []
+
+        with pytest.raises(rastro.RastroError):
+            list(rastro.iter_response(b'<html>', 502))
@@ -0,0 +1,150 @@
+# coding: utf-8
+import datetime
+
+import pytest
+
+from sigep import records
+from sigep.events import EventStore
+
+
+def make_event(event_type, status, when, local=u'CTE VILA MARIA', city=u'SAO PAULO', uf=u'SP'):
+    return {
+        'type': event_type, 'status': status, 'code': u'05311900',
+        'date': when.strftime('%d/%m/%Y'), 'hour': when.strftime('%H:%M'),
+        'description': u'Evento %s %s' % (event_type, status), 'local': local, 'city': city, 'uf': uf,
+        'destiny': None,
+    }
+
+
+def make_result(tracking_code, events, sigla=u'PC'):
+    return {
+        'status': True, 'tracking_code': tracking_code, 'sigla': sigla, 'name': u'ENCOMENDA PAC',
+        'category': u'ENCOMENDA PAC', 'event_list': list(reversed(events)), 'current_status': u'',
+    }
+
+
+START = datetime.datetime(2014, 3, 18, 8, 0)
+
+
+def hours(value):
+    return START + datetime.timedelta(hours=value)
+
+
+@pytest.fixture
+def store():
+    store = EventStore()
+    store.extend({
+        u'PC000000014BR': make_result(u'PC000000014BR', [
+            make_event('PO', '01', hours(0)),
+            make_event('RO', '01', hours(10), local=u'CTE CAMPINAS', city=u'CAMPINAS'),
+            make_event('BDE', '01', hours(30), local=u'CDD CAMPINAS', city=u'CAMPINAS'),
+        ]),
+        u'PC000000028BR': make_result(u'PC000000028BR', [
+            make_event('PO', '01', hours(0)),
+            make_event('BDE', '02', hours(48), local=u'CDD RIO', city=u'RIO DE JANEIRO', uf=u'RJ'),
+            make_event('BDE', '01', hours(72), local=u'CDD RIO', city=u'RIO DE JANEIRO', uf=u'RJ'),
+        ]),
+        u'SS000000031BR': make_result(u'SS000000031BR', [
+            make_event('PO', '01', hours(0)),
+            make_event('RO', '01', hours(4), local=u'CTE CAMPINAS', city=u'CAMPINAS'),
+        ], sigla=u'SS'),
+        u'PC000000045BR': {'status': False, 'tracking_code': u'PC000000045BR', 'erro': u'Objeto não encontrado'},
+    })
+    return store
+
+
+class TestEventStore:
+    def test_append(self, store):
+        assert len(store) == 8
+        assert store.object_count == 3
+        assert len(store.dictionaries['uf']) == 2
+
+        # novas consultas acrescentam apenas os eventos posteriores
+        result = make_result(u'SS000000031BR', [
+            make_event('PO', '01', hours(0)),
+            make_event('RO', '01', hours(4), local=u'CTE CAMPINAS', city=u'CAMPINAS'),
+            make_event('BDE', '01', hours(20), local=u'CDD CAMPINAS', city=u'CAMPINAS'),
+        ], sigla=u'SS')
+        assert store.append(result) == 1
+        assert store.append(records.TrackedObject.from_dict(result)) == 0
+        assert len(store) == 9
+
+    def test_same_minute(self, store):
+        # eventos diferentes na mesma hora e minuto, ex: baixa e saída para entrega, são mantidos
+        events = [
+            make_event('PO', '01', hours(0)),
+            make_event('RO', '01', hours(4), local=u'CTE CAMPINAS', city=u'CAMPINAS'),
+            make_event('OEC', '01', hours(4), local=u'CDD CAMPINAS', city=u'CAMPINAS'),
+            make_event('RO', '01', hours(4), local=u'CDD CAMPINAS', city=u'CAMPINAS'),
+        ]
+        assert store.append(make_result(u'SS000000031BR', events, sigla=u'SS')) == 2
+        assert store.append(make_result(u'SS000000031BR', events, sigla=u'SS')) == 0
+        assert len(store) == 10
+
+    def test_load_append_same_minute(self, store, tmpdir):
+        path = str(tmpdir.join('events.bin'))
+        store.save(path)
+        loaded = EventStore.load(path)
+        result = make_result(u'PC000000014BR', [
+            make_event('BDE', '01', hours(30), local=u'CDD CAMPINAS', city=u'CAMPINAS'),
+            make_event('BDI', '01', hours(30), local=u'CDD CAMPINAS', city=u'CAMPINAS'),
+        ])
+        assert loaded.append(result) == 1
+        assert loaded.append(result) == 0
+
+    def test_records(self):
+        store = EventStore()
+        result = make_result(u'PC000000014BR', [make_event('PO', '01', hours(0)), make_event('BDE', '01', hours(5))])
+        assert store.append(records.TrackedObject.from_dict(result)) == 2
+        assert store.delivery_times()[u'PC']['max'] == 5 * 3600
+
+    def test_delivery_times(self, store):
+        times = store.delivery_times()
+        assert sorted(times) == [u'PC']
+        assert times[u'PC']['count'] == 2
+        assert times[u'PC']['min'] == 30 * 3600
+        assert times[u'PC']['max'] == 72 * 3600
+        assert times[u'PC']['mean'] == 51 * 3600
+
+    def test_stuck_times(self, store):
+        times = store.stuck_times()
+        assert times[u'CTE VILA MARIA']['count'] == 3
+        assert times[u'CTE VILA MARIA']['max'] == 48 * 3600
+        assert times[u'CTE CAMPINAS']['max'] == 20 * 3600
+        assert times[u'CDD RIO']['max'] == 24 * 3600
+        assert u'CDD CAMPINAS' not in times
+
+        # o objeto não entregue continua parado em Campinas
+        times = store.stuck_times(by='city', now=hours(100))
+        assert times[u'CAMPINAS']['count'] == 2
+        assert times[u'CAMPINAS']['max'] == 96 * 3600
+
+        with pytest.raises(ValueError):
+            store.stuck_times(by='description')
+
+    def test_exception_rates(self, store):
+        rates = store.exception_rates()
+        assert rates[u'PC'] == {'objects': 2, 'exceptions': 1, 'rate': 0.5}
+        assert rates[u'SS'] == {'objects': 1, 'exceptions': 0, 'rate': 0.0}
+
+        rates = store.exception_rates(by='uf')
+        assert rates[u'RJ'] == {'objects': 1, 'exceptions': 1, 'rate': 1.0}
+        assert rates[u'SP']['exceptions'] == 0
+
+    def test_save_load(self, store, tmpdir):
+        path = str(tmpdir.join('events.bin'))
+        store.save(path)
+        loaded = EventStore.load(path)
+
+        assert len(loaded) == len(store)
+        assert loaded.columns == store.columns
+        assert loaded.delivery_times() == store.delivery_times()
+        assert loaded.exception_rates(by='city') == store.exception_rates(by='city')
+
+        # o histórico carregado continua recebendo eventos
+        assert loaded.append(make_result(u'PC000000014BR', [make_event('PO', '01', hours(0))])) == 0
+        assert loaded.append(make_result(u'PC000000059BR', [make_event('PO', '01', hours(0))])) == 1
+
+        tmpdir.join('other.bin').write('not events')
+        with pytest.raises(ValueError):
+            EventStore.load(str(tmpdir.join('other.bin')))
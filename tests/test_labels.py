@@ -0,0 +1,135 @@
+# coding: utf-8
+import threading
+
+import pytest
+
+from sigep import labels
+
+
+class TestLabels:
+    def test_calculate_digit(self):
+        assert labels.add_verification_digit('JF59897123 BR') == 'JF598971235BR'
+        assert labels.add_verification_digit('dl76023727br') == 'DL760237272BR'
+        # resto 0 e resto 1
+        assert labels.calculate_digit('00000000') == 5
+        assert labels.calculate_digit('00000008') == 0
+
+        with pytest.raises(ValueError):
+            labels.add_verification_digit('OK')
+
+    def test_is_valid(self):
+        assert labels.is_valid('JF598971235BR')
+        assert not labels.is_valid('JF598971236BR')
+        assert not labels.is_valid('JF59897123BR')
+        assert labels.validate_many(['JF598971235BR', 'PN123456789BR']) == ['PN123456789BR']
+
+    def test_expand_range(self):
+        assert labels.parse_labels('PC00000009 BR,PC00000011 BR') == [
+            'PC00000009 BR', 'PC00000010 BR', 'PC00000011 BR',
+        ]
+        assert labels.parse_labels('PC00000009 BR,PC00000009 BR') == ['PC00000009 BR']
+        assert labels.parse_labels('OK') == ['OK']
+
+        codes = labels.add_verification_digits(labels.expand_range('PC00000001 BR', 'PC00001000 BR'))
+        assert len(codes) == 1000
+        assert labels.validate_many(codes) == []
+
+        with pytest.raises(ValueError):
+            list(labels.expand_range('PC00000011 BR', 'PC00000009 BR'))
+        with pytest.raises(ValueError):
+            list(labels.expand_range('PC00000001 BR', 'SL00000009 BR'))
+
+
+class FakeSigep(object):
+    def __init__(self):
+        self.next_number = 1
+        self.calls = []
+
+    def request_new_tracking_codes(self, service_id, amount=1):
+        self.calls.append((service_id, amount))
+        first = self.next_number
+        self.next_number += amount
+        return labels.add_verification_digits(
+            labels.expand_range('PC%08d BR' % first, 'PC%08d BR' % (first + amount - 1))
+        )
+
+
+class SlowSigep(FakeSigep):
+    def __init__(self):
+        super(SlowSigep, self).__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def request_new_tracking_codes(self, service_id, amount=1):
+        self.started.set()
+        self.release.wait(5)
+        return super(SlowSigep, self).request_new_tracking_codes(service_id, amount)
+
+
+class TestLabelPool:
+    def test_claim_and_refill(self, tmpdir):
+        sigep = FakeSigep()
+        pool = labels.LabelPool(sigep, str(tmpdir.join('labels.db')), batch_size=10, low_water=3)
+
+        codes = [pool.get(124884) for _ in range(7)]
+        assert len(set(codes)) == 7
+        assert labels.validate_many(codes) == []
+        assert sigep.calls[0] == ('124884', 10)
+
+        # o estoque ficou abaixo do mínimo e um lote foi solicitado em segundo plano
+        for thread in threading.enumerate():
+            if thread.name.startswith('sigep-label-pool'):
+                thread.join()
+        assert len(sigep.calls) == 2
+        assert pool.available(124884) == 13
+
+    def test_persistence(self, tmpdir):
+        path = str(tmpdir.join('labels.db'))
+        sigep = FakeSigep()
+        pool = labels.LabelPool(sigep, path, batch_size=5, low_water=0)
+        first = pool.get('109819')
+
+        reopened = labels.LabelPool(sigep, path, batch_size=5, low_water=0)
+        assert reopened.available('109819') == 4
+        remaining = [reopened.get('109819') for _ in range(3)]
+        assert first not in remaining
+        assert len(sigep.calls) == 1
+        assert reopened.available('109819') == 1
+        assert reopened.available('124884') == 0
+
+    def test_concurrent_claims(self, tmpdir):
+        path = str(tmpdir.join('labels.db'))
+        pool = labels.LabelPool(FakeSigep(), path, batch_size=200, low_water=0)
+        pool.refill('124884')
+        claimed = []
+
+        def claim():
+            for _ in range(50):
+                claimed.append(pool.get('124884'))
+
+        threads = [threading.Thread(target=claim) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(set(claimed)) == 200
+        assert pool.available('124884') == 0
+
+    def test_wait_for_refill(self, tmpdir):
+        sigep = SlowSigep()
+        pool = labels.LabelPool(sigep, str(tmpdir.join('labels.db')), batch_size=10, low_water=3)
+        pool._refill_in_background('124884')
+        assert sigep.started.wait(5)
+
+        # estoque vazio com uma reposição em andamento: get espera o lote em vez de solicitar outro
+        claimed = []
+        thread = threading.Thread(target=lambda: claimed.append(pool.get('124884')))
+        thread.start()
+        thread.join(0.1)
+        assert thread.is_alive()
+        sigep.release.set()
+        thread.join(5)
+
+        assert len(claimed) == 1 and labels.validate_many(claimed) == []
+        assert sigep.calls == [('124884', 10)]
+        assert pool.available('124884') == 9
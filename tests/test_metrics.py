@@ -0,0 +1,74 @@
+# coding: utf-8
+import time
+
+import pytest
+from suds.options import Options
+from suds.transport import Reply, Request, Transport
+
+from sigep import metrics
+
+
+class EchoTransport(Transport):
+    def send(self, request):
+        return Reply(200, {}, self.options.location)
+
+
+class TestMetrics:
+    def test_phases(self):
+        instrumentation = metrics.Instrumentation()
+        with instrumentation.call('fechaPlpVariosServicos') as call:
+            assert instrumentation.current() is call
+            with call.phase('parse'):
+                time.sleep(0.01)
+                with call.phase('network'):
+                    time.sleep(0.02)
+
+        assert instrumentation.current() is None
+        assert call.phases['network'] >= 0.02
+        assert 0.01 <= call.phases['parse'] < 0.02
+        assert call.duration >= call.phases['parse'] + call.phases['network']
+        assert call.error is None
+
+    def test_hooks(self):
+        collector = metrics.HistogramCollector()
+
+        def broken(call):
+            raise RuntimeError('hook')
+
+        instrumentation = metrics.Instrumentation(before=[broken], after=[collector])
+        for _ in range(3):
+            with instrumentation.call('solicitaEtiquetas') as call:
+                call.request_bytes, call.response_bytes = 100, 20
+        with pytest.raises(ValueError):
+            with instrumentation.call('solicitaEtiquetas'):
+                raise ValueError('fault')
+
+        data = collector.snapshot()['solicitaEtiquetas']
+        assert data['phases']['total']['count'] == 4
+        assert data['errors'] == {'ValueError': 1}
+        assert (data['request_bytes'], data['response_bytes']) == (300, 60)
+
+    def test_histogram(self):
+        histogram = metrics.Histogram()
+        for value in [0.004] * 90 + [0.3] * 9 + [3]:
+            histogram.observe(value)
+        assert histogram.percentile(50) == 0.005
+        assert histogram.percentile(95) == 0.5
+        assert histogram.percentile(100) == 3
+        assert histogram.to_dict()['count'] == 100
+        assert metrics.Histogram().percentile(50) is None
+
+    def test_transport_options(self):
+        inner = EchoTransport()
+        instrumentation = metrics.Instrumentation()
+        transports = [metrics.instrument_transport(inner, instrumentation) for _ in range(2)]
+        for location, transport in zip(['http://a', 'http://b'], transports):
+            # como o suds.client.Client, que liga as opções do cliente ao transporte
+            options = Options(location=location)
+            options.transport = transport
+
+        with instrumentation.call('solicitaEtiquetas') as call:
+            replies = [transport.send(Request('http://a', 'request')) for transport in transports * 2]
+        assert [reply.message for reply in replies] == ['http://a', 'http://b'] * 2
+        assert (call.request_bytes, call.response_bytes) == (28, 32)
+        assert inner.options.location is None
@@ -0,0 +1,92 @@
+# coding: utf-8
+import time
+
+import httpretty
+import pytest
+from suds import WebFault
+
+from sigep import labels
+from sigep.correios_client import CorreiosSROClient
+from sigep.mock_server import MockCorreios, MockServer
+from sigep.sigep_client import Sigep
+from tests.test_plp import make_object
+from tests.test_sigep import dev
+
+
+@pytest.fixture
+def server():
+    httpretty.disable()
+    with MockServer(MockCorreios(seed=1)) as server:
+        yield server
+
+
+def make_sigep(server):
+    return Sigep(url=server.sigep_wsdl_url, **dev)
+
+
+def make_objects(tracking_codes):
+    return [make_object(0, tracking_code=code, service_code='04162') for code in tracking_codes]
+
+
+def test_labels_and_plp(server):
+    sigep = make_sigep(server)
+    assert [service.codigo for service in sigep.search_service()] == ['04162', '04669']
+
+    tracking_codes = sigep.request_new_tracking_codes('124849', 3)
+    assert tracking_codes == ['PC000000014BR', 'PC000000028BR', 'PC000000031BR']
+    assert sigep.generate_verification_codes(['PC00000001 BR']) == ['PC000000014BR']
+
+    result = sigep.create_plp('1', make_objects(tracking_codes))
+    assert result['plp_id'] == 1
+    assert '<numero_etiqueta>PC000000014BR</numero_etiqueta>' in sigep.request_xml_plp(1, [])
+
+    # etiquetas já usadas em outra PLP
+    with pytest.raises(WebFault):
+        sigep.create_plp('2', make_objects(tracking_codes[:1]))
+
+    # etiquetas que não foram solicitadas
+    with pytest.raises(WebFault):
+        sigep.create_plp('3', make_objects([labels.add_verification_digit('PC00000099 BR')]))
+
+
+def test_tracking(server):
+    sigep = make_sigep(server)
+    tracking_codes = sigep.request_new_tracking_codes('124849', 2)
+    sro = CorreiosSROClient('sigepy', 'sigepy@pass', url=server.rastro_wsdl_url)
+    assert sro.find_by_tracking_code(tracking_codes[0]) == {
+        'status': False, 'tracking_code': tracking_codes[0],
+        'erro': u'Objeto não encontrado na base de dados dos Correios.',
+    }
+
+    sigep.create_plp('1', make_objects(tracking_codes))
+    server.correios.deliver(tracking_codes[0])
+    for fast_parse in (False, True):
+        sro = CorreiosSROClient('sigepy', 'sigepy@pass', url=server.rastro_wsdl_url, fast_parse=fast_parse)
+        result = sro.find_many(tracking_codes)
+        assert [event['status'] for event in result[tracking_codes[0]]['event_list']] == ['01', '01']
+        assert result[tracking_codes[0]]['current_status'] == u'Objeto entregue ao destinatário'
+        assert result[tracking_codes[1]]['current_status'] == u'Objeto postado'
+
+
+def test_availability(server):
+    server.correios.unavailable.add(('04669', '01310100'))
+    sigep = make_sigep(server)
+    assert sigep.check_service_available('04162', '01310-100') == '0#'
+    assert sigep.check_service_available('04669', '01310-100').startswith('-1#')
+
+
+def test_faults_and_latency():
+    httpretty.disable()
+    correios = MockCorreios(latency=0.05, error_rate={'solicitaEtiquetas': 1}, faults={'buscaCliente': u'Bloqueado'})
+    with MockServer(correios) as server:
+        sigep = make_sigep(server)
+        with pytest.raises(WebFault) as exc:
+            sigep.request_tracking_codes('124849')
+        assert u'Erro simulado' in exc.value.fault.faultstring
+        with pytest.raises(WebFault):
+            sigep.get_client_data()
+
+        start = time.time()
+        assert sigep.check_service_available('04162', '01310100') == '0#'
+        assert time.time() - start >= 0.05
+    assert correios.calls == {'solicitaEtiquetas': 1, 'buscaCliente': 1, 'verificaDisponibilidadeServico': 1}
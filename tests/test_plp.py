@@ -0,0 +1,106 @@
+# coding: utf-8
+from lxml import etree
+
+from sigep import plp, schema, templates
+
+sender_info = {
+    'name': 'Sigepy',
+    'street': 'Av Presidente Vargas',
+    'number': '1265',
+    'complement': 'Cj 401',
+    'neighborhood': '',
+    'zipcode': '14020273',
+    'city': u'Ribeirão Preto',
+    'state': 'SP',
+    'phone': '',
+    'fax': '',
+    'email': 'dev@stored.com.br',
+}
+
+header = {
+    'card': '0001', 'contract': '0042', 'regional_code': 60, 'admin_code': '0001', 'sender_info': sender_info,
+}
+
+
+def make_object(number, **kwargs):
+    obj = {
+        'tracking_code': 'PC%06dHK' % number,
+        'service_code': '1',
+        'weight': '1',
+        'receiver_name': 'Joao Daher',
+        'receiver_home_phone': '1122223333',
+        'receiver_mobile_phone': '',
+        'receiver_email': 'joao@stored.com',
+        'receiver_address': 'Rua Galileu Galilei',
+        'receiver_complement': '',
+        'receiver_number': '1067',
+        'receiver_neighborhood': 'Jardim Iraja',
+        'receiver_city': 'Passos',
+        'receiver_state': 'MG',
+        'receiver_zip_code': '37902000',
+        'nfe_number': '332323',
+        'is_insurance': True,
+        'total': '300',
+        'dimension_height': '15',
+        'dimension_width': '15',
+        'dimension_length': '20',
+        'dimension_diameter': '5',
+    }
+    obj.update(kwargs)
+    return obj
+
+
+def canonical(element):
+    for node in element.iter():
+        node.text = (node.text or '').strip() or None
+        node.tail = None
+    return etree.tostring(element)
+
+
+class TestPLPBuilder:
+    def test_same_document_as_template(self):
+        object_list = [make_object(1), make_object(2, nfe_number='', is_insurance=False)]
+
+        xml, tracking_code_list = plp.build_plp(object_list=object_list, **header)
+        rendered = templates.render(templates.PLP_TEMPLATE, object_list=object_list, **header)
+
+        assert tracking_code_list == ['PC000001HK', 'PC000002HK']
+        assert canonical(etree.fromstring(xml)) == canonical(etree.fromstring(rendered.encode('iso-8859-1')))
+        schema.validate(xml)
+
+    def test_generator(self):
+        xml, tracking_code_list = plp.build_plp(object_list=(make_object(i) for i in range(50)), **header)
+
+        assert len(tracking_code_list) == 50
+        assert len(etree.fromstring(xml).findall('objeto_postal')) == 50
+        schema.validate(xml)
+
+    def test_encoding_and_cdata(self):
+        object_list = [make_object(1, receiver_address=u'Rua  São   João', receiver_complement=u'Sala €')]
+        xml, _ = plp.build_plp(object_list=object_list, **header)
+
+        assert xml.startswith(b"<?xml version='1.0' encoding='ISO-8859-1'?>")
+        assert u'<![CDATA[Rua  São   João]]>'.encode('iso-8859-1') in xml
+        assert b'<complemento_destinatario>Sala &#8364;</complemento_destinatario>' in xml
+
+        doc = etree.fromstring(xml)
+        assert doc.findtext('objeto_postal/destinatario/logradouro_destinatario') == u'Rua  São   João'
+        assert doc.findtext('objeto_postal/destinatario/complemento_destinatario') == u'Sala €'
+
+    def test_shard_objects(self):
+        object_list = [make_object(i, service_code=str(i % 2)) for i in range(5)]
+
+        shards = list(plp.shard_objects(iter(object_list), 2))
+        assert [len(shard) for shard in shards] == [2, 2, 1]
+
+        shards = list(plp.shard_objects(object_list, 2, group_by_service=True))
+        assert [[item['service_code'] for item in shard] for shard in shards] == [['0', '0'], ['1', '1'], ['0']]
+
+    def test_iter_objects(self):
+        object_list = [make_object(i, receiver_city=u'São Paulo') for i in range(3)]
+        xml, _ = plp.build_plp(object_list=object_list, **header)
+
+        objects = list(plp.iter_objects(xml))
+        assert [obj['numero_etiqueta'] for obj in objects] == ['PC000000HK', 'PC000001HK', 'PC000002HK']
+        assert objects[0]['nacional']['cidade_destinatario'] == u'São Paulo'
+        assert objects[0]['servico_adicional']['codigo_servico_adicional'] == ['025', '019']
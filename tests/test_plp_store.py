@@ -0,0 +1,66 @@
+# coding: utf-8
+import gzip
+import os
+import threading
+
+from sigep import plp
+from sigep.plp_store import PLPStore
+from tests.test_plp import header, make_object
+
+
+class FakeSigep(object):
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def request_xml_plp(self, plp_number, tracking_code_list):
+        with self._lock:
+            self.calls.append(plp_number)
+        if plp_number == 404:
+            raise ValueError('PLP not found')
+        xml, _ = plp.build_plp(object_list=[make_object(plp_number, receiver_city=u'São Paulo')], **header)
+        return xml.decode(plp.ENCODING)
+
+
+class TestPLPStore:
+    def test_get(self, tmpdir):
+        sigep = FakeSigep()
+        store = PLPStore(sigep, str(tmpdir), maxsize=1)
+
+        xml = store.get(1)
+        assert xml.startswith(u'<?xml version="1.0" encoding="UTF-8"?>')
+        assert u'São Paulo' in xml
+        assert store.get(1) == xml
+        assert sigep.calls == [1]
+
+        with gzip.open(os.path.join(str(tmpdir), '1.xml.gz')) as fp:
+            assert fp.read().decode('utf-8') == xml
+
+        # fora da memória, lido do disco e por outra instância
+        store.get(2)
+        assert 1 in store and 3 not in store
+        assert PLPStore(sigep, str(tmpdir)).get(1) == xml
+        assert sigep.calls == [1, 2]
+
+    def test_iter_objects(self, tmpdir):
+        store = PLPStore(FakeSigep(), str(tmpdir), maxsize=1)
+        store.get(1)
+        store.get(2)
+
+        objects = list(store.iter_objects(1))
+        assert [obj['numero_etiqueta'] for obj in objects] == ['PC000001HK']
+        assert objects[0]['nacional']['cidade_destinatario'] == u'São Paulo'
+        assert [obj['numero_etiqueta'] for obj in store.iter_objects(3)] == ['PC000003HK']
+
+    def test_fetch_many(self, tmpdir):
+        sigep = FakeSigep()
+        store = PLPStore(sigep, str(tmpdir))
+        store.get(1)
+
+        results = store.fetch_many(['1', 2, 3, 404, 2])
+        assert results[1] == {'status': True, 'cached': True}
+        assert results[2] == results[3] == {'status': True, 'cached': False}
+        assert results[404]['status'] is False
+        assert sorted(sigep.calls) == [1, 2, 3, 404]
+        assert 404 not in store
+        assert not [name for name in os.listdir(str(tmpdir)) if name.startswith('.')]
@@ -0,0 +1,103 @@
+# coding: utf-8
+import socket
+import threading
+import time
+
+import httpretty
+import pytest
+from suds import WebFault
+from suds.sudsobject import Factory
+
+from sigep.mock_server import MockCorreios, MockServer
+from sigep.pool import ClientPool, PoolTimeout
+from tests.test_sigep import dev
+
+
+class TestClientPool:
+    def test_checkout(self):
+        created = []
+
+        def factory():
+            created.append(object())
+            return created[-1]
+
+        pool = ClientPool(factory, maxsize=2, timeout=0.05, idle_timeout=None)
+        first = pool.checkout()
+        with pool.client() as second:
+            assert second is not first
+            with pytest.raises(PoolTimeout):
+                pool.checkout()
+        assert pool.checkout() is second
+        pool.checkin(first)
+        pool.checkin(second)
+        assert len(created) == 2
+
+        stats = pool.stats()
+        assert (stats['size'], stats['idle'], stats['in_use']) == (2, 2, 0)
+        assert (stats['checkouts'], stats['created'], stats['timeouts']) == (3, 2, 1)
+        assert stats['wait']['count'] == 3
+
+    def test_discard_on_error(self):
+        pool = ClientPool(object, maxsize=1, timeout=0.05)
+        with pytest.raises(socket.error):
+            with pool.client() as client:
+                raise socket.error('connection reset')
+
+        assert pool.checkout() is not client
+        stats = pool.stats()
+        assert (stats['size'], stats['discarded'], stats['created']) == (1, 1, 2)
+
+    @pytest.mark.parametrize('error', [
+        ValueError('invalid zip code'),
+        WebFault(Factory.object('Fault', dict(faultstring='CEP de destino invalido')), None),
+    ])
+    def test_keep_on_fault(self, error):
+        pool = ClientPool(object, maxsize=1, timeout=0.05)
+        with pytest.raises(type(error)):
+            with pool.client() as client:
+                raise error
+
+        assert pool.checkout() is client
+        stats = pool.stats()
+        assert (stats['size'], stats['discarded'], stats['created']) == (1, 0, 1)
+
+    def test_idle_eviction(self):
+        pool = ClientPool(object, maxsize=2, idle_timeout=0.01)
+        client = pool.checkout()
+        pool.checkin(client)
+        time.sleep(0.02)
+        assert pool.checkout() is not client
+        assert pool.stats()['evicted'] == 1
+
+    def test_concurrent_calls(self):
+        httpretty.disable()
+        with MockServer(MockCorreios(latency=0.2)) as server:
+            pool = ClientPool.sigep(maxsize=4, url=server.sigep_wsdl_url, **dev)
+            results = []
+
+            def check():
+                with pool.client() as sigep:
+                    results.append(sigep.check_service_available('04162', '01310100'))
+
+            threads = [threading.Thread(target=check) for _ in range(4)]
+            start = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            assert results == ['0#'] * 4
+            assert time.time() - start < 0.6
+            clients = [client for client, _ in pool._idle]
+            assert len(set(id(client.client) for client in clients)) == 4
+            assert len(set(id(client.client.wsdl) for client in clients)) == 1
+
+    def test_sro(self):
+        httpretty.disable()
+        with MockServer(MockCorreios()) as server:
+            server.correios.add_event('PC000000014BR')
+            pool = ClientPool.sro('sigepy', 'sigepy@pass', maxsize=2, url=server.rastro_wsdl_url, fast_parse=True)
+            with pool.client() as first, pool.client() as second:
+                assert first.client.wsdl is second.client.wsdl
+                assert first.find_by_tracking_code('PC000000014BR')['status'] is True
+                assert second.find_by_tracking_code('PC000000014BR')['status'] is True
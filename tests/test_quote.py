@@ -0,0 +1,107 @@
+# coding: utf-8
+import decimal
+
+import httpretty
+
+from sigep import quote
+
+RESPONSE = """<?xml version="1.0" encoding="ISO-8859-1" ?>
+<Servicos>
+    <cServico>
+        <Codigo>04014</Codigo><Valor>1.024,50</Valor><PrazoEntrega>3</PrazoEntrega>
+        <ValorSemAdicionais>1.024,50</ValorSemAdicionais><EntregaDomiciliar>S</EntregaDomiciliar>
+        <EntregaSabado>N</EntregaSabado><Erro>011</Erro><MsgErro>Entrega em prazo estendido.</MsgErro>
+    </cServico>
+    <cServico>
+        <Codigo>4510</Codigo><Valor>0,00</Valor><PrazoEntrega>0</PrazoEntrega>
+        <EntregaDomiciliar></EntregaDomiciliar><EntregaSabado></EntregaSabado>
+        <Erro>-3</Erro><MsgErro>CEP de destino invalido.</MsgErro>
+    </cServico>
+</Servicos>
+"""
+
+
+def package(service_code, receiver_zip_code='01310-100', weight=250, **kwargs):
+    request = {
+        'service_code': service_code, 'receiver_zip_code': receiver_zip_code, 'weight': weight,
+        'dimension_height': 2, 'dimension_width': 11, 'dimension_length': 16,
+    }
+    request.update(kwargs)
+    return request
+
+
+class TestQuote:
+    def test_weight_bracket(self):
+        assert quote.weight_bracket(1) == 300
+        assert quote.weight_bracket(300) == 300
+        assert quote.weight_bracket(300.5) == 500
+        assert quote.weight_bracket(1200) == 2000
+        assert quote.weight_bracket(31200) == 32000
+
+    def test_price_client(self):
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(httpretty.GET, quote.URL, body=RESPONSE)
+        try:
+            data = quote.PriceClient().quote(['04014', '04510'], '57010-000', '1310100', 500, 2, 11, 16)
+            request = httpretty.last_request()
+        finally:
+            httpretty.disable()
+
+        assert request.querystring['nCdServico'] == ['04014,04510']
+        assert request.querystring['sCepDestino'] == ['01310100']
+        assert request.querystring['nVlPeso'] == ['0.5']
+        assert data['04014']['status'] is True
+        assert data['04014']['price'] == decimal.Decimal('1024.50')
+        assert data['04014']['delivery_time'] == 3
+        assert data['04510']['status'] is False
+        assert data['04510']['erro'] == u'CEP de destino invalido.'
+
+    def test_engine(self):
+        client = quote.StubPriceClient()
+        engine = quote.QuoteEngine(client, origin_zip_code='57010000')
+
+        results = engine.quote_many([
+            package('04014'), package('04510'), package('04014', weight=280), package('04014', '01310100'),
+            package('40010'),
+        ])
+        assert [result['service_code'] for result in results] == ['04014', '04510', '04014', '04014', '40010']
+        assert results[0] is results[2] is results[3]
+        assert results[0]['price'] == decimal.Decimal('24.50')
+        assert results[4]['status'] is False
+        # uma única chamada para os três serviços da mesma encomenda
+        assert client.calls == [(('04014', '04510', '40010'), '57010000', '01310100', 300)]
+
+        assert engine.quote('04510', '01310-100', 300, dimension_height=2, dimension_width=11,
+                            dimension_length=16)['delivery_time'] == 7
+        assert len(client.calls) == 1
+
+        engine.quote_many([package('04014', weight=1500), package('04014', '01310200', weight=1500)])
+        assert len(client.calls) == 3
+
+    def test_unpadded_service_code(self):
+        client = quote.StubPriceClient()
+        engine = quote.QuoteEngine(client, origin_zip_code='57010000')
+        results = engine.quote_many([package('4014'), package(4014), package('04014')])
+        assert [result['service_code'] for result in results] == ['04014'] * 3
+        assert results[0]['status'] is True
+        assert results[0] is results[1] is results[2]
+        assert client.calls == [(('04014',), '57010000', '01310100', 300)]
+        assert client.quote(['4510'], '57010000', '01310100', 300)['04510']['status'] is True
+
+    def test_zip_code_key(self):
+        client = quote.StubPriceClient()
+        engine = quote.QuoteEngine(client, origin_zip_code='57010000', zip_code_key=lambda zip_code: zip_code[:5])
+        engine.quote_many([package('04014', '01310100'), package('04014', '01310200')])
+        assert len(client.calls) == 1
+
+    def test_failure(self):
+        class FailingClient(quote.StubPriceClient):
+            def quote(self, service_codes, *args, **kwargs):
+                raise IOError('timeout')
+
+        engine = quote.QuoteEngine(FailingClient(), origin_zip_code='57010000')
+        result = engine.quote_many([package('04014')])[0]
+        assert result['status'] is False
+        assert isinstance(result['erro'], IOError)
+        assert len(engine.memory) == 0
@@ -0,0 +1,87 @@
+# coding: utf-8
+import datetime
+
+import pytest
+
+from sigep import records
+from sigep.cache import SQLiteCache
+from sigep.correios_client import TrackingCache
+
+
+def tracking_result(tracking_code):
+    return {
+        'status': True,
+        'tracking_code': tracking_code,
+        'sigla': u'JF',
+        'name': u'REMESSA ECONÔMICA C/AR DIGITAL',
+        'category': u'REMESSA ECONÔMICA TALÃO/CARTÃO',
+        'event_list': [{
+            'status': u'01', 'city': u'MACEIO', 'code': u'57060971', 'description': u'Objeto entregue',
+            'hour': u'18:37', 'date': u'18/03/2014', 'local': u'CTCE MACEIO', 'uf': u'AL', 'type': u'BDE',
+            'destiny': None,
+        }, {
+            'status': u'01', 'city': u'SAO PAULO', 'code': u'05311900', 'description': u'Objeto encaminhado',
+            'hour': u'09:05', 'date': u'15/03/2014', 'local': u'CTE VILA MARIA', 'uf': u'SP', 'type': u'DO',
+            'destiny': {
+                'local': u'CTCE MACEIO', 'codigo': u'57060971', 'cidade': u'MACEIO', 'bairro': u'TABULEIRO',
+                'uf': u'AL',
+            },
+        }],
+        'current_status': u'Objeto entregue',
+    }
+
+
+class FakeSROClient(object):
+    as_records = True
+
+    def find_by_tracking_code(self, tracking_code, last_result=False):
+        return records.TrackedObject.from_dict(tracking_result(tracking_code))
+
+
+class TestRecords:
+    def test_round_trip(self):
+        data = tracking_result(u'JF598971235BR')
+        obj = records.TrackedObject.from_dict(data)
+        assert obj.to_dict() == data
+        assert obj['current_status'] == u'Objeto entregue'
+        assert obj.event_list[0].datetime == datetime.datetime(2014, 3, 18, 18, 37)
+        assert obj.event_list[1]['destiny']['cidade'] == u'MACEIO'
+        assert obj.get('erro') is None
+        with pytest.raises(AttributeError):
+            obj.extra = 1
+
+        error = records.TrackedObject.from_dict({'status': False, 'tracking_code': u'PN123456789BR', 'erro': u'X'})
+        assert error.to_dict() == {'status': False, 'tracking_code': u'PN123456789BR', 'erro': u'X'}
+        with pytest.raises(KeyError):
+            error['event_list']
+
+    def test_intern(self):
+        first = records.TrackedObject.from_dict(tracking_result(u'JF598971235BR'))
+        second = records.TrackedObject.from_dict(tracking_result(u'JF598971249BR'))
+        assert first.event_list[0].city is second.event_list[0].city
+        assert first.event_list[0].uf is first.event_list[1].destiny.uf
+
+    def test_intern_limit(self, monkeypatch):
+        monkeypatch.setattr(records, 'MAX_STRINGS', 3)
+        monkeypatch.setattr(records, '_strings', {})
+        for number in range(10):
+            records.intern_text(u'DESTINATARIO %d' % number)
+            assert len(records._strings) <= 3
+
+        text = records.intern_text(u'MACEIO')
+        assert records.intern_text(u''.join([u'MACE', u'IO'])) is text
+
+    def test_invalid_date(self):
+        data = tracking_result(u'JF598971235BR')['event_list'][0]
+        data.update(date=u'', hour=u'')
+        event = records.Event.from_dict(data)
+        assert event.datetime is None
+        assert (event.date, event.hour) == (u'', u'')
+
+    def test_tracking_cache(self, tmpdir):
+        backend = SQLiteCache(str(tmpdir.join('tracking.db')))
+        TrackingCache(FakeSROClient(), backend=backend).find_by_tracking_code('JF598971235BR')
+
+        result = TrackingCache(FakeSROClient(), backend=backend).find_by_tracking_code('JF598971235BR')
+        assert isinstance(result, records.TrackedObject)
+        assert result == records.TrackedObject.from_dict(tracking_result(u'JF598971235BR'))
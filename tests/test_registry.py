@@ -0,0 +1,94 @@
+# coding: utf-8
+import threading
+
+import httpretty
+import pytest
+
+from sigep.mock_server import MockCorreios, MockServer
+from sigep.registry import ClientRegistry
+from tests.test_sigep import dev
+
+
+def test_shared_clients():
+    registry = ClientRegistry(wsdl_snapshot=True, sro_options={'fast_parse': True})
+    registry.register('a', sigep=dev, sro={'affiliation_id': 'a', 'password': 'a@pass'})
+    registry.register('b', sigep=dict(dev, contract='0043', card='0002'), sro={'affiliation_id': 'b', 'password': 'b'})
+    registry.register('c', sigep=dev)
+
+    a, b = registry.sigep('a'), registry.sigep('b')
+    assert a is registry.sigep('a')
+    assert a.client is not b.client
+    assert a.client.wsdl is b.client.wsdl
+    assert (a.contract, a.card) == ('0042', '0001')
+    assert (b.contract, b.card) == ('0043', '0002')
+    assert registry.sro('a').client is not registry.sro('b').client
+    assert registry.sro('a').client.wsdl is registry.sro('b').client.wsdl
+    assert registry.sro('b').affiliation_id == 'b'
+    assert registry.sro('b').fast_parse
+
+    with pytest.raises(KeyError):
+        registry.sro('c')
+    with pytest.raises(KeyError):
+        registry.sigep('d')
+
+    registry.register('a', sigep=dict(dev, user='other'))
+    assert registry.sigep('a').user == 'other'
+    assert registry.sigep('a').client.wsdl is b.client.wsdl
+
+
+def test_register_while_creating():
+    registry = ClientRegistry(wsdl_snapshot=True)
+    registry.register('a', sigep=dev)
+    client = registry._client
+
+    def reregister(factory, url):
+        # outra thread registra o contrato de novo enquanto o primeiro handle é criado
+        registry._client = client
+        registry.register('a', sigep=dict(dev, user='other'))
+        return client(factory, url)
+
+    registry._client = reregister
+    assert registry.sigep('a').user == 'other'
+    assert registry.sigep('a') is registry.sigep('a')
+
+    registry.register('b', sigep=dev)
+    registry._client = lambda factory, url: registry.unregister('b') or client(factory, url)
+    with pytest.raises(KeyError):
+        registry.sigep('b')
+
+
+def test_calls_per_tenant():
+    httpretty.disable()
+    with MockServer(MockCorreios()) as server:
+        registry = ClientRegistry(sigep_url=server.sigep_wsdl_url)
+        registry.register('a', sigep=dev)
+        registry.register('b', sigep=dict(dev, card='0002'))
+
+        assert registry.sigep('a').get_client_data().contratos[0].cartoesPostagem[0].numero == '0001'
+        assert registry.sigep('b').get_client_data().contratos[0].cartoesPostagem[0].numero == '0002'
+
+
+def test_concurrent_tenants():
+    httpretty.disable()
+    with MockServer(MockCorreios()) as server:
+        registry = ClientRegistry(sigep_url=server.sigep_wsdl_url)
+        cards = ['%04d' % number for number in range(1, 7)]
+        for card in cards:
+            registry.register(card, sigep=dict(dev, card=card))
+
+        errors = []
+
+        def check(card):
+            sigep = registry.sigep(card)
+            for _ in range(10):
+                try:
+                    assert sigep.get_client_data().contratos[0].cartoesPostagem[0].numero == card
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=check, args=(card,)) for card in cards]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
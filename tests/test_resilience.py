@@ -0,0 +1,162 @@
+# coding: utf-8
+import socket
+import time
+
+import httpretty
+import pytest
+from suds import WebFault
+
+from sigep import wsdl
+from sigep.mock_server import MockCorreios, MockServer
+from sigep.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, Policy, deadline, remaining
+from sigep.sigep_client import Sigep
+from sigep.transport import PooledTransport
+from tests.test_sigep import dev
+
+
+class Flaky(object):
+    def __init__(self, failures, error=socket.error):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error('falha')
+        return 'OK'
+
+
+def test_retry():
+    policy = Policy(attempts=3, backoff=0.001, seed=1)
+    function = Flaky(2)
+    assert policy.call('sigep', 'buscaServicos', function) == 'OK'
+    assert function.calls == 3
+
+    function = Flaky(3)
+    with pytest.raises(socket.error):
+        policy.call('sigep', 'buscaServicos', function)
+    assert function.calls == 3
+
+    # erros de negócio não são repetidos
+    function = Flaky(1, error=ValueError)
+    with pytest.raises(ValueError):
+        policy.call('sigep', 'buscaServicos', function)
+    assert function.calls == 1
+
+
+def test_non_idempotent_is_not_retried():
+    policy = Policy(attempts=3, backoff=0.001)
+    for operation in ('fechaPlpVariosServicos', 'solicitaEtiquetas'):
+        function = Flaky(1)
+        with pytest.raises(socket.error):
+            policy.call('sigep', operation, function)
+        assert function.calls == 1
+
+
+def test_circuit_breaker():
+    policy = Policy(attempts=1, breaker=lambda: CircuitBreaker(window=4, min_calls=4, reset_timeout=0.05))
+    for _ in range(4):
+        with pytest.raises(socket.error):
+            policy.call('sigep', 'buscaServicos', Flaky(1))
+
+    function = Flaky(0)
+    with pytest.raises(CircuitOpenError):
+        policy.call('sigep', 'buscaServicos', function)
+    assert function.calls == 0
+    # outros endpoints não são afetados
+    assert policy.call('rastro', 'buscaEventos', function) == 'OK'
+
+    time.sleep(0.06)
+    assert policy.call('sigep', 'buscaServicos', function) == 'OK'
+    assert policy.breakers['sigep'].state == CircuitBreaker.CLOSED
+
+
+def test_deadline():
+    assert remaining() is None
+    with deadline(10):
+        with deadline(20):
+            assert 9 < remaining() <= 10
+    assert remaining() is None
+
+    policy = Policy(timeout=0.05)
+    start = time.time()
+    with pytest.raises(DeadlineExceeded):
+        policy.call('sigep', 'buscaServicos', lambda: time.sleep(1))
+    assert time.time() - start < 0.5
+
+
+def test_attempt_client():
+    from suds.client import Client
+
+    client = Client(wsdl.snapshot_url(wsdl.SIGEP_WSDL))
+    # as tentativas em outra thread (com prazo ou requisição de reserva) não usam o cliente da thread que chamou
+    clone = Policy(timeout=1).call('sigep', 'buscaServicos', lambda: wsdl.thread_client(client))
+    assert clone is not client and clone.wsdl is client.wsdl
+    assert Policy().call('sigep', 'buscaServicos', lambda: wsdl.thread_client(client)) is client
+
+
+@pytest.fixture
+def server():
+    httpretty.disable()
+    with MockServer(MockCorreios(seed=1)) as server:
+        yield server
+
+
+def test_sigep_deadline(server):
+    server.correios.latency = 0.5
+    sigep = Sigep(url=server.sigep_wsdl_url, resilience=Policy(timeout=0.1, attempts=1), **dev)
+    start = time.time()
+    with pytest.raises(DeadlineExceeded):
+        sigep.check_service_available('04162', '01310100')
+    assert time.time() - start < 0.4
+
+    # no transporte com pool o prazo também limita as operações que não são repetidas
+    sigep = Sigep(url=server.sigep_wsdl_url, transport=PooledTransport(),
+                  resilience=Policy(timeout=0.1, attempts=1), **dev)
+    with pytest.raises(socket.timeout):
+        sigep.request_tracking_codes('124849')
+
+
+def test_sigep_faults_are_not_retried(server):
+    server.correios.faults['buscaCliente'] = u'Bloqueado'
+    sigep = Sigep(url=server.sigep_wsdl_url, resilience=Policy(attempts=3), **dev)
+    with pytest.raises(WebFault):
+        sigep.get_client_data()
+    assert server.correios.calls['buscaCliente'] == 1
+    assert sigep.resilience.breakers[sigep.url].state == CircuitBreaker.CLOSED
+
+
+def test_hedged_request(server):
+    delays = [0.5]
+    server.correios.latency = lambda operation: delays.pop() if delays else 0
+
+    policy = Policy(hedge=True)
+    for _ in range(20):
+        policy.observe('verificaDisponibilidadeServico', 0.02)
+    sigep = Sigep(url=server.sigep_wsdl_url, resilience=policy, **dev)
+
+    start = time.time()
+    assert sigep.check_service_available('04162', '01310100') == '0#'
+    assert time.time() - start < 0.4
+    assert server.correios.calls['verificaDisponibilidadeServico'] == 2
+
+
+def test_instrumentation_under_deadline(server):
+    from sigep import metrics
+    from sigep.correios_client import CorreiosSROClient
+
+    server.correios.add_event('PC000000014BR')
+    server.correios.latency = 0.02
+    calls = []
+    client = CorreiosSROClient(
+        'sigepy', 'sigepy@pass', url=server.rastro_wsdl_url, fast_parse=True,
+        instrumentation=metrics.Instrumentation(after=[calls.append]), resilience=Policy(timeout=5),
+    )
+    assert client.find_by_tracking_code('PC000000014BR')['status'] is True
+
+    # a tentativa roda em outra thread, mas a rede e os bytes são medidos na chamada de quem consultou
+    call, = calls
+    assert call.phases['network'] >= 0.02
+    assert call.phases['parse'] < call.phases['network']
+    assert call.request_bytes > 0 and call.response_bytes > 0
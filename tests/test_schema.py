@@ -0,0 +1,50 @@
+# coding: utf-8
+import threading
+
+import pytest
+from lxml import etree
+
+INVALID_XML = b'<correioslog><tipo_arquivo>Postagem</tipo_arquivo></correioslog>'
+
+
+class TestSchemaRegistry:
+    @pytest.fixture
+    def registry(self):
+        from sigep.schema import SchemaRegistry
+        return SchemaRegistry()
+
+    def test_compiled_once(self, registry):
+        schema, lock = registry.get()
+        assert registry.get('xml/schema.xsd')[0] is schema
+
+        registry.clear()
+        assert registry.get()[0] is not schema
+
+    def test_validate_bytes_and_tree(self, registry):
+        with pytest.raises(etree.DocumentInvalid):
+            registry.validate(INVALID_XML)
+
+        with pytest.raises(etree.DocumentInvalid):
+            registry.validate(etree.fromstring(INVALID_XML))
+
+        with pytest.raises(etree.DocumentInvalid):
+            registry.validate(etree.ElementTree(etree.fromstring(INVALID_XML)))
+
+    def test_validate_from_threads(self, registry):
+        registry.preload()
+        errors = []
+
+        def worker():
+            for _ in range(20):
+                try:
+                    registry.validate(INVALID_XML)
+                except etree.DocumentInvalid as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(errors) == 80
@@ -47,6 +47,11 @@ class TestSigep:
         client = Sigep(**dev)
         return client
 
+    @pytest.fixture
+    def snapshot_client(self):
+        from sigep.sigep_client import Sigep
+        return Sigep(wsdl_snapshot=True, **dev)
+
     def test_available_services(self, client):
         httpretty.enable()
         data = """
@@ -284,3 +289,86 @@ class TestSigep:
             'plp_id': 10,
             'tracking_code_list': [client._remove_dv_tracking_code(code) for code in ['PC000001HK', 'PC000002HK']],
         }
+
+    def test_create_plps(self, snapshot_client):
+        client = snapshot_client
+        httpretty.enable()
+        body = fake_body(10)
+        httpretty.register_uri(httpretty.POST, SOAP_URL, body=body)
+
+        obj = {
+            'tracking_code': 'PC000001HK',
+            'service_code': '1',
+            'weight': '1',
+            'receiver_name': 'Joao Daher',
+            'receiver_home_phone': '1122223333',
+            'receiver_mobile_phone': '',
+            'receiver_email': 'joao@stored.com',
+            'receiver_address': 'Rua Galileu Galilei',
+            'receiver_complement': '',
+            'receiver_number': '1067',
+            'receiver_neighborhood': 'Jardim Iraja',
+            'receiver_city': 'Passos',
+            'receiver_state': 'MG',
+            'receiver_zip_code': '37902000',
+            'nfe_number': '332323',
+            'is_insurance': True,
+            'total': '300',
+            'dimension_height': '15',
+            'dimension_width': '15',
+            'dimension_length': '20',
+            'dimension_diameter': '5',
+        }
+        obj_list = [
+            dict(obj, tracking_code='PC000001HK'),
+            dict(obj, tracking_code='PC000002HK'),
+            dict(obj, tracking_code='PC000003HK', receiver_state='XX'),
+            dict((key, value) for key, value in obj.items() if key != 'tracking_code'),
+        ]
+        data = client.create_plps(intern_plp_number='003', object_list=obj_list, shard_size=2)
+
+        assert data[0] == {
+            'status': True,
+            'intern_plp_number': 3,
+            'plp_id': 10,
+            'tracking_code_list': [client._remove_dv_tracking_code(code) for code in ['PC000001HK', 'PC000002HK']],
+        }
+        assert data[1]['status'] is False
+        assert data[1]['intern_plp_number'] == 4
+        assert data[1]['tracking_code_list'] == [client._remove_dv_tracking_code('PC000003HK'), None]
+
+    def test_instrumentation(self):
+        from sigep import metrics
+        from sigep.sigep_client import Sigep
+
+        collector = metrics.HistogramCollector()
+        calls = []
+        instrumentation = metrics.Instrumentation(before=[calls.append], after=[collector])
+        client = Sigep(wsdl_snapshot=True, instrumentation=instrumentation, **dev)
+
+        httpretty.reset()
+        httpretty.enable()
+        body = """
+        <x:Envelope xmlns:x="http://schemas.xmlsoap.org/soap/envelope/" xmlns:cli="http://cliente.bean.master.sigep.bsb.correios.com.br/">
+            <x:Body>
+                <cli:buscaServicos>
+                    <x:ID>SEDEX</x:ID>
+                </cli:buscaServicos>
+            </x:Body>
+        </x:Envelope>
+        """
+        httpretty.register_uri(httpretty.POST, SOAP_URL, body=body)
+        try:
+            assert client.search_service() == ['SEDEX']
+            httpretty.register_uri(httpretty.POST, SOAP_URL, status=404, body='')
+            with pytest.raises(Exception):
+                client.get_client_data()
+        finally:
+            httpretty.disable()
+
+        assert [call.operation for call in calls] == ['buscaServicos', 'buscaCliente']
+        data = collector.snapshot()
+        assert sorted(data['buscaServicos']['phases']) == ['network', 'parse', 'total']
+        assert data['buscaServicos']['request_bytes'] > 0
+        assert data['buscaServicos']['response_bytes'] == len(body)
+        assert data['buscaCliente']['errors']
@@ -0,0 +1,50 @@
+# coding: utf-8
+import os
+
+import pytest
+
+
+class TestTemplateCache:
+    @pytest.fixture
+    def cache(self):
+        from sigep.templates import TemplateCache
+        return TemplateCache()
+
+    def test_compiled_once(self, cache):
+        template = cache.get()
+        assert cache.get('xml/plp.xml') is template
+
+        cache.configure()
+        assert cache.get() is not template
+
+    def test_custom_template(self, cache, tmpdir):
+        path = tmpdir.join('plp.xml')
+        path.write('<versao_arquivo>{{ version }}</versao_arquivo>')
+
+        assert cache.render(str(path), version='2.4') == '<versao_arquivo>2.4</versao_arquivo>'
+
+        # auto_reload desligado, o template compilado continua em uso
+        path.write('<versao_arquivo>{{ version }}</versao_arquivo><plp/>')
+        assert cache.render(str(path), version='2.4') == '<versao_arquivo>2.4</versao_arquivo>'
+
+    def test_bytecode_cache(self, cache, tmpdir):
+        directory = str(tmpdir.join('bytecode'))
+        cache.configure(bytecode_cache_dir=directory)
+        cache.preload()
+
+        assert len(os.listdir(directory)) == 1
+
+
+def test_sigep_preload(monkeypatch, tmpdir):
+    from sigep import templates
+    from sigep.sigep_client import Sigep
+
+    loaded = []
+    monkeypatch.setattr(templates, 'preload', lambda *paths: loaded.extend(paths))
+    # o template padrão é escrito pelo sigep.plp, sem passar pelo Jinja2
+    Sigep.preload()
+    Sigep.preload(Sigep.TEMPLATE)
+    assert loaded == []
+
+    Sigep.preload(str(tmpdir.join('plp.xml')))
+    assert loaded == [str(tmpdir.join('plp.xml'))]
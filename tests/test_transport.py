@@ -0,0 +1,179 @@
+# coding: utf-8
+import errno
+import gzip
+import httplib
+import io
+import socket
+
+import httpretty
+import pytest
+
+from tests.test_correios import SOAP_URL, dev
+
+body = """
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+ <soapenv:Body>
+ <ns2:buscaEventosResponse xmlns:ns2="http://resource.webservice.correios.com.br/">
+ <return>
+ <versao>2.0</versao>
+ <qtd>1</qtd>
+ <objeto>
+ <numero>JF598971235BR</numero>
+ <sigla>JF</sigla>
+ <nome>REMESSA ECONOMICA C/AR DIGITAL</nome>
+ <categoria>REMESSA ECONOMICA TALAO/CARTAO</categoria>
+ <evento>
+ <tipo>BDE</tipo>
+ <status>23</status>
+ <data>18/03/2014</data>
+ <hora>18:37</hora>
+ <descricao>Objeto devolvido ao remetente</descricao>
+ <local>CTCE MACEIO</local>
+ <codigo>57060971</codigo>
+ <cidade>MACEIO</cidade>
+ <uf>AL</uf>
+ </evento>
+ </objeto>
+ </return>
+ </ns2:buscaEventosResponse>
+ </soapenv:Body>
+</soapenv:Envelope>
+"""
+
+
+def gzip_body(content):
+    output = io.BytesIO()
+    with gzip.GzipFile(fileobj=output, mode='wb') as f:
+        f.write(content)
+    return output.getvalue()
+
+
+class FakeConnection(object):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeResponse(object):
+    status = 200
+    reason = 'OK'
+    will_close = False
+
+    def read(self):
+        return b'<ok/>'
+
+    def getheaders(self):
+        return [('content-type', 'text/xml; charset=utf-8')]
+
+
+class ScriptedConnection(FakeConnection):
+    """
+    Conexão que falha no envio (``send_error``) ou na leitura da resposta (``error``)
+    """
+
+    def __init__(self, error=None, send_error=None):
+        self.error = error
+        self.send_error = send_error
+        self.requests = []
+
+    def request(self, method, target, body, headers):
+        if self.send_error is not None:
+            raise self.send_error
+        self.requests.append(body)
+
+    def getresponse(self):
+        if self.error is not None:
+            raise self.error
+        return FakeResponse()
+
+
+class TestPooledTransport:
+    @pytest.fixture
+    def client(self):
+        from sigep.correios_client import CorreiosSROClient
+        from sigep.transport import PooledTransport
+        return CorreiosSROClient(wsdl_snapshot=True, transport=PooledTransport(pool_size=2), **dev)
+
+    def test_gzip_response(self, client):
+        httpretty.reset()
+        httpretty.enable()
+        httpretty.register_uri(httpretty.POST, SOAP_URL, body=gzip_body(body),
+                               adding_headers={'Content-Encoding': 'gzip'})
+
+        data = client.find_by_tracking_code(tracking_code='JF598971235BR')
+        assert data['status'] is True
+        assert data['current_status'] == u'Objeto devolvido ao remetente'
+        assert httpretty.last_request().headers['Accept-Encoding'] == 'gzip, deflate'
+
+        data = client.find_by_tracking_code(tracking_code='JF598971235BR')
+        assert data['tracking_code'] == u'JF598971235BR'
+        httpretty.disable()
+
+    def test_pool_reuse(self):
+        from sigep.transport import ConnectionPool
+        pool = ConnectionPool(pool_size=1)
+        first, second = FakeConnection(), FakeConnection()
+
+        pool.put('https', 'apps.correios.com.br', 443, first)
+        pool.put('https', 'apps.correios.com.br', 443, second)
+        assert second.closed and not first.closed
+
+        assert pool.get('https', 'apps.correios.com.br', 443) == (first, True)
+
+        pool.put('https', 'apps.correios.com.br', 443, first)
+        pool.clear()
+        assert first.closed
+
+    def _transport(self, reused, fresh):
+        from sigep.transport import PooledTransport
+        transport = PooledTransport(pool_size=2)
+        transport.pool.put('https', 'apps.correios.com.br', 443, reused)
+        opened = []
+
+        def new_connection(*args):
+            opened.append(fresh)
+            return fresh
+        transport.pool._new_connection = new_connection
+        return transport, opened
+
+    def test_no_retry_after_timeout(self):
+        from suds.transport import Request
+        reused = ScriptedConnection(error=socket.timeout('timed out'))
+        transport, opened = self._transport(reused, ScriptedConnection())
+
+        request = Request('https://apps.correios.com.br/SigepMasterJPA/AtendeClienteService/AtendeCliente',
+                          b'<soap:Envelope><soap:Body><fechaPlpVariosServicos/></soap:Body></soap:Envelope>')
+        with pytest.raises(socket.timeout):
+            transport.send(request)
+        assert len(reused.requests) == 1
+        assert reused.closed
+        assert opened == []
+
+    def test_stale_connection(self):
+        from suds.transport import Request
+        url = 'https://apps.correios.com.br/SigepMasterJPA/AtendeClienteService/AtendeCliente'
+        fresh = ScriptedConnection()
+        transport, opened = self._transport(ScriptedConnection(error=httplib.BadStatusLine('')), fresh)
+        assert transport.send(Request(url, b'<a/>')).message == b'<ok/>'
+        assert opened == [fresh] and fresh.requests == [b'<a/>']
+
+        # conexão fechada durante o envio
+        fresh = ScriptedConnection()
+        reused = ScriptedConnection(send_error=socket.error(errno.EPIPE, 'Broken pipe'))
+        transport, opened = self._transport(reused, fresh)
+        transport.send(Request(url, b'<a/>'))
+        assert opened == [fresh]
+
+        # apenas uma nova tentativa
+        fresh = ScriptedConnection(error=httplib.BadStatusLine(''))
+        transport, opened = self._transport(ScriptedConnection(error=httplib.BadStatusLine('')), fresh)
+        with pytest.raises(httplib.BadStatusLine):
+            transport.send(Request(url, b'<a/>'))
+        assert opened == [fresh]
+
+        # resposta parcial não é repetida
+        transport, opened = self._transport(ScriptedConnection(error=httplib.BadStatusLine('HTTP/1.1 2')), fresh)
+        with pytest.raises(httplib.BadStatusLine):
+            transport.send(Request(url, b'<a/>'))
+        assert opened == []
@@ -0,0 +1,61 @@
+# coding: utf-8
+import pytest
+from lxml import etree
+
+from sigep import plp, schema
+from sigep.validator import ObjectValidator, field_elements
+from tests.test_plp import header, make_object
+
+INVALID = [
+    ('receiver_state', 'XX'),
+    ('receiver_state', ''),
+    ('receiver_name', 'x' * 51),
+    ('weight', '30001'),
+    ('weight', 'abc'),
+    ('weight', ''),
+    ('dimension_height', '1'),
+    ('dimension_width', '106'),
+    ('dimension_diameter', '5.5'),
+    ('tracking_code', 'PC0000000001BR'),
+    ('nfe_number', '123456789'),
+]
+
+
+def test_field_elements():
+    fields = field_elements()
+    assert fields['tracking_code'] == 'numero_etiqueta'
+    assert fields['receiver_state'] == 'uf_destinatario'
+    assert fields['total'] == 'valor_declarado'
+    assert 'is_insurance' not in fields
+
+
+@pytest.mark.parametrize('key,value', INVALID)
+def test_same_result_as_schema(key, value):
+    item = make_object(1, **{key: value})
+    errors = ObjectValidator().validate(item)
+    assert list(errors) == [key]
+
+    xml, _ = plp.build_plp(object_list=[item], **header)
+    with pytest.raises(etree.DocumentInvalid):
+        schema.validate(xml)
+
+
+def test_split():
+    object_list = [make_object(i) for i in range(10)]
+    object_list[3]['receiver_state'] = 'XX'
+    object_list[7]['weight'] = '99999'
+
+    valid, reports = ObjectValidator().split(iter(object_list))
+    assert [report['index'] for report in reports] == [3, 7]
+    assert reports[0]['tracking_code'] == 'PC000003HK'
+    assert 'uf_destinatario' in reports[0]['errors']['receiver_state']
+    assert len(valid) == 8
+
+    xml, _ = plp.build_plp(object_list=valid, **header)
+    schema.validate(xml)
+
+
+def test_process_pool():
+    object_list = [make_object(i, receiver_state='XX' if i % 10 == 0 else 'MG') for i in range(50)]
+    reports = ObjectValidator().validate_many(object_list, processes=2, chunk_size=7)
+    assert [report['index'] for report in reports] == [0, 10, 20, 30, 40]
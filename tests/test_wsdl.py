@@ -0,0 +1,67 @@
+# coding: utf-8
+import io
+import os
+import threading
+
+from sigep import wsdl
+
+
+class TestWsdl:
+    def test_snapshot_url(self):
+        for path in (wsdl.SIGEP_WSDL, wsdl.RASTRO_WSDL):
+            url = wsdl.snapshot_url(path)
+            assert url.startswith('file://')
+            assert os.path.isfile(url[len('file://'):])
+
+    def test_file_cache(self, tmpdir):
+        url = 'https://apps.correios.com.br/SigepMasterJPA/AtendeClienteService/AtendeCliente?wsdl'
+        cache = wsdl.file_cache(str(tmpdir), ttl=0)
+        assert cache.get(url) is None
+
+        cache.put(url, io.BytesIO(b'<definitions/>'))
+        assert cache.get(url).read() == b'<definitions/>'
+
+    def test_file_cache_ttl(self, tmpdir):
+        assert wsdl.file_cache(str(tmpdir)).duration == ('seconds', wsdl.CACHE_TTL)
+        assert wsdl.file_cache(str(tmpdir), ttl=3600).duration == ('seconds', 3600)
+
+    def test_worker_pool(self):
+        from suds.client import Client
+
+        client = Client(wsdl.snapshot_url(wsdl.SIGEP_WSDL))
+        assert wsdl.thread_client(client) is client
+
+        def use(_):
+            return threading.current_thread().ident, wsdl.thread_client(client)
+
+        pool = wsdl.worker_pool(2)
+        try:
+            results = pool.map(use, range(20), chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+        clones = dict(results)
+        for ident, clone in results:
+            assert clone is clones[ident]
+            assert clone is not client
+            assert clone.wsdl is client.wsdl
+
+    def test_clone_bindings(self):
+        from suds.client import Client
+
+        def method(client, name):
+            port = client.service.__wrapped__.resolve(name).__wrapped__
+            return port.resolve(name, strict=False).__wrapped__.method
+
+        client = Client(wsdl.snapshot_url(wsdl.SIGEP_WSDL))
+        clone = wsdl.clone_client(client)
+        assert clone.wsdl is client.wsdl
+
+        # o binding guarda o estado da montagem da mensagem e não pode ser compartilhado entre threads
+        original, own = method(client, 'solicitaEtiquetas'), method(clone, 'solicitaEtiquetas')
+        assert own is not original
+        assert own.binding.input is not original.binding.input
+        assert own.binding.input.schema is original.binding.input.schema
+        assert method(clone, 'solicitaEtiquetas') is own
+        assert method(wsdl.clone_client(clone), 'solicitaEtiquetas').binding.input is not own.binding.input